@@ -4,302 +4,506 @@
 
 # BLE, 비동기 프로그래밍 관련
 import asyncio
-from bleak import BleakClient, BleakScanner
+from bleak import BleakClient
 # 데이터 처리
-import struct
-from collections import defaultdict
+import time
+from functools import partial
+from collections import OrderedDict
 import numpy as np
-import pickle 
-# 머신러닝 추론
-from sklearn.svm import SVC
-from sklearn.preprocessing import StandardScaler
-import tensorflow as tf
+# gateway 디렉토리의 공용 모듈 사용
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gateway"))
+from imustream import IMUIngest, decode
+from aligner import FrameAligner
+from clocksync import GridAligner
+from window import SlidingWindow
+from features import make_features
+from motion import MotionGate
+from ratecontrol import RateController
+from models import ModelRegistry, EXERCISES
+from inference import InferenceWorker, MicroBatcher, run_svm, run_lstm
+# BLE 연결 관련. (UUID_NOTIFY : 센서->게이트웨이, UUID_WRITE : 게이트웨이->센서)
+from bleconn import UUID_NOTIFY, UUID_WRITE, setup_sensors, send_all, command, disconnect_all, print_reports
+from scanner import PresenceScanner
+from broadcast import Broadcaster
+from devices import DeviceRegistry
+from metrics import REGISTRY, StreamMeter, ModelMeter, lock_wait
 
 # -------- 변수들 ----------#
 
-# 전역 상태변수
-ble_status = "ready"      # ready(일반), wait(기다림), on(실행 중), disconnected(뭐가 연결 해제됨)
-predict_result = "none"   # 추론 결과를 여기에다 기록
+# 센서 목록. 파일이 바뀌면 다시 읽음 (/devices, 세션 생성 시 확인)
+devices = DeviceRegistry(os.path.join(os.path.dirname(os.path.abspath(__file__)), "devices.txt"))
 
-# BLE 서비스 characteristic uuid
-UUID_NOTIFY = "cafe0003-87a1-aade-bab0-c0ffeef3ae45"  # 센서->게이트웨이
-UUID_WRITE = "cafe0002-87a1-aade-bab0-c0ffeef3ae45"   # 게이트웨이->센서
+# 백그라운드 검색. 센서별 마지막으로 보인 시각, RSSI 기록 (서버 시작 시 켜짐)
+presence = PresenceScanner()
+scan_max_wait = 2.0     # 새로 검색할 때 최대 대기 시간(초)
 
-# 같은 시간의 데이터를 한 행에 묶기 위한 변수들
-frames = []                                 # 전체 데이터, 이후에 CSV파일로 저장. list(list) 형태
-frames_temp = defaultdict(lambda:[])        # 임시로, 각 timestamp 별 센싱 데이터를 저장할 공간. 가득 차면 정렬하여 frames에 붙인다.
-curr_frame_dev_num = defaultdict(lambda:0)  # frames_temp에서 timestamp 마다 센싱 데이터가 몇 개 쌓였는지 체크
-max_frame_dev_num = 0                       # frames_temp의 timestamp마다 최대 몇 개의 데이터가 쌓일 수 있는지. 즉 데이터를 얻고 있는 총 센서 수를 뜻함.
-sequence = np.array([])                     # 한 sequence(200개 frame)을 담기위한 변수
-
-# Critical Section lock
-lock = asyncio.Lock()
+# svm micro-batch 크기. (svm_batch_size = 1 이면 frame마다 바로 추론)
+svm_batch_size = 8      # 최대 몇 frame씩?
+svm_batch_ms = 100      # 최대 몇 ms 기다릴지?
 
 # 머신러닝 모델
-modelstyle = "none"
-model = None
-scaler = None
+registry = ModelRegistry("./model")  # 운동자세별 모델 보관소. 한 번 불러온 모델은 다음 요청(세션)에서 재사용
+
+predict_stride_ms = 1000  # lstm 추론 주기. 10초 sequence를 이 주기마다 밀면서 추론
+
+# 센서 시계 보정. True면 센서별 drift를 추정해서 공통 시간 격자에서 보간한 frame을 만들고,
+# 센서끼리 시계가 많이 어긋나면 timestamp를 다시 초기화함. False면 같은 timestamp끼리만 묶음
+clock_sync = True
+
+# 움직임이 없는 동안(자세 유지) 추론을 건너뛰고 마지막 결과를 다시 사용. 기준은 gateway/motion.py의 MOTION_DPS
+# 결과가 바뀔 수 있으므로 기본은 꺼져 있음. 기록된 세션으로 확인(python gateway/motion.py)한 뒤 True로
+motion_gate = False
+
+# 센서별 sampling rate 조절. 움직이지 않는 센서는 느린 주기로 내리고, 움직이면 모델의 주기로 올림 (clock_sync가 필요)
+# 모델은 고정 주기 데이터로 학습되었으므로 기본은 꺼져 있음 (느린 센서의 값은 보간됨)
+rate_control = False
 
-# 센싱 속도 조절
-timestep_num = 200  # 한 sequence에 몇개?(10초)
-sampling_ms = 50   # 몇 ms 주기로 sampling?
+# 동시에 진행할 수 있는 세션 수. (bench.py --sessions 로 측정한 결과를 보고 장비에 맞게 조절)
+max_sessions = 4
+keep_finished = 16      # 결과 확인용으로 보관할 끝난 세션 수
 
 
 # -------- 함수들 ----------#
 
 # BLE 센서 스캔
-async def scan_device(dev_list : list):
+# 백그라운드 검색 중이면 기록만 보고 바로 답함. (refresh=True면 새로 검색)
+# 새로 검색할 때는 모든 센서가 보이면 scan_max_wait초를 기다리지 않고 바로 끝냄
+# 진행 중인 세션이 있으면 새로 검색하지 않고 기록으로만 답함 (notify를 받는 adapter에서 검색하면 수신이 끊길 수 있음)
+async def scan_device(dev_list : list, refresh : bool = False):
+    if (presence.running and not refresh) or sessions.active():
+        return presence.online(dev_list)
     print("센서 검색 중..")
-    scanner = BleakScanner()
-
-    # 장치 online여부 기록할 리스트
-    dev_online = dict.fromkeys(dev_list,False)
-
-    # 2초간 검색 시작
-    await scanner.start()
-    await asyncio.sleep(2.0)
-    await scanner.stop()
-    
-    # 검색된 장치 가져오기
-    devices = scanner.discovered_devices
-
-    for d in devices:
-        if d.address in dev_list:
-            dev_online[d.address] = True
-    
-    return list(dev_online.values())
-    
-
-# 같은 시간의 데이터를 한 행에 묶기 위한 작업.
-async def make_frame(data):
-    # 장치 이름, 데이터 시간, 데이터로 분리
-    devname = data[0].decode()
-    devtime = data[1]
-    devdata = data[2:]
-
-    # 장치 이름과 데이터를 합치기
-    temp = [devname]
-    temp.extend(devdata)
-
-    global frames
-    global modelstyle
-    global model
-    global scaler
-    global sequence
-    global predict_result
-    global timestep_num
-
-
-    # Critical section lock
-    await lock.acquire()
-    try:
-        frames_temp[devtime].append(temp)           # frames_temp 딕셔너리의 timestamp 위치에 장치 이름과 데이터 추가.
-        curr_frame_dev_num[devtime] += 1            # 그리고 해당 timestamp의 센싱 데이터 수 1 증가
-
-        if curr_frame_dev_num[devtime] == max_frame_dev_num: # 그러다 이 timestamp에서 모든 장치의 센싱이 완료되면
-            # 이제 하나의 frame으로 구성해 frames에 append.
-            frame = [devtime]                       # 먼저 가장 앞에 시간 데이터 추가
-            for i in sorted(frames_temp[devtime], key=lambda x:x[0]): # 장치 이름순으로 정렬
-                frame.extend(i[1:])                 # 장치 이름은 뗌
-            
-            # 최종적으로 frames에 추가
-            frames.append(frame)
-
-            # 머신러닝 추론 수행
-            if modelstyle == "svm": #svm 사용하는 경우 sklearn 이용
-                inp = np.array(frame[1:])
-                res = model.predict(scaler.transform(inp.reshape(1,-1)))
-                resstr = "True" if res[0]==1 else "False"
-                print("{:.2f}s|".format(devtime/1000), resstr) #시간 데이터
-                predict_result = resstr
-
-            elif modelstyle == "lstm":
-                inp = np.array(frame[1:])
-                sequence = np.append(sequence, inp)
-                if len(sequence) == len(inp) * timestep_num: # 한 sequence에 (200개의) 프레임이 다 모였다면...
-                    print("{:.2f}s|".format(devtime/1000))                  
-                    std = scaler.transform(sequence.reshape(-1,len(inp)))
-                    res = model.predict(std.reshape(-1,timestep_num,len(inp)))
-                    print(res)
-                    resstr = "True" if res.argmax(axis=-1) == 1 else "False"
-                    predict_result = resstr
-
-
-                    sequence = np.array([]) # sequence 다시 비우기
-                
-
-            pass
-            
-    finally:
-        # lock 해제
-        lock.release()
-
-# 센서로부터 값을 notify받을 때 발생하는 callback
-async def when_notified(sender, data):
-
-    # 수신된 값을 풀어해침.(c : char, i : int, 6f : float*6)
-    imudata = struct.unpack('ci6f',data)
-
-    # 서버 단에서 값을 보고 싶다면 주석 해제하기
-    #print("\tName={}|Time={}|".format(imudata[0].decode(),imudata[1]));#,imudata[2:])
-
-    # 수신된 값을 가지고 frame생성. (모든 센서 값이 한 행으로 이루어진 데이터)
-    await make_frame(imudata)
-
-# 센서와 연결 해제시 발생하는 callback
-def on_disconnect(client: BleakClient):
-    print("\t연결 해제됨:\tAddress={}".format(client.address))
-    # 만약 값을 가져올 수 있는 상태에서 연결 해제가 발생한 경우
-    # 무언가 연결 해제되었음을 알림
-    global ble_status
-    if ble_status == "on":
-        ble_status = "disconnected"
-
-# 센서에게 특정 메시지를 송신
-async def write_message(client : BleakClient, time, message):
-    print("\t메시지 전송!:","Address=",client.address)
-    await client.write_gatt_char(UUID_WRITE, message) # 송신
-
-# IMU 데이터 수집
-async def get_IMU(dev_addrs : list, gettime : int, position : str):
-
-    # 상태를 wait로--값을 받을 수 있을 때까지 대기 유도
-    global ble_status
-    ble_status = "wait"
-
-    # 먼저 모델 불러오기
-    global model
-    global modelstyle
-    global scaler
-    model = None
-    scaler = None
-    modelstyle = "none"
-
-    # 모델마다 필요한 sampling rate
-    global sampling_ms
-    global timestep_num
-    sampling_ms = 50    #기본값
-    timestep_num = 200
-
-    # 운동자세마다 모델 경로, 파라미터 설정
-    if position == "neck":
-        modelstyle = "svm"
-        modelpath = "./model/neck_2_m.pkl"
-        scalerpath = "./model/neck_2_s.pkl"
-    elif position == "shoulder":
-        modelstyle = "lstm"
-        modelpath = "./model/shoulder_m.h5"
-        scalerpath = "./model/shoulder_s.pkl"
-        sampling_ms = 100
-        timestep_num = 100
-    elif position == "hamstring":
-        modelstyle = "lstm"
-        modelpath = "./model/hamstringl_m.h5"
-        scalerpath = "./model/hamstringl_s.pkl"
-        sampling_ms = 100
-        timestep_num = 100
-    elif position == "bridge":
-        modelstyle = "svm"
-        modelpath = "./model/bridge_m.pkl"
-        scalerpath = "./model/bridge_s.pkl"
-    else:
-        pass
-
-    # sequence의 timestep개수와 sampling 주기 안 맞을 경우 Assert
-    assert sampling_ms * timestep_num == 10000
-
-    # 불러오기
-    try:
-        if modelstyle == "svm":
-            file = open(modelpath, 'rb')
-            model = pickle.load(file)
-            file.close()
-        elif modelstyle == "lstm":
-            model = tf.keras.Sequential([
-                tf.keras.layers.LSTM(units = 50, return_sequences = True, input_shape = (100,18)),
-                tf.keras.layers.LSTM(units = 50),
-                tf.keras.layers.Dropout(0.1),
-                tf.keras.layers.Dense(50, activation = 'relu'),
-                tf.keras.layers.Dense(2, activation = 'softmax')
-            ])
-
-            model.load_weights(modelpath)
-            #model = tf.keras.models.load_model(modelpath)
+    return await presence.scan(dev_list, scan_max_wait)
+
+
+# -------- 세션 ----------#
+
+# 추론 세션 하나. (환자 한 명 / 센서 묶음 하나)
+# 센서, 모델, 버퍼, 결과 상태를 세션마다 따로 가지므로 여러 세션이 한 event loop에서 동시에 진행될 수 있음
+class Session:
+    # entry : model, scaler, style을 가진 모델 (ModelRegistry.get의 결과)
+    def __init__(self, session_id : str, dev_addrs : list, dev_names : list, gettime : int, position : str, entry,
+                 sampling_ms : int, timestep_num : int, features=None):
+        self.id = session_id
+        self.dev_addrs = dev_addrs
+        self.names = dict(zip(dev_addrs, dev_names))   # [주소] = 이름
+        self.gettime = gettime
+        self.position = position
+
+        # 상태변수
+        self.status = "wait"        # wait(기다림), on(실행 중), disconnected(뭐가 연결 해제됨), ready(끝남)
+        self.predict_result = "none"    # 추론 결과를 여기에다 기록
+        self.setup_reports = []     # 센서별 연결 준비 결과 (연결 시간, 재시도 횟수, 실패 원인)
+        self.error = None
+        self.started = asyncio.Event()  # wait 상태가 끝났는지
+        self.cancelled = False      # 취소 요청으로 끝났는지
+        self.task = None            # 백그라운드에서 실행 중인 task (SessionManager.start)
+        self.created_at = time.time()
+        self.started_at = None      # 측정 시작 시각 (on)
+        self.synced = None          # 센서 timestamp 0에 해당하는 시각 (perf_counter, 지연 계산용)
+        self.finished_at = None
+        self.results = {"True" : 0, "False" : 0}    # 추론 결과별 횟수
+
+        # 추론 결과/상태 변화를 구독자(/predict_stream)에게 바로 보냄
+        self.broadcaster = Broadcaster()
+        self.emitted = OrderedDict()    # [frame 시간] = frame 완성 시각. 추론 지연 계산용 (최근 것만 보관)
+
+        # 머신러닝 모델
+        self.model = entry.model
+        self.scaler = entry.scaler
+        self.modelstyle = entry.style
+        self.sampling_ms = sampling_ms
+        self.timestep_num = timestep_num
+
+        # 같은 시간의 데이터를 한 행에 묶기 위한 변수들
+        # 추론이 끊기지 않도록 늦은 센서 값은 마지막 값으로 채워서 내보냄
+        if clock_sync:
+            self.aligner = GridAligner(len(dev_names), sampling_ms, emit_partial=True, on_resync=self.resync)
         else:
-            raise Exception("model style err")
-        file = open(scalerpath, 'rb')
-        scaler = pickle.load(file)
-        file.close()
-    except Exception as e:
-        print("모델 파일을 불러오는 과정에서 문제 발생")
-        raise e
-    
-    # 센싱 데이터 관리용 변수 초기화
-    global frames
-    global max_frame_dev_num
-    global frames_temp
-    global curr_frame_dev_num
-    global sequence
-    frames = []                                 # 전체 데이터 초기화
-    frames_temp = defaultdict(lambda:[])        # 임시 데이터도 초기화.
-    max_frame_dev_num = len(dev_addrs)            # 한 frame 당 최대 센서 개수 지정
-    curr_frame_dev_num = defaultdict(lambda:0)  # 현재 timestamp 에서 센싱 완료한 센서 개수 초기화
-    sequence = np.array([])
-    
-
-    print("센서와 연결 시작")
-    
-    # BleakClient 보관 리스트
-    clients = list()   
-    # 장치마다 client 클래스 생성
-    for addr in dev_addrs:
-        clients.append(BleakClient(addr, disconnected_callback=on_disconnect))
-    
-    try:
-        # 장치 차례로 연결 시도
-        for client in clients:
-            await client.connect()
-            print("\t센서 연결됨:\tAddress={}".format(client.address))
-            await client.start_notify(UUID_NOTIFY,when_notified)
-        
-        # 모든 장치의 센싱 속도를 조절(기존 20Hz)
-        print("모든 센서의 sampling rate 초기화")
-        task = []
-        for client in clients:
-            task.append(asyncio.create_task(write_message(client, 1, struct.pack("hh",2,sampling_ms))))
-        await asyncio.wait(task)
-
-        # 모든 장치의 timestamp를 동시에 초기화
-        print("모든 센서의 timestamp 초기화")
-        task = []
-        for client in clients:
-            task.append(asyncio.create_task(write_message(client, 1, struct.pack("hh",1,0))))
-        await asyncio.wait(task)
-        # 이를 통해 리스트에 등록된 모든 task가 동시에 수행된다.
-
-        # 여기서부터 측정 시작됨
-
-        # 값 가져올수 있음
-        ble_status = "on"
-
-        # 정해진 시간만큼 측정을 위해 sleep
-        await asyncio.sleep(gettime)
-        
-        # 시간 경과
-        print("시간 경과")
-
-        # stop notify
-        for client in clients:    
-            await client.stop_notify(UUID_NOTIFY)
-
-        pass
-
-    except Exception as e:
-        print("센서 연결 과정에서 문제 발생")
-        raise e
-
-    finally:
-        print('모든 센서 연결 해제')
-        for client in clients:
-            await client.disconnect()
-        ble_status = "ready"
+            self.aligner = FrameAligner(len(dev_names), sampling_ms, emit_partial=True)
+        self.sequence = SlidingWindow(timestep_num, 6*len(dev_names), predict_stride_ms // sampling_ms)
+        self.features = features    # svm window 특징 (RollingFeatures). None이면 frame마다 추론
+        self.ingest = IMUIngest(dev_names)      # 센서별 수신 ring buffer
+        self.lock = asyncio.Lock()
+
+        # 계측 (/metrics)
+        self.meter = StreamMeter(self.ingest.names, sampling_ms)
+        self.model_meter = ModelMeter(position)
+
+        # 움직임 감지 (None이면 항상 추론)
+        self.gate = MotionGate(6*len(dev_names), sampling_ms, meter=self.model_meter) if motion_gate else None
+        # 센서별 sampling rate 조절 (None이면 처음 주기 그대로)
+        self.rate = RateController(self.ingest.names, sampling_ms, aligner=self.aligner, meter=self.meter) \
+                    if clock_sync and rate_control else None
+
+        # 추론 전용 thread와 svm micro-batch (open에서 만듬)
+        self.worker = None
+        self.batcher = None
+
+        self.clients = []           # 연결된 센서들 (재동기화 명령 전송용)
+        self.resync_task = None
+
+    # 상태 변경. 구독자에게 알리고, 끝난 경우(ready) 발행 종료
+    def set_status(self, status : str):
+        self.status = status
+        if status != "wait":
+            self.started.set()
+        if status == "on":
+            self.started_at = time.time()
+            self.synced = time.perf_counter()
+        elif status == "ready":
+            self.finished_at = time.time()
+        self.broadcaster.publish({"type"    : "status",
+                                  "session" : self.id,
+                                  "status"  : status,
+                                  "error"   : self.error,
+                                  "cancelled" : self.cancelled})
+        if status == "ready":
+            self.broadcaster.close()
+
+    # 추론 결과 기록 + 구독자에게 발행
+    # reused : 움직임이 없어 추론하지 않고 마지막 결과를 다시 쓴 경우 (지연 통계에 넣지 않음)
+    def publish_result(self, devtime, resstr : str, reused : bool = False):
+        devtime = int(devtime)
+        created = self.emitted.pop(devtime, None)
+        self.predict_result = resstr
+        self.results[resstr] += 1
+        if reused:
+            created = None
+        elif self.gate is not None:
+            self.gate.result(devtime, resstr)
+        now = time.perf_counter()
+        if created is not None:
+            self.model_meter.frame_latency.observe(now - created)
+        if self.synced is not None and not reused:
+            self.model_meter.sensor_latency.observe(max(0.0, now - self.synced - devtime / 1000))
+        self.broadcaster.publish({"type"       : "predict",
+                                  "session"    : self.id,
+                                  "devtime"    : devtime,
+                                  "result"     : resstr,
+                                  "latency_ms" : None if created is None else (now - created) * 1000,
+                                  "reused"     : reused})
+
+    # 추론 thread 시작
+    def open(self):
+        self.worker = InferenceWorker(meter=self.model_meter)
+        self.batcher = MicroBatcher(self.worker, run_svm, (self.model, self.scaler), self.on_batch_result,
+                                    svm_batch_size, svm_batch_ms)
+        self.worker.start()
+
+    # 추론 thread 정지. 세션이 끝나면 모델은 더 이상 참조하지 않음 (registry에만 남음)
+    # thread가 남은 작업을 끝낼 때까지 기다리므로 event loop를 막지 않도록 별도 thread에서
+    async def close(self):
+        if self.worker is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.worker.stop)
+        self.model = None
+        self.scaler = None
+        self.batcher = None
+
+    # 세션 상태 (진행 중에도 확인 가능)
+    def info(self):
+        now = self.finished_at or time.time()
+        return {"session"        : self.id,
+                "position"       : self.position,
+                "status"         : self.status,
+                "dev_addrs"      : self.dev_addrs,
+                "gettime"        : self.gettime,
+                "elapsed_s"      : None if self.started_at is None else now - self.started_at,
+                "predict_result" : self.predict_result,
+                "cancelled"      : self.cancelled,
+                "error"          : self.error}
+
+    # 세션 요약 (연결 결과, frame/추론 통계, 추론 결과별 횟수)
+    def summary(self):
+        summary = self.info()
+        summary.update({"setup"     : self.setup_reports,
+                        "frames"    : {"completed" : self.aligner.completed, "partial" : self.aligner.partial,
+                                       "evicted" : self.aligner.evicted, "late" : self.aligner.late},
+                        "inference" : None if self.worker is None else
+                                      {"submitted" : self.worker.submitted, "done" : self.worker.done,
+                                       "dropped" : self.worker.dropped, "stale" : self.worker.stale,
+                                       "errors" : self.worker.errors,
+                                       "max_latency_ms" : self.worker.max_latency * 1000},
+                        "results"   : self.results,
+                        "motion"    : None if self.gate is None else self.gate.summary(),
+                        "rate"      : None if self.rate is None else self.rate.summary()})
+        if clock_sync:
+            summary["clock"] = self.aligner.clock_report()
+            summary["loss"] = dict(zip(self.ingest.names, self.aligner.loss_report()))
+        return summary
+
+    # 센서끼리 시계가 많이 어긋남 -> 모든 센서의 timestamp를 다시 초기화 (aligner에서 호출)
+    def resync(self):
+        if self.status != "on" or (self.resync_task is not None and not self.resync_task.done()):
+            return
+        print("[{}] 센서 시계 재동기화".format(self.id))
+        self.resync_task = asyncio.get_running_loop().create_task(send_all(self.clients, command(1)))
+
+    # 같은 시간의 데이터를 한 행에 묶기 위한 작업.
+    # col : 센서의 열 번호, pos : 해당 센서 ring buffer에서의 위치
+    async def make_frame(self, col, pos):
+        ring = self.ingest.rings[col]
+        devtime = int(ring.time[pos])
+        self.meter.packet(col, devtime)
+        start = time.perf_counter()
+        async with self.lock:
+            lock_wait.observe(time.perf_counter() - start)
+            # aligner에 센서 값을 넣고, 이번에 끝난 frame들을 받아옴
+            # 열 번호가 이미 이름순이므로 정렬할 필요 없음
+            for frametime, inp in self.aligner.push(col, devtime, ring.data[pos]):
+                # 머신러닝 추론 수행
+                self.predict_frame(frametime, inp)
+            self.meter.frames(self.aligner)
+
+    # 완성된 frame 하나로 추론 요청. 추론은 추론 thread에서 수행되고 결과는 on_result로 돌아옴
+    def predict_frame(self, devtime, inp):
+        # 추론 지연 계산용 frame 완성 시각 (버려진 추론 작업의 기록이 쌓이지 않도록 최근 것만)
+        self.emitted[devtime] = time.perf_counter()
+        if len(self.emitted) > 1024:
+            self.emitted.popitem(last=False)
+
+        if self.gate is not None:
+            self.gate.push(inp)
+        if self.rate is not None:
+            self.rate.push(inp)
+
+        if self.modelstyle == "svm" and self.features is not None:
+            # window 특징을 frame마다 갱신하고, decision 주기마다 추론
+            self.features.push(inp)
+            if self.features.ready() and self.allow(devtime):
+                self.batcher.add(devtime, self.features.vector())
+
+        elif self.modelstyle == "svm": # 몇 frame씩 모아서 추론
+            if self.allow(devtime):
+                self.batcher.add(devtime, inp)
+
+        elif self.modelstyle == "lstm":
+            self.sequence.push(inp)
+            if self.sequence.ready() and self.allow(devtime): # 최근 timestep_num개의 프레임으로 stride마다 추론
+                # 버퍼는 계속 바뀌므로 추론할 sequence는 복사해서 넘김
+                self.worker.submit(run_lstm, (self.model, self.scaler, self.sequence.view().copy()),
+                                   partial(self.on_result, devtime))
+
+    # 추론 시점에서 실제로 추론할지. 움직임이 없으면 추론하지 않고 마지막 결과를 이 시점의 결과로 다시 기록
+    def allow(self, devtime) -> bool:
+        if self.gate is None or self.gate.allow(devtime):
+            return True
+        print("[{}] {:.2f}s|".format(self.id, devtime/1000), self.gate.last, "(유지)")
+        self.publish_result(devtime, self.gate.last, reused=True)
+        return False
+
+    # lstm 추론 결과 기록 (event loop에서 실행)
+    def on_result(self, devtime, res):
+        resstr = "True" if res.argmax(axis=-1)[0]==1 else "False"
+        print("[{}] {:.2f}s|".format(self.id, devtime/1000), resstr) #시간 데이터
+        self.publish_result(devtime, resstr)
+
+    # svm micro-batch 추론 결과 기록. frame 순서대로 (event loop에서 실행)
+    def on_batch_result(self, devtimes, res):
+        for devtime, r in zip(devtimes, res):
+            resstr = "True" if r==1 else "False"
+            print("[{}] {:.2f}s|".format(self.id, devtime/1000), resstr) #시간 데이터
+            self.publish_result(devtime, resstr)
+
+    # 센서로부터 값을 notify받을 때 발생하는 callback
+    async def when_notified(self, sender, data):
+        # 수신된 값을 풀지 않고 그대로 센서별 ring buffer에 저장
+        received = self.ingest.push(data)
+        if received is None: # 목록에 없는 센서
+            return
+
+        # 서버 단에서 값을 보고 싶다면 주석 해제하기
+        #print("\tName={}|Time={}|".format(*decode(data)[:2]))
+
+        # 수신된 값을 가지고 frame생성. (모든 센서 값이 한 행으로 이루어진 데이터)
+        await self.make_frame(*received)
+
+    # 센서와 연결 해제시 발생하는 callback
+    def on_disconnect(self, client: BleakClient):
+        print("\t[{}] 연결 해제됨:\tAddress={}".format(self.id, client.address))
+        # 만약 값을 가져올 수 있는 상태에서 연결 해제가 발생한 경우
+        # 무언가 연결 해제되었음을 알림
+        if self.status == "on":
+            self.set_status("disconnected")
+
+    # IMU 데이터 수집 + 추론
+    async def run(self):
+        print("[{}] 센서와 연결 시작".format(self.id))
+
+        # 장치마다 client 클래스 생성
+        clients = [BleakClient(addr, disconnected_callback=self.on_disconnect) for addr in self.dev_addrs]
+        self.clients = clients
+
+        try:
+            self.open()
+
+            # 모든 장치에 동시에 연결 -> sampling rate 설정 -> timestamp 동시 초기화
+            # 센서마다 timeout, 재시도 횟수가 따로 적용됨
+            reports, ok = await setup_sensors(clients, self.when_notified, self.sampling_ms,
+                                              self.aligner.set_origin if clock_sync else None)
+            self.setup_reports = reports
+            print_reports(reports, self.names)
+            if not ok:
+                failed = [self.names[r["address"]] for r in reports if not r["ok"]]
+                raise Exception("연결/설정에 실패한 센서 : " + " ".join(failed))
+
+            # 여기서부터 측정 시작됨. 값 가져올수 있음
+            self.set_status("on")
+            if self.rate is not None:   # 열 순서(이름순)대로
+                by_name = {self.names[client.address] : client for client in clients}
+                self.rate.start([by_name[name] for name in self.ingest.names])
+
+            # 정해진 시간만큼 측정을 위해 sleep
+            await asyncio.sleep(self.gettime)
+
+            # 시간 경과
+            print("[{}] 시간 경과".format(self.id))
+
+            # stop notify
+            if self.rate is not None:
+                self.rate.stop()
+            for client in clients:
+                await client.stop_notify(UUID_NOTIFY)
+
+            # 아직 모이는 중이던 frame, 모아둔 svm batch까지 추론하고 결과를 기다림
+            async with self.lock:
+                for frametime, inp in self.aligner.flush():
+                    self.predict_frame(frametime, inp)
+            self.batcher.flush()
+            await self.worker.drain()
+            print("[{}] {}".format(self.id, self.aligner.summary()))
+            print("[{}] {}".format(self.id, self.worker.summary()))
+            if self.rate is not None:
+                print("[{}] sampling rate 변경:{} 실패:{} 줄어든 패킷:{:.1%}".format(
+                    self.id, self.rate.switches, self.rate.failures, self.rate.summary()["packets_saved"]))
+
+        except asyncio.CancelledError:
+            print("[{}] 취소됨".format(self.id))
+            self.cancelled = True
+            raise
+
+        except Exception as e:
+            print("[{}] 센서 연결 과정에서 문제 발생".format(self.id))
+            self.error = str(e)
+            raise e
+
+        finally:
+            if self.rate is not None:
+                self.rate.stop()
+            await self.close()
+            print("[{}] 모든 센서 연결 해제".format(self.id))
+            await disconnect_all(clients)
+            self.set_status("ready")
+
+
+# 세션 관리. 세션 id로 세션을 찾고, 같은 센서를 두 세션이 동시에 쓰지 않도록 막음
+class SessionManager:
+    def __init__(self):
+        self.sessions = dict()      # [세션 id] = Session. 만든 순서대로
+        self.count = 0              # 지금까지 만든 세션 수 (id 생성용)
+        self.scan_paused = False    # 세션 때문에 백그라운드 검색을 멈췄는지
+
+    # 진행 중인 세션들
+    def active(self):
+        return [session for session in self.sessions.values() if session.status != "ready"]
+
+    # 세션 id로 찾기. id가 없으면 가장 최근 세션 (없으면 None)
+    def get(self, session_id : str = None):
+        if session_id is None:
+            return next(reversed(self.sessions.values()), None)
+        return self.sessions.get(session_id)
+
+    # 세션 만들기. 모델을 불러오고 버퍼를 할당함 (아직 연결하지 않음)
+    async def create(self, dev_addrs : list, gettime : int, position : str, session_id : str = None) -> Session:
+        # 모델 불러오기 (이미 불러온 모델이 있으면 registry에서 바로 가져옴)
+        # 처음 불러오거나 preload가 진행 중이면 오래 걸리므로 별도 thread에서 (그동안 다른 세션의 BLE, SSE가 멈추지 않도록)
+        try:
+            entry = await asyncio.get_running_loop().run_in_executor(None, registry.get, position)
+        except Exception as e:
+            print("모델 파일을 불러오는 과정에서 문제 발생")
+            raise e
+        spec = EXERCISES[position]
+
+        # 기다리는 동안 다른 세션이 시작됐을 수 있으므로 확인은 모델을 불러온 뒤에
+        active = self.active()
+        if len(active) >= max_sessions:
+            raise Exception("동시에 진행할 수 있는 세션 수({})를 넘음".format(max_sessions))
+        busy = set(addr for session in active for addr in session.dev_addrs) & set(dev_addrs)
+        if busy:
+            raise Exception("다른 세션에서 사용 중인 센서 : " + " ".join(sorted(busy)))
+        if session_id is not None and session_id in self.sessions and self.sessions[session_id].status != "ready":
+            raise Exception("이미 진행 중인 세션 : " + session_id)
+
+        devices.refresh()
+        dev_names = [devices.name(addr) for addr in dev_addrs]
+
+        self.count += 1
+        session_id = session_id or str(self.count)
+        self.sessions.pop(session_id, None)
+        session = Session(session_id, dev_addrs, dev_names, gettime, position, entry,
+                          spec.sampling_ms, spec.timestep_num,
+                          make_features(spec, len(dev_names)) if entry.style == "svm" else None)
+        self.sessions[session_id] = session
+        self._prune()
+        return session
+
+    # 세션을 백그라운드 task로 시작하고 바로 리턴
+    def start(self, session : Session):
+        session.task = asyncio.create_task(self._run_task(session))
+
+    async def _run_task(self, session : Session):
+        try:
+            await self.run(session)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:  # 오류는 session.error에 남아 있음
+            print("[{}] 세션 종료 (오류): {}".format(session.id, e))
+
+    # 진행 중인 세션 취소. 센서 연결을 끊고 끝날 때까지 기다림. 취소했는지를 리턴
+    async def cancel(self, session : Session):
+        if session.status == "ready" or session.task is None or session.task.done():
+            return False
+        session.task.cancel()
+        try:
+            await session.task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    # 모든 세션 취소 (서버 종료 시)
+    async def cancel_all(self):
+        await asyncio.gather(*(self.cancel(session) for session in self.active()))
+
+    # 세션 실행 (끝날 때까지 기다림)
+    # 센서와 연결하는 동안에는 백그라운드 검색을 멈추고, 진행 중인 세션이 모두 끝나면 다시 시작
+    async def run(self, session : Session):
+        try:
+            if presence.running:
+                self.scan_paused = True
+                await presence.stop()
+            await session.run()
+        finally:
+            if self.scan_paused and not self.active():
+                self.scan_paused = False
+                try:
+                    await presence.start()
+                except Exception as e:
+                    print("백그라운드 검색 재시작 실패:", e)
+
+    # 오래된 끝난 세션은 삭제
+    def _prune(self):
+        finished = [sid for sid, session in self.sessions.items() if session.status == "ready"]
+        for sid in finished[:max(0, len(finished) - keep_finished)]:
+            del self.sessions[sid]
+
+
+sessions = SessionManager()
+
+# 진행 중인 세션 수 (/metrics)
+sessions_active = REGISTRY.gauge("gateway_sessions_active", "진행 중인 세션 수")
+
+@REGISTRY.collector
+def collect_sessions():
+    sessions_active.set(len(sessions.active()))
@@ -3,18 +3,23 @@
 # uvicorn main:app
 
 # 서버관련 패키지
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 
 # BLE, 비동기
 import asyncio
-from bleak import BleakClient, BleakScanner
+import json
 import blecode as blecode
+from metrics import REGISTRY, LoopMonitor
 
 # 예외 traceback 용도로 사용
 import traceback
 
+stream_keepalive_s = 15    # 스트림에 보낼 것이 없을 때 연결 유지용 메시지 주기(초)
+loop_monitor = LoopMonitor()    # event loop 지연 측정 (/metrics)
+
 # 서버생성, CROS관련 설정
 app = FastAPI()
 origins = [
@@ -34,6 +39,8 @@ class DeviceInfo(BaseModel):
     dev_list : list
     pos : str
     time : int
+    refresh : bool = False  # /scan에서 True면 기록을 쓰지 않고 새로 검색
+    session : str = None    # /predict_start에서 사용할 세션 id (없으면 서버가 만듬)
 
 
 # 예외처리 쉽게하려고 만듬
@@ -52,28 +59,65 @@ def return_message(tag, msg):
 
 
 
+# 서버 시작 시 모든 운동자세의 모델을 백그라운드에서 미리 불러옴
+# (첫 /predict_start 요청에서 모델을 불러오느라 기다리지 않도록)
+@app.on_event("startup")
+async def preload_models():
+    asyncio.get_running_loop().run_in_executor(None, blecode.registry.preload)
+
+# 서버 시작 시 백그라운드 BLE 검색 시작. /scan은 검색 기록만 보고 바로 답함
+# (BLE 어댑터가 없는 경우 등 실패해도 서버는 실행. 이때 /scan은 매번 새로 검색)
+@app.on_event("startup")
+async def start_presence():
+    try:
+        await blecode.presence.start()
+    except Exception as e:
+        print("백그라운드 검색 시작 실패:", e)
+
+# event loop 지연 측정 시작/정지
+@app.on_event("startup")
+async def start_loop_monitor():
+    loop_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    loop_monitor.stop()
+
+# 서버 종료 시 진행 중인 세션 취소 (센서 연결 끊기)
+@app.on_event("shutdown")
+async def cancel_sessions():
+    await blecode.sessions.cancel_all()
+
+@app.on_event("shutdown")
+async def stop_presence():
+    try:
+        await blecode.presence.stop()
+    except Exception:
+        pass
+
+
 # 이제부터 클라이언트 요청 처리하는 파트
 
 # 루트
 @app.get("/")
 async def root():
     return {"type"      : "message",
-            "message"   : "Usage: /devices(get), /scan(post), /predict_start(post), /predict_get(get)"}
+            "message"   : "Usage: /devices(get), /scan(post), /predict_start(post), /predict_get(get), /predict_stream(get), /sessions(get), /sessions/{id}(get), /sessions/{id}/cancel(post), /sessions/{id}/summary(get), /metrics(get)"}
 
 # 장치 정보를 가져옴
+# 메모리에 있는 목록으로 답함 (devices.txt가 바뀐 경우에만 다시 읽음)
+# ETag를 함께 보내고, 클라이언트가 If-None-Match로 같은 값을 보내면 내용 없이 304로 답함
 @app.get("/devices")
-async def devices():
+async def devices(request : Request):
     try:
-        file = open("./devices.txt")
-        devices_list = dict([dev.strip().split() for dev in file])
-        devices_num = len(devices_list)
-        file.close()
+        blecode.devices.refresh()
+        etag = blecode.devices.etag
+        headers = {"ETag" : etag, "Cache-Control" : "no-cache"}
+        tags = [tag.strip().replace("W/", "") for tag in request.headers.get("if-none-match", "").split(",")]
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(blecode.devices.data(), headers=headers)
 
-        return {"type"      : "data",
-                "dev_num"   : devices_num,
-                "dev_names" : list(devices_list.values()),
-                "dev_addrs" : list(devices_list.keys()) }
-            
     except Exception as e:
         return return_error("/devices", e)
     
@@ -82,33 +126,39 @@ async def devices():
 async def scan(item : DeviceInfo):
     #print(item.dev_list)
     try:
-        dev_online = await blecode.scan_device(item.dev_list)
+        dev_online = await blecode.scan_device(item.dev_list, item.refresh)
         return {"type"      :"data",
                 "dev_online": dev_online}
     
     except Exception as e:
         return return_error("/scan", e)
 
-# 추론을 준비하고 실행함
+# 추론 세션을 백그라운드에서 시작하고 세션 id를 바로 리턴함
+# 진행 상황은 /sessions/{id}, /predict_get, /predict_stream으로 확인하고, /sessions/{id}/cancel로 일찍 끝낼 수 있음
+# 세션마다 센서가 겹치지 않으면 여러 세션을 동시에 진행할 수 있음
 @app.post("/predict_start")
 async def predict_start(item : DeviceInfo):
-    # 추론할 준비가 되어있지 않음...(이미 수행 중인 경우) 리턴
-    if blecode.ble_status != "ready":
+    # 세션을 만들 수 없음...(센서가 다른 세션에서 사용 중, 세션 수 초과 등) 리턴
+    try:
+        session = await blecode.sessions.create(item.dev_list, item.time, item.pos, item.session)
+    except Exception as e:
         return {"type"      :"message",
-                "message"   :"아직 사용할 수 없음!"}
+                "message"   :"아직 사용할 수 없음! " + str(e)}
     try:
-        await blecode.get_IMU(item.dev_list, item.time, item.pos)
-        return {"type"      :"complete",
-                "message"   :"자세 추론이 끝났습니다."}
+        blecode.sessions.start(session)
+        return {"type"      :"started",
+                "session"   :session.id,
+                "message"   :"자세 추론을 시작합니다."}
     
     except Exception as e:
         return return_error("/predict_start", e)
 
-# 추론 결과를 얻어옴 
+# 추론 결과를 얻어옴. session이 없으면 가장 최근 세션
 @app.get("/predict_get")
-async def predict_get():
+async def predict_get(session : str = None):
     try:
-        blestatus = blecode.ble_status
+        target = blecode.sessions.get(session)
+        blestatus = target.status if target is not None else "ready"
         print("ble status : ",blestatus)
 
         # ready 인 경우 -- 추론이 시작되지 않아 얻어갈 게 없음
@@ -120,15 +170,91 @@ async def predict_get():
         # on 상태인 경우 -- 추론 결과 리턴
         elif blestatus == "on":
             return {"type"           :"data",
-                    "predict_result" : blecode.predict_result}
+                    "predict_result" : target.predict_result}
         
         # wait 상태의 경우 -- 자세추론이 요청되었으나 준비하는 시간이 필요함
         # 클라이언트단과 타이밍을 맞추기 위해 상태가 변할 때까지 대기
-        while(blecode.ble_status == "wait"):
-            await asyncio.sleep(0.1)
+        await target.started.wait()
         return {"type"      :"complete",
                 "message"   :"wait_end"}
     
     except Exception as e:
         return return_error("/predict_get", e)
 
+# 추론 결과 스트림 (Server-Sent Events)
+# 추론 결과가 나올 때마다 바로 보냄 : {"type":"predict", "devtime":센서 시간(ms), "result":"True"/"False", "latency_ms":추론 지연}
+# 상태가 바뀔 때도 보냄 : {"type":"status", "status":wait/on/disconnected/ready, "error", "cancelled"}. ready이면 스트림 종료
+# 클라이언트마다 큐 크기가 정해져 있어서, 느린 클라이언트는 오래된 결과부터 버려짐
+@app.get("/predict_stream")
+async def predict_stream(session : str = None):
+    target = blecode.sessions.get(session)
+    if target is None:
+        return return_message("/predict_stream","predict_start이 시작되지 않았습니다.")
+    sub = target.broadcaster.subscribe()
+
+    async def events():
+        try:
+            # 먼저 현재 상태
+            yield "data: {}\n\n".format(json.dumps({"type"    : "status",
+                                                     "session" : target.id,
+                                                     "status"  : target.status,
+                                                     "error"   : target.error,
+                                                     "cancelled" : target.cancelled}))
+            while True:
+                try:
+                    event = await sub.get(stream_keepalive_s)
+                except asyncio.TimeoutError:    # 연결 유지용 주석
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield "data: {}\n\n".format(json.dumps(event))
+        finally:
+            target.broadcaster.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control" : "no-cache"})
+
+# 세션 목록 (진행 중인 세션과 최근에 끝난 세션)
+@app.get("/sessions")
+async def sessions():
+    return {"type"      : "data",
+            "sessions"  : [s.info() for s in blecode.sessions.sessions.values()]}
+
+# 세션 하나의 상태
+@app.get("/sessions/{session_id}")
+async def session_status(session_id : str):
+    target = blecode.sessions.sessions.get(session_id)
+    if target is None:
+        return return_message("/sessions","없는 세션입니다: " + session_id)
+    return {"type"      : "data",
+            **target.info()}
+
+# 세션 취소. 센서 연결을 끊고 모델을 놓을 때까지 기다린 뒤 요약을 리턴
+@app.post("/sessions/{session_id}/cancel")
+async def session_cancel(session_id : str):
+    target = blecode.sessions.sessions.get(session_id)
+    if target is None:
+        return return_message("/sessions","없는 세션입니다: " + session_id)
+    try:
+        if not await blecode.sessions.cancel(target):
+            return return_message("/sessions","이미 끝난 세션입니다: " + session_id)
+        return {"type"      : "data",
+                **target.summary()}
+
+    except Exception as e:
+        return return_error("/sessions/cancel", e)
+
+# 세션 요약 (진행 중이면 지금까지의 요약)
+@app.get("/sessions/{session_id}/summary")
+async def session_summary(session_id : str):
+    target = blecode.sessions.sessions.get(session_id)
+    if target is None:
+        return return_message("/sessions","없는 세션입니다: " + session_id)
+    return {"type"      : "data",
+            **target.summary()}
+
+# 계측값 (Prometheus text 형식)
+# 센서별 수신/누락, frame 조립 결과, lock 대기, 추론 지연(모델별), event loop 지연
+@app.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
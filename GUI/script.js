@@ -9,6 +9,7 @@ let dev_now_online = [];       // 현재 online 센서 이름
 
 //let now_predict = false; //현재 predict가 이루어지고 있는지?
 let predict_time = -1          // 측정할 시간
+let session_id = "";           // 현재 자세 추론 세션 id (서버에서 여러 세션을 구분)
 
 /* ----- Functions ----- */
 
@@ -144,23 +145,8 @@ function dev_predict() {
         return dev_names_to_addrs[e];
     })
 
-    // predict_start 호출
-    // 서버측에서 추론 시작함
-    let xhr = new XMLHttpRequest()
-    xhr.onreadystatechange = function () {
-        if (this.readyState == 4 && this.status == 200) {
-            let received = JSON.parse(this.responseText);
-            add_alarm(received.type, received.message)
-        }
-    }
-    let senddata = {
-        dev_list: connect_addrs,
-        pos: position,
-        time: predict_time
-    }
-    xhr.open("POST", "http://localhost:8000/predict_start", true);
-    xhr.setRequestHeader('Content-type', 'application/json');
-    xhr.send(JSON.stringify(senddata));
+    // 이번 자세 추론의 세션 id
+    session_id = Date.now().toString(36) + Math.random().toString(36).slice(2, 6);
 
     // predict_get 호출
     // 서버측에서 추론 준비가 끝나면 wait_end라는 응답을 돌려줌
@@ -182,18 +168,41 @@ function dev_predict() {
             }
         }
     }
-    // predict_start 요청이 predict_get보다 늦어지는 경우가 있어,
-    // predict_get 요청을 약간의 delay후 전송
-    window.setTimeout(function(){
-        xhr2.open("GET", "http://localhost:8000/predict_get", true);
-        xhr2.send();
-    }, 2000)
+
+    // predict_start 호출
+    // 서버측에서 추론 세션을 시작하고 바로 응답함. 세션이 시작된 뒤에 predict_get 요청
+    let xhr = new XMLHttpRequest()
+    xhr.onreadystatechange = function () {
+        if (this.readyState == 4 && this.status == 200) {
+            let received = JSON.parse(this.responseText);
+            if (received.type == "started") {
+                xhr2.open("GET", "http://localhost:8000/predict_get?session=" + session_id, true);
+                xhr2.send();
+            }
+            else {
+                // 세션을 시작할 수 없는 경우..
+                add_alarm(received.type, received.message);
+                document.getElementById("btn_predict").disabled = false;
+            }
+        }
+    }
+    let senddata = {
+        dev_list: connect_addrs,
+        pos: position,
+        time: predict_time,
+        session: session_id
+    }
+    xhr.open("POST", "http://localhost:8000/predict_start", true);
+    xhr.setRequestHeader('Content-type', 'application/json');
+    xhr.send(JSON.stringify(senddata));
 }
 
 // 자세추론 중에 결과 확인하기
+// 서버가 추론 결과를 만들 때마다 스트림(/predict_stream)으로 바로 받음
 function show_predict(position) {
-    let ellapsed = 0;       //시간 경과 확인
     let finalscore = 0;     //점수 기록용
+    let total = 0;          //받은 추론 결과 수 (특정동작)
+    let last_period = -1;   //마지막으로 결과를 표시한 10초 구간 (반복동작)
 
     let result_time = document.getElementById("result_time");
     let result_time_bar = document.getElementById("result_time_graph_bar");
@@ -202,68 +211,70 @@ function show_predict(position) {
     let result_final = document.getElementById("result_final");
     result_final.textContent = "";
 
-    let xhr = new XMLHttpRequest()
-    xhr.onreadystatechange = function () {
-        if (this.readyState == 4 && this.status == 200) {
-            let received = JSON.parse(this.responseText);
-            if (received.type == "data" && ellapsed <= predict_time) {
-                //add_alarm(received.type, received.predict_result)
-                // 흐른 시간을 계산하여 progress bar에 나타냄
-                result_time.textContent = ellapsed.toFixed(1).toString() + "/" + predict_time.toString();
-                result_time_bar.style.width = ((ellapsed % 10 + 0.5) * 10).toString() + "%"
-
-                if (position_model_type["lstm"].includes(position)) { //반복동작
-                    if (ellapsed % 10 == 0) { // 10초가 지날 때마다
-                        //결과 표시
-                        if (received.predict_result == "True") {
-                            result_text.textContent += " ...O";
-                            finalscore += 1;
-                        }
-                        else {
-                            result_text.textContent += " ...X";
-                        }
-                    }
-                }
-                else {  //특정동작
-                    if (received.predict_result == "True") {
+    // 측정이 끝났을 때 결과 표시
+    function finish(error) {
+        source.close();
+        if (error) { //알 수 없는 이유로 정지함
+            add_alarm("exception", error);
+            result_final.textContent = "문제가 발생하여 자세 추론이 올바르게 이루어지지 못함.";
+        }
+        else if (position_model_type["lstm"].includes(position)) {
+            result_final.textContent = "반복동작" + finalscore.toString() + "회 성공!";
+        }
+        else {
+            let svmscore = (total == 0 ? 0 : (finalscore / total) * 100).toFixed(2)
+            result_final.textContent = "총 " + predict_time.toString() + "초 동안에 목표자세 총 " + svmscore.toString() + "%만큼 달성!"
+        }
+        document.getElementById("btn_predict").disabled = false;
+    }
+
+    let source = new EventSource("http://localhost:8000/predict_stream?session=" + session_id);
+    source.onmessage = function (e) {
+        let received = JSON.parse(e.data);
+        if (received.type == "predict") {
+            // 센서 시간을 progress bar에 나타냄
+            let ellapsed = received.devtime / 1000;
+            result_time.textContent = ellapsed.toFixed(1).toString() + "/" + predict_time.toString();
+            result_time_bar.style.width = ((ellapsed % 10 + 0.5) * 10).toString() + "%"
+
+            if (position_model_type["lstm"].includes(position)) { //반복동작
+                let period = Math.floor(ellapsed / 10);
+                if (period > last_period) { // 10초가 지날 때마다
+                    last_period = period;
+                    //결과 표시
+                    if (received.result == "True") {
+                        result_text.textContent += " ...O";
                         finalscore += 1;
-                        result_text.textContent = "목표 도달 O";
                     }
                     else {
-                        result_text.textContent = "목표 도달 X";
+                        result_text.textContent += " ...X";
                     }
                 }
             }
-            else if (ellapsed > predict_time) { //측정 시간 만료로 정지하는경우에 결과 표시
-                window.clearInterval(timer);
-                let resultstr = ""
-                if (position_model_type["lstm"].includes(position)){
-                    resultstr="반복동작" + finalscore.toString() + "회 성공!";
+            else {  //특정동작
+                total += 1;
+                if (received.result == "True") {
+                    finalscore += 1;
+                    result_text.textContent = "목표 도달 O";
                 }
-                else{
-                    let svmscore = (((finalscore/2)/predict_time)*100).toFixed(2)
-                    resultstr="총 " + predict_time.toString() + "초 동안에 목표자세 총 "+ svmscore.toString() +"%만큼 달성!"
+                else {
+                    result_text.textContent = "목표 도달 X";
                 }
-                result_final.textContent = resultstr;
-                document.getElementById("btn_predict").disabled = false;
-                return;
             }
-            else { //알 수 없는 이유로 정지함
-                add_alarm(received.type, received.message)
-                window.clearInterval(timer);
-                result_final.textContent = "문제가 발생하여 자세 추론이 올바르게 이루어지지 못함.";
-                document.getElementById("btn_predict").disabled = false;
-                return;
+        }
+        else if (received.type == "status") {
+            if (received.status == "disconnected") {
+                add_alarm("message", "센서 연결이 끊어졌습니다.");
+            }
+            else if (received.status == "ready") { //측정 시간 만료로 정지하는경우에 결과 표시
+                finish(received.cancelled ? "자세 추론이 취소되었습니다." : received.error);
             }
         }
     }
-
-    //0.5초마다 요청을 보내 추론 결과를 갱신
-    var timer = window.setInterval(function () {
-        xhr.open("GET", "http://localhost:8000/predict_get", true);
-        xhr.send();
-        ellapsed += 0.5;
-    }, 500)
+    // 서버와의 연결이 끊어진 경우
+    source.onerror = function () {
+        finish("서버와의 연결이 끊어졌습니다.");
+    }
 }
 
 
@@ -0,0 +1,138 @@
+# 같은 시간의 데이터를 한 행(frame)에 묶는 코드
+# 진행 중인 timestamp를 고정 크기의 배열(window)에만 보관하므로,
+# notify가 하나 빠지더라도 메모리가 계속 늘어나지 않는다.
+# frame은 항상 timestamp 순서대로 내보낸다. (lstm sequence, 기록 파일의 시간 열이 꼬이지 않도록)
+# 어떤 frame이 완성되면 그보다 오래된 진행 중인 frame들을 먼저 내보내고, 그 뒤에 오는 오래된 값은 늦은 값으로 버린다.
+
+import time
+import numpy as np
+from imustream import AXIS_NUM
+
+WINDOW = 64         # 동시에 진행 중일 수 있는 timestamp 수
+TIMEOUT_MS = 1000   # 이 시간동안 완성되지 않은 frame은 내보냄(evict)
+
+
+class FrameAligner:
+    # sensor_num : 센서 수, sampling_ms : 센서 sampling 주기
+    # emit_partial : 완성되지 않은 frame을 버릴지(False), 센서별 마지막 값으로 채워서 내보낼지(True)
+    def __init__(self, sensor_num : int, sampling_ms : int, window : int = WINDOW,
+                 timeout_ms : int = TIMEOUT_MS, emit_partial : bool = False):
+        self.sensor_num = sensor_num
+        self.sampling_ms = sampling_ms
+        self.window = window
+        self.timeout = timeout_ms / 1000
+        self.emit_partial = emit_partial
+
+        # slot 별 상태. slot = (timestamp / sampling 주기) % window
+        self.times = np.full(window, -1, dtype=np.int64)                            # slot에 들어있는 timestamp (-1 : 비어있음)
+        self.closed = np.full(window, -1, dtype=np.int64)                           # slot에서 마지막으로 끝난 timestamp
+        self.rows = np.zeros((window, sensor_num * AXIS_NUM), dtype=np.float32)     # 모이는 중인 frame
+        self.filled = np.zeros((window, sensor_num), dtype=bool)                    # 어떤 센서의 값이 들어왔는지
+        self.counts = np.zeros(window, dtype=np.int32)                              # 들어온 센서 수
+        self.arrival = np.zeros(window)                                             # 첫 값이 도착한 시각
+
+        self.last = np.zeros(sensor_num * AXIS_NUM, dtype=np.float32)   # 센서별 마지막 값 (partial frame 채우기용)
+        self.newest = -1            # 지금까지 받은 가장 최근 timestamp
+        self.emitted = -1           # 마지막으로 끝난(내보냈거나 버린) frame의 timestamp
+        self.next_check = 0.0       # 다음 timeout 검사 시각
+
+        # 통계
+        self.completed = 0  # 모든 센서 값이 모여 완성된 frame 수
+        self.evicted = 0    # 완성되지 못하고 버려진 frame 수
+        self.partial = 0    # 완성되지 못했지만 채워서 내보낸 frame 수
+        self.late = 0       # 이미 끝난 frame에 늦게 도착한 값의 수
+
+    # 센서 값 하나 추가. 이번에 끝난 frame들의 [(timestamp, 값)] 리스트를 리턴
+    # col : 센서 열 번호, devtime : timestamp, values : 6축 값
+    def push(self, col : int, devtime : int, values, now : float = None):
+        if now is None:
+            now = time.monotonic()
+        out = []
+
+        slot = (devtime // self.sampling_ms) % self.window
+        # 이미 끝났거나, 더 최근 frame이 이미 나갔거나, window 밖으로 밀려난 timestamp
+        if (self.closed[slot] == devtime or self.times[slot] > devtime or devtime <= self.emitted
+                or devtime <= self.newest - self.window * self.sampling_ms):
+            self.late += 1
+            return out
+
+        # 다른(더 오래된) timestamp가 slot을 차지하고 있다면 밀어냄
+        if self.times[slot] != devtime:
+            if self.times[slot] >= 0:
+                self._evict(slot, out)
+            self.times[slot] = devtime
+            self.filled[slot] = False
+            self.counts[slot] = 0
+            self.arrival[slot] = now
+
+        if not self.filled[slot, col]:  # 같은 값이 두 번 오는 경우 무시
+            start = col * AXIS_NUM
+            self.rows[slot, start:start + AXIS_NUM] = values
+            self.last[start:start + AXIS_NUM] = values
+            self.filled[slot, col] = True
+            self.counts[slot] += 1
+            if devtime > self.newest:
+                self.newest = devtime
+
+            # 모든 센서의 값이 모이면 frame 완성
+            if self.counts[slot] == self.sensor_num:
+                self._release_older(devtime, out)
+                self.completed += 1
+                out.append(self._close(slot))
+
+        # 오래 기다린 frame 정리 (너무 자주 검사하지 않도록 timeout의 절반마다)
+        if now >= self.next_check:
+            self.next_check = now + self.timeout / 2
+            self.expire(now, out)
+        return out
+
+    # timeout이 지난 frame들을 시간순으로 내보냄
+    def expire(self, now : float = None, out : list = None):
+        if now is None:
+            now = time.monotonic()
+        if out is None:
+            out = []
+        slots = np.flatnonzero((self.times >= 0) & (now - self.arrival > self.timeout))
+        for slot in slots[np.argsort(self.times[slots])]:
+            self._evict(slot, out)
+        return out
+
+    # 측정 종료 시 남은 frame들 모두 내보냄
+    def flush(self):
+        out = []
+        slots = np.flatnonzero(self.times >= 0)
+        for slot in slots[np.argsort(self.times[slots])]:
+            self._evict(slot, out)
+        return out
+
+    # 통계 문자열
+    def summary(self):
+        return "frame 완성:{} 채움:{} 버림:{} 늦은 값:{}".format(
+            self.completed, self.partial, self.evicted, self.late)
+
+    # devtime보다 오래된 진행 중인 frame들을 시간순으로 먼저 처리
+    def _release_older(self, devtime, out):
+        slots = np.flatnonzero((self.times >= 0) & (self.times < devtime))
+        for slot in slots[np.argsort(self.times[slots])]:
+            self._evict(slot, out)
+
+    # 완성되지 않은 frame 처리
+    def _evict(self, slot, out):
+        self._release_older(self.times[slot], out)
+        if self.emit_partial:
+            # 빠진 센서는 마지막으로 받은 값으로 채움
+            missing = np.repeat(~self.filled[slot], AXIS_NUM)
+            self.rows[slot, missing] = self.last[missing]
+            self.partial += 1
+            out.append(self._close(slot))
+        else:
+            self.evicted += 1
+            self._close(slot)
+
+    # slot을 비우고 (timestamp, 값)을 리턴
+    def _close(self, slot):
+        devtime = int(self.times[slot])
+        self.closed[slot] = devtime
+        self.times[slot] = -1
+        self.emitted = max(self.emitted, devtime)
+        return devtime, self.rows[slot].copy()
@@ -0,0 +1,384 @@
+# 게이트웨이 처리 과정 벤치마크
+# 가짜 센서 패킷('ci6f')을 만들어 실제 코드(blemaster.when_notified -> make_frame -> predict_frame)에 넣고
+# 센서 수, sampling 속도, 모델 종류(svm/lstm)를 바꿔가며 아래 값들을 측정한다.
+#   - 처리량 : 정해진 속도로 보냈을 때 처리한 패킷/s, 최대한 빨리 보냈을 때 처리할 수 있는 패킷/s
+#   - frame 조립 지연 : 패킷이 도착(callback 예약)한 뒤 make_frame이 끝날 때까지
+#   - 추론 지연 : frame이 완성된 뒤 추론 결과 callback이 실행될 때까지 (micro-batch 대기 포함)
+#   - event loop 지연 : 일정 주기로 깨어나는 task가 늦게 깨어난 정도
+#   - 최대 메모리 사용량(RSS)
+# --sessions를 주면 GUI의 세션(blecode.Session) 여러 개를 한 event loop에서 동시에 진행하며 측정하고,
+# 세션 수 x 센서 수의 한계(보낸 만큼 처리하고 패킷 처리 지연 p99가 sampling 주기 안인 최대 세션 수)를 구한다.
+# 결과는 JSON으로 저장해서 변경 전후, Jetson과 PC 사이를 비교할 수 있게 한다.
+# 모델은 기본적으로 센서 수에 맞춘 임의 가중치의 NumPy 모델을 사용한다. (실제 모델과 같은 구조/크기)
+#
+# 실행:
+# python gateway/bench.py                                   (기본 조합 전체, bench_result.json에 저장)
+# python gateway/bench.py --sensors 2 10 --rates 20 100 --models svm --duration 5 --out jetson.json
+# python gateway/bench.py --sessions 1 2 4 8 --sensors 3 --rates 20      (세션 수 한계 측정)
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+from types import SimpleNamespace
+import numpy as np
+
+import blemaster as bm
+from imustream import PACKET, IMUIngest, AXIS_NUM
+from window import SlidingWindow
+from inference import InferenceWorker, MicroBatcher, run_svm
+from npmodels import NumpyScaler, NumpySVC, NumpySequential
+from metrics import StreamMeter
+
+SENSORS = [1, 2, 5, 10]
+RATES = [10, 20, 50, 100]       # Hz
+MODELS = ["svm", "lstm"]
+DURATION_S = 3.0                # 조합 하나의 측정 시간 (정해진 속도로 보내는 구간)
+FLOOD_S = 1.0                   # 최대 처리량 측정에 사용할 데이터 길이(센서 시간 기준, 초)
+LAG_TICK_S = 0.005              # event loop 지연 측정 주기
+SVM_SUPPORT = 1000              # 임의 svm의 support vector 수 (실제 모델 : 264 ~ 1570개)
+
+
+# -------- 임의 모델 ----------#
+
+# 실제 모델과 같은 구조, 임의 가중치
+def synthetic_model(style : str, feature_num : int, seed : int = 0):
+    rng = np.random.default_rng(seed)
+    scaler = NumpyScaler(np.zeros(feature_num), np.ones(feature_num))
+    if style == "svm":
+        model = NumpySVC("rbf", 1.0 / feature_num, 0.0, 3, rng.normal(size=(SVM_SUPPORT, feature_num)),
+                         rng.normal(size=(1, SVM_SUPPORT)), rng.normal(size=1),
+                         np.array([SVM_SUPPORT // 2, SVM_SUPPORT - SVM_SUPPORT // 2]), np.array([0, 1]))
+        return model, scaler
+
+    def lstm(n_in, units, return_sequences):
+        conf = {"activation" : "tanh", "recurrent_activation" : "sigmoid", "return_sequences" : return_sequences}
+        weights = [rng.normal(scale=0.1, size=(n_in, 4 * units)).astype(np.float32),
+                   rng.normal(scale=0.1, size=(units, 4 * units)).astype(np.float32),
+                   np.zeros(4 * units, dtype=np.float32)]
+        return ("lstm", conf, weights)
+
+    def dense(n_in, units, activation):
+        return ("dense", {"activation" : activation},
+                [rng.normal(scale=0.1, size=(n_in, units)).astype(np.float32), np.zeros(units, dtype=np.float32)])
+
+    # models.build_lstm과 같은 구조 (Dropout은 추론 시 없음)
+    layers = [lstm(feature_num, 50, True), lstm(50, 50, False), dense(50, 50, "relu"), dense(50, 2, "softmax")]
+    return NumpySequential(layers, (None, None, feature_num)), scaler
+
+
+# -------- 측정 ----------#
+
+def percentiles(values : list):
+    if not values:
+        return None
+    arr = np.asarray(values) * 1000
+    return {"n"   : len(arr),
+            "p50" : float(np.percentile(arr, 50)),
+            "p95" : float(np.percentile(arr, 95)),
+            "p99" : float(np.percentile(arr, 99)),
+            "max" : float(arr.max())}
+
+# 프로세스 최대 RSS (MB)
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+# 현재 RSS (MB). /proc가 없으면 None
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+# 센서 이름들 (A, B, ... 26개 넘으면 a, b, ...)
+def sensor_names(sensor_num : int):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+    return list(letters[:sensor_num])
+
+# 센서 시간 devtime의 패킷들 (센서마다 하나, 도착 순서는 매번 섞음)
+def make_packets(names : list, devtime : int, values):
+    packets = [bytearray(PACKET.pack(name.encode(), devtime, *values[i, devtime % len(values[i])]))
+               for i, name in enumerate(names)]
+    random.shuffle(packets)
+    return packets
+
+
+# 결과 출력 대신 지연 시간을 기록하도록 predict_frame, on_result, on_batch_result를 교체
+# target : blemaster 모듈 또는 blecode.Session. 원래 predict_frame을 리턴
+def instrument(target, stats : dict):
+    emitted = dict()
+    def on_done(devtime):
+        created = emitted.pop(devtime, None)
+        if created is not None:
+            stats["inference"].append(time.perf_counter() - created)
+
+    predict_frame = target.predict_frame
+    def timed_predict_frame(devtime, inp):
+        emitted[devtime] = time.perf_counter()
+        predict_frame(devtime, inp)
+    target.predict_frame = timed_predict_frame
+    target.on_result = lambda devtime, res: on_done(devtime)
+    target.on_batch_result = lambda devtimes, res: [on_done(int(devtime)) for devtime in devtimes]
+    return predict_frame
+
+
+# lstm 추론이 측정 시간이 10초보다 짧아도 일어나도록 sequence를 미리 채워둠 (첫 frame부터 추론)
+def prefill(sequence, width : int):
+    for _ in range(sequence.size - 1):
+        sequence.push(np.zeros(width, dtype=np.float32))
+
+
+# blemaster의 전역 상태를 벤치마크 조합에 맞게 초기화
+def setup_pipeline(names : list, style : str, sampling_ms : int, model, scaler, stats : dict):
+    sensor_num = len(names)
+    bm.sampling_ms = sampling_ms
+    bm.timestep_num = 10000 // sampling_ms
+    bm.recorder = None
+    bm.ingest = IMUIngest(names)
+    bm.meter = StreamMeter(bm.ingest.names, sampling_ms)
+    bm.synced = None
+    bm.aligner = bm.make_aligner(sensor_num)     # 실제 세션과 같은 aligner (clock_sync면 GridAligner)
+    if bm.clock_sync:
+        bm.aligner.set_origin()
+    bm.sequence = SlidingWindow(bm.timestep_num, AXIS_NUM * sensor_num, max(1, bm.predict_stride_ms // sampling_ms))
+    prefill(bm.sequence, AXIS_NUM * sensor_num)
+    bm.lock = asyncio.Lock()
+    bm.modelstyle = style
+    bm.model = model
+    bm.scaler = scaler
+    bm.do_predict = True
+    bm.notify_feedback = False
+    bm.notify_getdata = True
+
+    predict_frame = instrument(bm, stats)
+    bm.worker = InferenceWorker()
+    bm.worker.start()
+    bm.batcher = MicroBatcher(bm.worker, run_svm, (model, scaler), bm.on_batch_result, bm.svm_batch_size, bm.svm_batch_ms)
+    return predict_frame
+
+
+# GUI 세션(blecode.Session)들을 벤치마크 조합에 맞게 생성
+def setup_sessions(session_num : int, names : list, style : str, sampling_ms : int, model, scaler, stats : dict):
+    blecode = import_blecode()
+    entry = SimpleNamespace(model=model, scaler=scaler, style=style)
+    sessions = []
+    for i in range(session_num):
+        session = blecode.Session(str(i), names, names, 0, style, entry, sampling_ms, 10000 // sampling_ms)
+        prefill(session.sequence, AXIS_NUM * len(names))
+        instrument(session, stats)
+        session.open()
+        session.status = "on"
+        sessions.append(session)
+    return sessions
+
+def import_blecode():
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GUI"))
+    import blecode
+    return blecode
+
+
+# event loop 지연 측정 task
+async def measure_lag(lags : list, stop : asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + LAG_TICK_S
+        await asyncio.sleep(LAG_TICK_S)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+# 정해진 속도로 보내기 (bleak처럼 패킷마다 callback task 생성)
+# feeds : [(센서 이름들, notify callback)]. 모든 feed에 같은 시각에 패킷을 보냄. 걸린 시간을 리턴
+async def send_paced(feeds : list, sampling_ms : int, ticks : int, values, stats : dict):
+    loop = asyncio.get_running_loop()
+    async def deliver(callback, data, arrived):
+        await callback(None, data)
+        stats["assembly"].append(time.perf_counter() - arrived)
+
+    tasks = []
+    start = loop.time()
+    wall = time.perf_counter()
+    for tick in range(ticks):
+        delay = start + tick * sampling_ms / 1000 - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        for names, callback in feeds:
+            for data in make_packets(names, tick * sampling_ms, values):
+                tasks.append(asyncio.create_task(deliver(callback, data, time.perf_counter())))
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - wall
+
+# 남은 frame을 추론하고, 추론 작업이 모두 끝날 때까지 대기 (최대 5초)
+async def drain(targets : list):
+    for target in targets:
+        for devtime, inp in target.aligner.flush():
+            target.predict_frame(devtime, inp)
+        target.batcher.flush()
+    deadline = time.perf_counter() + 5
+    for worker in [target.worker for target in targets]:
+        while worker.done + worker.stale + worker.errors + worker.dropped < worker.submitted \
+                and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)   # 마지막 결과 callback 실행
+    for target in targets:
+        target.worker.stop()
+
+# 측정 결과 정리
+def report(targets : list, stats : dict, lags : list, sensor_num : int, rate : int, style : str, ticks : int, elapsed : float):
+    packets = ticks * sensor_num * len(targets)
+    return {"sensors"       : sensor_num,
+            "rate_hz"       : rate,
+            "model"         : style,
+            "duration_s"    : elapsed,
+            "packets"       : packets,
+            "offered_pps"   : rate * sensor_num * len(targets),
+            "achieved_pps"  : packets / elapsed,
+            "frames"        : sum(target.aligner.completed for target in targets),
+            "evicted"       : sum(target.aligner.evicted for target in targets),
+            "assembly_ms"   : percentiles(stats["assembly"]),
+            "inference_ms"  : percentiles(stats["inference"]),
+            "loop_lag_ms"   : percentiles(lags),
+            "inference"     : {key : sum(getattr(target.worker, key) for target in targets)
+                               for key in ["submitted", "done", "dropped", "stale", "errors"]},
+            "rss_mb"        : rss_mb(),
+            "peak_rss_mb"   : peak_rss_mb()}
+
+
+# 조합 하나 측정 (CLI : blemaster)
+async def bench_one(sensor_num : int, rate : int, style : str, duration : float):
+    names = sensor_names(sensor_num)
+    sampling_ms = 1000 // rate
+    model, scaler = synthetic_model(style, AXIS_NUM * sensor_num)
+    values = np.random.default_rng(1).normal(size=(sensor_num, 256, AXIS_NUM)).astype(np.float32)
+    stats = {"assembly" : [], "inference" : []}
+    ticks = int(duration * rate)
+
+    # 1) 정해진 속도로 보내기
+    predict_frame = setup_pipeline(names, style, sampling_ms, model, scaler, stats)
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_lag(lags, stop))
+    elapsed = await send_paced([(names, bm.when_notified)], sampling_ms, ticks, values, stats)
+    await drain([bm])
+    stop.set()
+    await lag_task
+    res = report([bm], stats, lags, sensor_num, rate, style, ticks, elapsed)
+    bm.predict_frame = predict_frame
+
+    # 2) 최대한 빨리 보내기 (추론 포함, 밀리는 추론 작업은 버려짐)
+    setup_pipeline(names, style, sampling_ms, model, scaler, {"assembly" : [], "inference" : []})
+    packets = [data for tick in range(int(FLOOD_S * rate)) for data in make_packets(names, tick * sampling_ms, values)]
+    flood_start = time.perf_counter()
+    for data in packets:
+        await bm.when_notified(None, data)
+    res["max_pps"] = len(packets) / (time.perf_counter() - flood_start)
+    bm.worker.stop()
+    bm.predict_frame = predict_frame
+    return res
+
+
+# 조합 하나 측정 (GUI : 한 event loop에서 session_num개의 세션이 동시에 진행)
+async def bench_sessions(session_num : int, sensor_num : int, rate : int, style : str, duration : float):
+    names = sensor_names(sensor_num)
+    sampling_ms = 1000 // rate
+    model, scaler = synthetic_model(style, AXIS_NUM * sensor_num)
+    values = np.random.default_rng(1).normal(size=(sensor_num, 256, AXIS_NUM)).astype(np.float32)
+    stats = {"assembly" : [], "inference" : []}
+    ticks = int(duration * rate)
+
+    sessions = setup_sessions(session_num, names, style, sampling_ms, model, scaler, stats)
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_lag(lags, stop))
+    elapsed = await send_paced([(names, session.when_notified) for session in sessions], sampling_ms, ticks, values, stats)
+    await drain(sessions)
+    stop.set()
+    await lag_task
+    res = report(sessions, stats, lags, sensor_num, rate, style, ticks, elapsed)
+    res["sessions"] = session_num
+    return res
+
+
+# 결과가 정상 범위인지. (보낸 만큼 처리했고, 패킷 처리 지연 p99가 sampling 주기 안)
+def healthy(res : dict):
+    return res["achieved_pps"] >= 0.98 * res["offered_pps"] and res["assembly_ms"]["p99"] < 1000 / res["rate_hz"]
+
+# 모델, 속도, 센서 수별로 정상 범위를 유지한 최대 세션 수 (그보다 적은 세션 수도 모두 정상인 경우)
+def session_limits(runs : list):
+    groups = dict()
+    for res in sorted(runs, key=lambda r: r["sessions"]):
+        groups.setdefault((res["model"], res["rate_hz"], res["sensors"]), []).append(res)
+    limits = []
+    for (model, rate, sensors), group in groups.items():
+        num = 0
+        for res in group:
+            if not healthy(res):
+                break
+            num = res["sessions"]
+        limits.append({"model" : model, "rate_hz" : rate, "sensors" : sensors, "max_sessions" : num})
+    return limits
+
+
+def host_info():
+    return {"machine"   : platform.machine(),
+            "platform"  : platform.platform(),
+            "processor" : platform.processor(),
+            "cpu_count" : os.cpu_count(),
+            "python"    : platform.python_version(),
+            "numpy"     : np.__version__}
+
+
+def print_result(res : dict):
+    print("{:4} {}센서 {:2} {:3}Hz | {:7.0f}/{:7.0f} pkt/s{} | 조립 p99 {:6.2f}ms | 추론 p99 {:7.2f}ms | "
+          "loop 지연 p99 {:6.2f}ms | RSS {:.0f}MB".format(
+              res["model"], "세션 {:2} ".format(res["sessions"]) if "sessions" in res else "", res["sensors"], res["rate_hz"],
+              res["achieved_pps"], res["offered_pps"], " (최대 {:7.0f})".format(res["max_pps"]) if "max_pps" in res else "",
+              res["assembly_ms"]["p99"], res["inference_ms"]["p99"] if res["inference_ms"] else float("nan"),
+              res["loop_lag_ms"]["p99"], res["peak_rss_mb"]))
+
+
+def run(sensors : list, rates : list, models : list, duration : float, sessions : list = None):
+    runs = []
+    for style in models:
+        for sensor_num in sensors:
+            for rate in rates:
+                for session_num in sessions or [None]:
+                    if session_num is None:
+                        res = asyncio.run(bench_one(sensor_num, rate, style, duration))
+                    else:
+                        res = asyncio.run(bench_sessions(session_num, sensor_num, rate, style, duration))
+                    runs.append(res)
+                    print_result(res)
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="게이트웨이 처리 과정 벤치마크")
+    parser.add_argument("--sensors", nargs="+", type=int, default=SENSORS)
+    parser.add_argument("--rates", nargs="+", type=int, default=RATES, help="sampling 속도(Hz)")
+    parser.add_argument("--models", nargs="+", choices=MODELS, default=MODELS)
+    parser.add_argument("--sessions", nargs="+", type=int, default=None,
+                        help="GUI 세션 수들. 주면 한 event loop에서 여러 세션을 동시에 진행하며 측정")
+    parser.add_argument("--duration", type=float, default=DURATION_S, help="조합 하나의 측정 시간(초)")
+    parser.add_argument("--out", default="bench_result.json")
+    args = parser.parse_args()
+
+    config = {"sensors" : args.sensors, "rates" : args.rates, "models" : args.models, "sessions" : args.sessions,
+              "duration_s" : args.duration, "svm_batch_size" : bm.svm_batch_size, "svm_batch_ms" : bm.svm_batch_ms,
+              "predict_stride_ms" : bm.predict_stride_ms, "svm_support" : SVM_SUPPORT}
+    runs = run(args.sensors, args.rates, args.models, args.duration, args.sessions)
+    result = {"time" : time.strftime("%Y-%m-%dT%H:%M:%S"), "host" : host_info(), "config" : config, "runs" : runs}
+    if args.sessions:
+        result["session_limits"] = session_limits(runs)
+        for limit in result["session_limits"]:
+            print("{model:4} 센서 {sensors:2} {rate_hz:3}Hz : 최대 {max_sessions} 세션".format(**limit))
+    with open(args.out, "w") as file:
+        json.dump(result, file, indent=2)
+    print("저장됨 :", args.out)
@@ -0,0 +1,132 @@
+# 여러 센서와의 BLE 연결 준비 코드
+# 센서마다 연결, start_notify, 명령 전송을 동시에 수행해서
+# 센서 수가 많아도 연결 시간은 가장 느린 센서 하나의 시간 정도로 끝난다.
+# 센서마다 timeout과 재시도 횟수를 따로 적용하고, 걸린 시간과 실패 여부를 기록한다.
+
+import asyncio
+import struct
+import time
+
+# BLE 서비스 characteristic uuid
+UUID_NOTIFY = "cafe0003-87a1-aade-bab0-c0ffeef3ae45"  # 센서->게이트웨이
+UUID_WRITE = "cafe0002-87a1-aade-bab0-c0ffeef3ae45"   # 게이트웨이->센서
+
+CONNECT_TIMEOUT = 10.0  # 센서 하나의 연결(+start_notify) 제한 시간(초)
+WRITE_TIMEOUT = 3.0     # 명령 하나 전송 제한 시간(초)
+RETRIES = 2             # 연결, 명령 전송 실패 시 재시도 횟수
+RETRY_DELAY = 0.5       # 재시도 전 대기 시간(초). 시도할 때마다 늘어남
+
+
+# 센서에게 보낼 명령 (hh : 16bit 정수 2개)
+# 첫번째 정수 : 명령타입. (1:sync 맞추기(timestamp 초기화), 2:샘플링 속도 조절하기, 3:deep sleep)
+# 두번째 정수 : 값 (sync 맞추는 경우에는 따로 필요 없음)
+def command(cmdtype : int, value : int = 0):
+    return struct.pack("hh", cmdtype, value)
+
+
+# 센서 하나 연결 + notify 시작. 실패하면 재시도
+# 결과 기록(dict) : address, ok, attempts, connect_s, notify_s, error
+async def connect_one(client, callback, timeout : float = CONNECT_TIMEOUT, retries : int = RETRIES):
+    report = {"address"   : client.address,
+              "ok"        : False,
+              "attempts"  : 0,
+              "connect_s" : None,
+              "notify_s"  : None,
+              "error"     : None}
+
+    for attempt in range(1, retries + 2):
+        report["attempts"] = attempt
+        try:
+            start = time.perf_counter()
+            await asyncio.wait_for(client.connect(), timeout)
+            report["connect_s"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            await asyncio.wait_for(client.start_notify(UUID_NOTIFY, callback), timeout)
+            report["notify_s"] = time.perf_counter() - start
+
+            report["ok"] = True
+            report["error"] = None
+            return report
+
+        except Exception as e:
+            report["error"] = "{}: {}".format(type(e).__name__, e)
+            # 연결이 반쯤 된 상태일 수 있으므로 정리 후 재시도
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+            if attempt <= retries:
+                await asyncio.sleep(RETRY_DELAY * attempt)
+
+    return report
+
+
+# 모든 센서 동시에 연결. 센서별 결과 기록 리스트를 리턴 (clients와 같은 순서)
+async def connect_all(clients : list, callback, timeout : float = CONNECT_TIMEOUT, retries : int = RETRIES):
+    return await asyncio.gather(*(connect_one(client, callback, timeout, retries) for client in clients))
+
+
+# 모든 센서에게 같은 명령을 동시에 전송. 실패하면 센서마다 따로 재시도
+# 센서별 (걸린 시간, 오류)를 리턴. (오류는 마지막 시도의 것, 성공하면 None)
+async def send_all(clients : list, message : bytes, timeout : float = WRITE_TIMEOUT, retries : int = RETRIES):
+    async def send(client):
+        start = time.perf_counter()
+        error = None
+        for attempt in range(1, retries + 2):
+            try:
+                await asyncio.wait_for(client.write_gatt_char(UUID_WRITE, message), timeout)
+                return time.perf_counter() - start, None
+            except Exception as e:
+                error = "{}: {}".format(type(e).__name__, e)
+                if attempt <= retries:
+                    await asyncio.sleep(RETRY_DELAY * attempt)
+        return time.perf_counter() - start, error
+    return await asyncio.gather(*(send(client) for client in clients))
+
+
+# 모든 센서 동시에 연결 해제 (오류 무시)
+async def disconnect_all(clients : list):
+    async def disconnect(client):
+        try:
+            await client.disconnect()
+        except Exception:
+            pass
+    await asyncio.gather(*(disconnect(client) for client in clients))
+
+
+# 센서 연결 + sampling rate 설정 + timestamp 초기화
+# before_reset : timestamp 초기화 직전에 호출할 함수 (예: 데이터 수신 시작 flag 설정)
+# 센서별 결과 기록 리스트와, 모두 성공했는지를 리턴
+async def setup_sensors(clients : list, callback, sampling_ms : int, before_reset=None,
+                        timeout : float = CONNECT_TIMEOUT, retries : int = RETRIES):
+    reports = await connect_all(clients, callback, timeout, retries)
+    if not all(report["ok"] for report in reports):
+        return reports, False
+
+    # 모든 장치의 센싱 속도를 조절(기존 20Hz)
+    for report, (elapsed, error) in zip(reports, await send_all(clients, command(2, sampling_ms), retries=retries)):
+        report["rate_s"] = elapsed
+        report["ok"] = error is None
+        report["error"] = error
+    if before_reset is not None:
+        before_reset()
+    # 모든 장치의 timestamp를 동시에 초기화
+    for report, (elapsed, error) in zip(reports, await send_all(clients, command(1), retries=retries)):
+        report["reset_s"] = elapsed
+        report["ok"] = report["ok"] and error is None
+        report["error"] = report["error"] or error
+
+    return reports, all(report["ok"] for report in reports)
+
+
+# 결과 기록 출력. names : [주소] = 이름 (없으면 주소만 출력)
+def print_reports(reports : list, names : dict = None):
+    for report in reports:
+        name = names.get(report["address"], "?") if names else "?"
+        if report["ok"]:
+            print("\t센서 준비됨:Name={}\tAddress={}\t연결 {:.2f}s, notify {:.2f}s, 시도 {}회".format(
+                name, report["address"], report["connect_s"], report["notify_s"], report["attempts"]))
+        else:
+            print("\t센서 준비 실패:Name={}\tAddress={}\t시도 {}회, {}".format(
+                name, report["address"], report["attempts"], report["error"]))
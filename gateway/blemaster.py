@@ -1,45 +1,71 @@
 # BLE, 비동기 프로그래밍 관련
 import asyncio
-from bleak import BleakClient, BleakScanner
+from bleak import BleakClient
 from bleak import exc
 # 데이터 처리 관련
-import pickle
 import struct
 import time
+from functools import partial
 from datetime import datetime
-from collections import defaultdict
-import csv
 import numpy as np
-# 머신러닝 관련
-from sklearn.svm import SVC
-from sklearn.preprocessing import StandardScaler
-import tensorflow as tf
+from imustream import IMUIngest, decode
+from aligner import FrameAligner
+from clocksync import GridAligner
+from window import SlidingWindow
+from features import RollingFeatures, FEATURES_PER_SENSOR
+from motion import MotionGate
+from ratecontrol import RateController
+from models import ModelRegistry, EXERCISES
+from inference import InferenceWorker, MicroBatcher, run_svm, run_lstm
+# BLE 연결 관련. (UUID_NOTIFY : 센서로부터, UUID_WRITE : 센서로)
+from bleconn import UUID_NOTIFY, UUID_WRITE, setup_sensors, send_all, command, disconnect_all, print_reports
+from scanner import PresenceScanner
+from devices import DeviceRegistry
+from recorder import Recorder, export_csv
+from offline import score_many, find_sessions, print_summaries
+from metrics import REGISTRY, StreamMeter, ModelMeter, LoopMonitor, lock_wait
 
 
-# BLE 서비스 characteristic uuid
-UUID_NOTIFY = "cafe0003-87a1-aade-bab0-c0ffeef3ae45"  # 센서로부터
-UUID_WRITE = "cafe0002-87a1-aade-bab0-c0ffeef3ae45"   # 센서로
-
 # notify 관련 상태 변수들.
 notify_feedback = False     # notify callback 발생 시 센싱 값 즉각 확인할때 사용
 notify_getdata = False      # 받고싶지 않은데 센싱값이 오는경우 무시할때 사용
 
 # 센서 목록 변수들
+devices = None                  # 센서 목록 파일. 바뀌면 다시 읽음 (load_devices)
 device_list = dict()            # 모든 센서([주소] = 이름)
 device_name_to_addr = dict()    # [이름] = 주소
 device_num = 0                  # 검색된 장치 수
 device_online = dict()          # 현재 Online인 센서
+presence = PresenceScanner()    # 백그라운드 검색. 센서별 마지막으로 보인 시각, RSSI 기록
+scan_max_wait = 2.0             # 새로 검색할 때 최대 대기 시간(초)
 
 # 같은 시간의 데이터를 한 행에 묶기 위한 변수들
-frames = []                                 # 전체 데이터, 이후에 CSV파일로 저장. list(list) 형태
-frames_temp = defaultdict(lambda:[])        # 임시로, 각 timestamp 별 센싱 데이터를 저장할 공간. 가득 차면 정렬하여 frames에 붙인다.
-curr_frame_dev_num = defaultdict(lambda:0)  # frames_temp에서 timestamp 마다 센싱 데이터가 몇 개 쌓였는지 체크
-max_frame_dev_num = 0                       # frames_temp의 timestamp마다 최대 몇 개의 데이터가 쌓일 수 있는지. 즉 데이터를 얻고 있는 총 센서 수를 뜻함.
-sequence = np.array([])                     # 한 sequence(200개 frame)을 담기위한 변수
+recorder = None                             # 측정 기록 파일. frame이 만들어질 때마다 파일에 이어 씀 (추론만 할 때는 None)
+aligner = FrameAligner(0, 1)                # 같은 timestamp의 센서 값을 모아 frame을 만듬. 진행 중인 timestamp는 일정 개수만 보관
+clock_sync = True                           # True면 센서별 시계 drift를 보정해서 공통 시간 격자에서 frame을 만듬 (GridAligner)
+record_clock_sync = False                   # get(기록)에도 시계 보정을 쓸지. False면 센서 값과 timestamp를 그대로 기록 (학습 데이터와 같은 형식)
+clients = []                                # 측정 중 연결된 센서들 (재동기화 명령 전송용)
+resync_task = None
+sequence = SlidingWindow(1, 0)              # 최근 한 sequence(timestep_num개 frame)를 담는 원형 버퍼
+ingest = IMUIngest([])                      # 센서별 수신 ring buffer
+
+# 계측 (metrics 명령으로 확인)
+meter = StreamMeter([], 1)                  # 센서별 수신/누락, frame 조립 결과
+model_meter = None                          # 추론 시간, 센서 timestamp~결과 지연
+synced = None                               # 센서 timestamp 0에 해당하는 시각 (perf_counter)
+loop_monitor = LoopMonitor()                # event loop 지연
 
 # Critical Section 지킴이
 lock = asyncio.Lock()
 
+# 추론 전용 thread. notify callback에서는 추론 요청만 하고 기다리지 않음
+worker = InferenceWorker()
+batcher = None      # svm의 frame들을 모아서 한 번에 추론
+
+# svm micro-batch 크기. (svm_batch_size = 1 이면 frame마다 바로 추론)
+svm_batch_size = 8      # 최대 몇 frame씩?
+svm_batch_ms = 100      # 최대 몇 ms 기다릴지?
+
 # 그냥 센싱할지/추론할지
 do_predict = False
 
@@ -47,11 +73,28 @@ do_predict = False
 modelstyle = "None"
 model = None
 scaler = None
+registry = ModelRegistry(".")   # 한 번 불러온 모델/scaler 보관
 
 # 센싱 속도 조절
 timestep_num = 50  # 한 sequence(10초) 당 몇 개?
 sampling_ms = 200  # 몇 ms 주기로?
 assert (sampling_ms / 1000) * (timestep_num / 10) == 1
+predict_stride_ms = 1000  # lstm 추론 주기. 10초 sequence를 이 주기마다 밀면서 추론
+
+# svm window 특징 (features.py). window 특징으로 학습한 svm 모델을 쓸 때만 0이 아닌 값으로
+feature_window_ms = 0     # 특징을 구할 window 길이. 0이면 frame마다 추론
+decision_ms = 250         # window 특징으로 추론하는 주기
+features = None           # 최근 window의 특징 (RollingFeatures)
+
+# 움직임이 없는 동안(자세 유지) 추론을 건너뛰고 마지막 결과를 다시 사용. 기준은 motion.py의 MOTION_DPS
+# 결과가 바뀔 수 있으므로 기본은 꺼져 있음. 기록된 세션으로 확인(python gateway/motion.py)한 뒤 True로
+motion_gate = False
+gate = None               # 측정마다 새로 (MotionGate)
+
+# 추론 중 센서별 sampling rate 조절. 움직이지 않는 센서는 느린 주기로 내리고, 움직이면 다시 올림 (clock_sync가 필요)
+# 모델은 고정 주기 데이터로 학습되었으므로 기본은 꺼져 있음 (느린 센서의 값은 보간됨)
+rate_control = False
+rate = None               # 측정마다 새로 (RateController)
 
 # ====================================================
 
@@ -59,97 +102,149 @@ assert (sampling_ms / 1000) * (timestep_num / 10) == 1
 async def view_online():
     print("현재 센서 목록")
     for addr, online in device_online.items():
-        print("\tName={}\tAddress={}\t{}".format(device_list[addr],addr, "ONLINE" if online else "offline"))
+        rssi = presence.rssi(addr)
+        print("\tName={}\tAddress={}\t{}{}".format(device_list[addr],addr, "ONLINE" if online else "offline",
+                                                  "" if rssi is None else "\tRSSI={}".format(rssi)))
+
+# 센서 목록 파일을 (처음이거나 바뀌었으면) 읽어서 목록 변수들 갱신
+def load_devices(path : str = "gateway/devices.txt"):
+    global devices, device_list, device_name_to_addr, device_num
+    if devices is None:
+        devices = DeviceRegistry(path)
+    elif not devices.refresh():
+        return
+    device_list = devices.addr_to_name
+    device_name_to_addr = devices.name_to_addr
+    device_num = len(devices)
+    print("센서 목록 읽음 : {}개".format(device_num))
 
 # BLE 센서 스캔
-async def scan_device(printlist = True):
-    print("센서 검색 중..")
-    scanner = BleakScanner()
-    
-    # 기존 목록 초기화
+# 센서 목록 파일이 바뀌었으면 다시 읽고 검색
+# refresh가 False면 백그라운드 검색 기록만 보고 바로 답함
+# True면 새로 검색하되, 모든 센서가 보이면 scan_max_wait초를 기다리지 않고 바로 끝냄
+async def scan_device(printlist = True, refresh = False):
+    load_devices()
+    addrs = list(device_list.keys())
+    if refresh or not presence.running:
+        print("센서 검색 중..")
+        online = await presence.scan(addrs, scan_max_wait)
+    else:
+        online = presence.online(addrs)
+
+    # 목록 갱신
     global device_online
-    device_online = dict.fromkeys(device_list.keys(), False)
-
-    # 2초간 검색 시작
-    await scanner.start()
-    await asyncio.sleep(2.0)
-    await scanner.stop()
-    
-    # 검색된 장치 가져오기
-    devices = scanner.discovered_devices
-
-    for d in devices:
-        if d.address in device_list.keys():
-            device_online[d.address] = True
+    device_online = dict(zip(addrs, online))
     
     # 검색 완료된 장치 목록 출력
     if printlist:
         await view_online()
 
+# 터미널 입력. 입력을 기다리는 동안에도 event loop(백그라운드 검색 등)가 멈추지 않도록 thread에서 받음
+async def ainput(prompt : str):
+    return await asyncio.get_running_loop().run_in_executor(None, input, prompt)
+
 
 # 센서와 연결 해제시 발생하는 callback
 def on_disconnect(client):
     print("\t연결 해제됨:Name={}\tAddress={}".format(device_list[client.address],client.address))
 
 # 같은 시간의 데이터를 한 행에 묶기 위한 작업.
-async def make_frame(data):
-    # 장치 이름, 데이터 시간, 데이터
-    devname = data[0].decode()
-    devtime = data[1]
-    devdata = data[2:]
-
-    # 장치 이름과 데이터를 합치기
-    temp = [devname]
-    temp.extend(devdata)
-
-    global frames
-    global model
-    global modelstyle
-    global scaler
-    global sequence
+# col : 센서의 열 번호, pos : 해당 센서 ring buffer에서의 위치
+async def make_frame(col, pos):
+    ring = ingest.rings[col]
+    devtime = int(ring.time[pos])
+    meter.packet(col, devtime)
 
     # Critical section lock
+    start = time.perf_counter()
     await lock.acquire()
+    lock_wait.observe(time.perf_counter() - start)
     try:
-        frames_temp[devtime].append(temp)           # frames_temp 딕셔너리의 timestamp 위치에 장치 이름과 데이터 추가.
-        curr_frame_dev_num[devtime] += 1            # 그리고 해당 timestamp의 센싱 데이터 수 1 증가
-
-        if curr_frame_dev_num[devtime] == max_frame_dev_num: # 그러다 이 timestamp에서 모든 장치의 센싱이 완료되면
-            # 이제 하나의 frame으로 구성해 frames에 append.
-            frame = [devtime]                       # 먼저 가장 앞에 시간 데이터 추가
-            for i in sorted(frames_temp[devtime], key=lambda x:x[0]): # 장치 이름순으로 정렬
-                frame.extend(i[1:])                 # 장치 이름은 뗌
-            
-            # 최종적으로 frames에 추가
-            frames.append(frame)
+        # aligner에 센서 값을 넣고, 이번에 끝난 frame들을 받아옴
+        # 열 번호가 이미 이름순이므로 정렬할 필요 없음
+        for devtime, inp in aligner.push(col, devtime, ring.data[pos]):
+            # 최종적으로 기록 파일에 추가 (시간, 센서값)
+            if recorder is not None:
+                recorder.append(devtime, inp)
 
             # 머신러닝 추론 수행
             if do_predict:
-                if modelstyle == "svm":
-                    #print(frame)
-                    inp = np.array(frame[1:])
-                    res = model.predict(scaler.transform(inp.reshape(1,-1)))
-                    #print(res)
-                    print("{:.2f}s|".format(devtime/1000), end="")
-                    print("True" if res[0]==1 else "False")
-                elif modelstyle == "lstm":
-                    inp = np.array(frame[1:])
-                    sequence = np.append(sequence, inp) # 가장 앞은 ms임
-                    if len(sequence) == len(inp) * timestep_num: #200개의 프레임이 모인다면...
-                        print("now")
-                        std = scaler.transform(sequence.reshape(-1,len(inp)))
-                        res = model.predict(std.reshape(-1,timestep_num,len(inp)))
-                        print(res)
-                        print(res.argmax(axis=-1))
-
-                        sequence = np.array([]) # 비우기
-
-                    
+                predict_frame(devtime, inp)
+        meter.frames(aligner)
             
     finally:
         # lock 해제
         lock.release()
 
+# 측정용 aligner 생성 (clock_sync에 따라)
+# missing : 오래 끊긴 센서 값을 끊기기 전 값으로 채울지("hold", 추론), NaN으로 표시할지("nan", 기록)
+# sync : 시계 보정 여부 (None이면 clock_sync)
+def make_aligner(sensor_num : int, missing : str = "hold", sync : bool = None):
+    if clock_sync if sync is None else sync:
+        return GridAligner(sensor_num, sampling_ms, on_resync=resync, missing=missing)
+    return FrameAligner(sensor_num, sampling_ms)
+
+# 센서끼리 시계가 많이 어긋남 -> 모든 센서의 timestamp를 다시 초기화 (aligner에서 호출)
+def resync():
+    global resync_task
+    if not notify_getdata or (resync_task is not None and not resync_task.done()):
+        return
+    print("센서 시계 재동기화")
+    resync_task = asyncio.get_running_loop().create_task(send_all(clients, command(1)))
+
+# 완성된 frame 하나로 추론 요청. 추론은 추론 thread에서 수행되고 결과는 on_result로 돌아옴
+def predict_frame(devtime, inp):
+    if gate is not None:
+        gate.push(inp)
+    if rate is not None:
+        rate.push(inp)
+    if modelstyle == "svm" and features is not None:
+        # window 특징을 frame마다 갱신하고, decision 주기마다 추론
+        features.push(inp)
+        if features.ready() and allow_predict(devtime):
+            batcher.add(devtime, features.vector())
+    elif modelstyle == "svm": # 몇 frame씩 모아서 추론
+        if allow_predict(devtime):
+            batcher.add(devtime, inp)
+    elif modelstyle == "lstm":
+        sequence.push(inp)
+        if sequence.ready() and allow_predict(devtime): # 최근 timestep_num개의 프레임으로 stride마다 추론
+            # 버퍼는 계속 바뀌므로 추론할 sequence는 복사해서 넘김
+            worker.submit(run_lstm, (model, scaler, sequence.view().copy()), partial(on_result, devtime))
+
+# 추론 시점에서 실제로 추론할지. 움직임이 없으면 추론하지 않고 마지막 결과를 다시 출력
+def allow_predict(devtime):
+    if gate is None or gate.allow(devtime):
+        return True
+    print("{:.2f}s|".format(devtime/1000), end="")
+    print(gate.last, "(유지)")
+    return False
+
+# 센서 timestamp부터 추론 결과까지의 지연 기록
+def observe_latency(devtime):
+    if synced is not None:
+        model_meter.sensor_latency.observe(max(0.0, time.perf_counter() - synced - devtime / 1000))
+
+# lstm 추론 결과 출력 (event loop에서 실행)
+def on_result(devtime, res):
+    observe_latency(devtime)
+    print("{:.2f}s|".format(devtime/1000))
+    print(res)
+    resstr = "True" if res.argmax(axis=-1)[0]==1 else "False"
+    print(resstr)
+    if gate is not None:
+        gate.result(devtime, resstr)
+
+# svm micro-batch 추론 결과 출력. frame 순서대로 (event loop에서 실행)
+def on_batch_result(devtimes, res):
+    for devtime, r in zip(devtimes, res):
+        observe_latency(devtime)
+        #print(r)
+        print("{:.2f}s|".format(devtime/1000), end="")
+        print("True" if r==1 else "False")
+        if gate is not None:
+            gate.result(devtime, "True" if r==1 else "False")
+
 
 # 센서로부터 값을 notify받을 때 발생하는 callback
 async def when_notified(sender, data):
@@ -158,15 +253,18 @@ async def when_notified(sender, data):
     if notify_getdata == False:
         return
     
-    # 수신된 값을 풀어해침.(c : char, i : int, 6f : float*6)
-    imudata = struct.unpack('ci6f',data)
-
     if notify_feedback:  # 실시간으로 값 좀 보고 싶을 때
         #print("{:.3f}".format(time.time()),end="")
-        print("\tName={}|Time={}|".format(imudata[0].decode(),imudata[1]),imudata[2:])
+        devname, devtime, devdata = decode(data)
+        print("\tName={}|Time={}|".format(devname,devtime),devdata)
+
+    # 수신된 값을 풀지 않고 그대로 센서별 ring buffer에 저장
+    received = ingest.push(data)
+    if received is None: # 목록에 없는 센서
+        return
 
     # 수신된 값을 가지고 frame생성. (모든 센서 값이 한 행으로 이루어진 데이터)
-    await make_frame(imudata)
+    await make_frame(*received)
 
 
 # 센서에게 특정 메시지를 송신
@@ -178,36 +276,18 @@ async def write_message(client : BleakClient, time, message):
     # 첫번째 정수 : 명령타입. (1:sync 맞추기(timestamp 초기화), 2:샘플링 속도 조절하기, 3:deep sleep)
     # 두번째 정수 : 값 (sync 맞추는 경우에는 따로 필요 없음)
 
-# 센싱 데이터 저장.
-async def save_result(filename : str, devices : list):
-    # 최상단에 헤더 데이터 추가.
-    head = "ax,ay,az,gx,gy,gz".split(",")  #a : accelerometer, g:gyroscope. x,y,z 세 축
-    header=["ms"]  # timestamp. ms단위.
-    for name in sorted(devices):
-        for h in head:
-            header.append(name + h)
-    frames.insert(0,header)
-
-    # frames를 csv파일의 형태로 저장함.
-    with open(filename, "w", newline='') as file:
-        writer = csv.writer(file)
-        writer.writerows(frames)
+# 센싱 데이터 저장. 기록 파일을 닫고 기존 CSV 형식으로 내보냄
+async def save_result(filename : str):
+    recorder.close()
+    export_csv(recorder.path, filename)
 
 # 문제가 발생했을 때..
+# 기록 파일은 이미 대부분 디스크에 있으므로, 남은 frame을 쓰고 닫은 뒤 CSV로도 내보냄
 def emer_save():
-    # 최상단에 헤더 데이터 추가.
-    head = "ax,ay,az,gx,gy,gz".split(",")  #a : accelerometer, g:gyroscope. x,y,z 세 축
-    header=["ms"]  # timestamp. ms단위.
-    dv = [d[0] for d in sorted(frames_temp[0], key=lambda x:x[0])]
-    for name in dv:
-        for h in head:
-            header.append(name + h)
-    frames.insert(0,header)
-
-    # frames를 csv파일의 형태로 저장함.
-    with open("tempfile.csv", "w", newline='') as file:
-        writer = csv.writer(file)
-        writer.writerows(frames)
+    if recorder is None:
+        return
+    recorder.close()
+    print("측정 기록 저장됨 :", recorder.path, export_csv(recorder.path, "tempfile.csv"))
 
 # 센싱 중에 시간 알려줌.
 async def time_indicate(maxtime :int):
@@ -226,9 +306,14 @@ async def time_indicate(maxtime :int):
 
 # IMU 데이터 수집
 async def get_IMU(devices : list, gettime : int):
+    # 연결하는 동안에는 백그라운드 검색 잠시 정지
+    scanning = presence.running
+    await presence.stop()
+
     print("센서와 연결 시작")    
     
     # BleakClient 보관 리스트
+    global clients
     clients = list()   
     
     # 장치마다 client 클래스 생성
@@ -236,31 +321,45 @@ async def get_IMU(devices : list, gettime : int):
         clients.append(BleakClient(device_name_to_addr[name], disconnected_callback=on_disconnect))
     
     try:
-        # 장치 차례로 연결 시도(동시에 연결하게도 가능할 듯?)
-        for client in clients:
-            await client.connect()
-            print("\t센서 연결됨:Name={}\tAddress={}".format(device_list[client.address],client.address))
-            await client.start_notify(UUID_NOTIFY,when_notified)
+        global notify_getdata
+        global worker
+        global batcher
+        global meter
+        global model_meter
+        global synced
+        global gate
+        global rate
+        meter = StreamMeter(ingest.names, sampling_ms)
+        synced = None
+        rate = None
+        if do_predict:
+            model_meter = ModelMeter(modelstyle)
+            gate = MotionGate(6*len(ingest.names), sampling_ms, meter=model_meter) if motion_gate else None
+            if clock_sync and rate_control:
+                rate = RateController(ingest.names, sampling_ms, aligner=aligner, meter=meter)
+            worker = InferenceWorker(meter=model_meter)  # 추론 통계도 세션마다 새로
+            worker.start()
+            batcher = MicroBatcher(worker, run_svm, (model, scaler), on_batch_result, svm_batch_size, svm_batch_ms)
 
         # 모든 센서의 time을 초기화하기 이전에 notified된 불필요한 데이터를
         # 수신하지 않다가, getdata flag를 True로 바꾸며 수신 시작
-        global notify_getdata
-        notify_getdata = True
-
-        # 모든 장치의 센싱 속도를 조절(기존 20Hz)
-        print("모든 센서의 sampling rate 초기화")
-        task = []
-        for client in clients:
-            task.append(asyncio.create_task(write_message(client, 1, struct.pack("hh",2,sampling_ms))))
-        await asyncio.wait(task)
-
-        # 모든 장치의 timestamp를 동시에 초기화
-        print("모든 센서의 timestamp 초기화")
-        task = []
-        for client in clients:
-            task.append(asyncio.create_task(write_message(client, 1, struct.pack("hh",1,0))))
-        await asyncio.wait(task)
-        # 이를 통해 리스트에 등록된 모든 task가 동시에 수행된다.
+        def start_getdata():
+            global notify_getdata
+            global synced
+            notify_getdata = True
+            synced = time.perf_counter()
+            if isinstance(aligner, GridAligner):
+                aligner.set_origin()
+
+        # 모든 장치에 동시에 연결 -> sampling rate 설정 -> timestamp 동시 초기화
+        # 센서마다 timeout, 재시도 횟수가 따로 적용됨
+        reports, ok = await setup_sensors(clients, when_notified, sampling_ms, start_getdata)
+        print_reports(reports, device_list)
+        if not ok:
+            failed = [device_list[r["address"]] for r in reports if not r["ok"]]
+            raise Exception("연결/설정에 실패한 센서 : " + " ".join(failed))
+        if rate is not None:    # 열 순서(이름순)대로
+            rate.start([clients[devices.index(name)] for name in ingest.names])
 
         # 정해진 시간만큼 측정을 위해 sleep
         if(do_predict):
@@ -280,9 +379,30 @@ async def get_IMU(devices : list, gettime : int):
         print("시간 경과")
 
         # stop notify
+        if rate is not None:
+            rate.stop()
         for client in clients:    
             await client.stop_notify(UUID_NOTIFY)
 
+        # 아직 모이는 중이던 frame 정리
+        async with lock:
+            for devtime, inp in aligner.flush():
+                if recorder is not None:
+                    recorder.append(devtime, inp)
+                if do_predict:
+                    predict_frame(devtime, inp)
+        print(aligner.summary())
+        if do_predict:
+            # 모아둔 svm batch, 진행 중인 추론의 결과까지 출력한 뒤 통계
+            batcher.flush()
+            await worker.drain()
+            print(worker.summary())
+            if gate is not None:
+                print("움직임이 없어 건너뛴 추론 : {}/{} ({:.1%})".format(gate.skipped, gate.decisions, gate.saved()))
+            if rate is not None:
+                print("sampling rate 변경:{} 실패:{} 줄어든 패킷:{:.1%}".format(
+                    rate.switches, rate.failures, rate.summary()["packets_saved"]))
+
     except Exception as e:
         print("센서 연결 과정에서 문제 발생")
         print(e)
@@ -290,9 +410,13 @@ async def get_IMU(devices : list, gettime : int):
     finally:
         # notified 되는 값을 무시(callback에서)
         notify_getdata = False
+        if rate is not None:
+            rate.stop()
+        await asyncio.get_running_loop().run_in_executor(None, worker.stop)
         print('모든 센서 연결 해제')
-        for client in clients:
-            await client.disconnect()
+        await disconnect_all(clients)
+        if scanning:
+            await presence.start()
 
 async def sleep(address):
     try:
@@ -315,30 +439,40 @@ async def run():
 
     print("시작!")
 
-    # 처음 장치 스캔
-    await scan_device()
+    # 백그라운드 검색 시작 후 처음 장치 스캔
+    loop_monitor.start()
+    await presence.start()
+    await scan_device(refresh=True)
 
     while True:
-        command = input(">>").strip()
+        command = (await ainput(">>")).strip()
 
         # 나가기
         if command == "quit":
             break
         
-        # 센서 스캔하기
+        # 센서 스캔하기 (백그라운드 검색 기록 사용)
         elif command == "scan":
             await scan_device()
 
+        # 새로 검색하기 (모든 센서가 보이면 바로 끝남)
+        elif command == "rescan":
+            await scan_device(refresh=True)
+
         # 현재 센서 목록 화인
         elif command == "list":
-            await view_online()
+            await scan_device()
+
+        # 계측값 확인 (센서별 수신/누락, frame 조립, 추론 지연, event loop 지연)
+        elif command == "metrics":
+            print(REGISTRY.dump())
 
         # IMU 센싱 값 받아오기
         elif command == "get":
 
             # 센싱 받고싶은 센서 입력
             print("IMU 데이터를 받을 센서 이름을 공백으로 구분하여 입력")
-            inputstr = input("?>")
+            inputstr = await ainput("?>")
             if inputstr == "/all":
                 devices = list(device_list.values())
             else:
@@ -358,7 +492,7 @@ async def run():
             # 센싱 시간 입력
             print("측정 시간을 입력(단위:초)")
             try:
-                gettime = int(input("?>"))
+                gettime = int(await ainput("?>"))
             except ValueError:
                 print("에러!","잘못된 값 형식")
                 continue
@@ -368,17 +502,17 @@ async def run():
             # notify 될 때 마다 데이터 확인 여부 결정
             print("데이터 수신 중 실시간 feedback? (y/N)")
             global notify_feedback
-            notify_feedback = True if input("?>") == "y" else False
+            notify_feedback = True if await ainput("?>") == "y" else False
 
             # 센싱 데이터 관리용 변수 초기화
-            global frames
-            global max_frame_dev_num
-            global frames_temp
-            global curr_frame_dev_num
-            frames = []                                 # 전체 데이터 초기화
-            frames_temp = defaultdict(lambda:[])        # 임시 데이터도 초기화.
-            max_frame_dev_num = len(devices)            # 한 frame 당 최대 센서 개수 지정
-            curr_frame_dev_num = defaultdict(lambda:0)  # 현재 timestamp 에서 센싱 완료한 센서 개수 초기화
+            global recorder
+            global aligner
+            global ingest
+            timestr = datetime.today().strftime("%Y%m%d_%H%M%S")
+            recorder = Recorder(timestr+"sensor.imurec", devices, sampling_ms)   # 측정 기록 파일 새로 만듬
+            # frame 조립 상태 초기화. 기본은 센서 timestamp 그대로 (record_clock_sync면 격자 보간, 오래 끊긴 값은 NaN)
+            aligner = make_aligner(len(devices), "nan", record_clock_sync)
+            ingest = IMUIngest(devices)                 # 센서별 수신 버퍼 새로 할당
 
             # 센싱 수행
             do_predict = False
@@ -386,8 +520,7 @@ async def run():
             
             # 센싱 수행 완료, 결과저장
             print('센싱 기록 결과 저장')
-            timestr = datetime.today().strftime("%Y%m%d_%H%M%S")
-            await save_result(timestr+"sensor.csv", devices)
+            await save_result(timestr+"sensor.csv")
             
 
 
@@ -399,10 +532,11 @@ async def run():
             global model
             global scaler
             global sequence
+            global features
 
             #타입
             print("학습 모델 타입? (1:svm, 2:lstm)")
-            modeltype = input("?>")
+            modeltype = await ainput("?>")
             if modeltype not in ["svm","lstm"]:
                 print("잘못됨!")
                 continue
@@ -410,37 +544,31 @@ async def run():
 
             #모델
             print("불러올 모델의 파일 이름을 입력")
-            modelname = input("?>")
-            try:
-                if modelstyle == "svm":
-                    with open(modelname, 'rb') as file:
-                        model = pickle.load(file)
-                elif modelstyle == "lstm":
-                    model = tf.keras.models.load_model(modelname)
-            except Exception as e:
-                print("모델을 불러오는 과정에서 문제가 발생했습니다.")
-                print(e)
-                continue
+            modelname = await ainput("?>")
             
             # scaler
             print("불러올 모델 scaler의 파일 이름을 입력")
-            modelscalername = input("?>")
+            modelscalername = await ainput("?>")
+
+            # 같은 파일을 다시 고르면 이전에 불러온 모델을 그대로 사용 (파일이 바뀐 경우만 다시 불러옴)
             try:
-                with open(modelscalername, 'rb') as file:
-                    scaler = pickle.load(file)
+                entry = registry.load(modelstyle, modelname, modelscalername)
             except Exception as e:
-                print("모델 scaler를 불러오는 과정에서 문제가 발생했습니다.")
+                print("모델/scaler를 불러오는 과정에서 문제가 발생했습니다.")
                 print(e)
                 continue
+            model = entry.model
+            scaler = entry.scaler
 
-            sensor_num = len(scaler.mean_) // 6
+            use_features = modelstyle == "svm" and feature_window_ms > 0
+            sensor_num = len(scaler.mean_) // (FEATURES_PER_SENSOR if use_features else 6)
 
             # 추론에 필요한 정확한 센서의 수 알림
             print("추론에 필요한 센서의 수 : ", sensor_num)
 
             # 센싱 받고싶은 센서 입력
             print("IMU 데이터를 받을 센서 이름을 공백으로 구분하여 입력")
-            devices = input("?>").split()
+            devices = (await ainput("?>")).split()
             if len(devices) != sensor_num: # 센서의 수가 맞지 않은 경우
                 print("에러!","필요한 센서 수가 맞지 않음")
                 print("{}개 필요함, {}개 입력됨".format(sensor_num,len(devices)))
@@ -462,7 +590,7 @@ async def run():
             # 센싱 시간 입력
             print("측정 시간을 입력(단위:초)")
             try:
-                gettime = int(input("?>"))
+                gettime = int(await ainput("?>"))
             except ValueError:
                 print("에러!","잘못된 값 형식")
                 continue
@@ -470,11 +598,12 @@ async def run():
                 gettime = 0
 
             # 센싱 데이터 관리용 변수 초기화
-            frames = []                                 # 전체 데이터 초기화
-            frames_temp = defaultdict(lambda:[])        # 임시 데이터도 초기화.
-            max_frame_dev_num = len(devices)            # 한 frame 당 최대 센서 개수 지정
-            curr_frame_dev_num = defaultdict(lambda:0)  # 현재 timestamp 에서 센싱 완료한 센서 개수 초기화
-            sequence = np.array([]) # 추론시 사용하는 변수 초기화
+            recorder = None                             # 추론만 할 때는 기록하지 않음
+            aligner = make_aligner(len(devices))        # frame 조립 상태 초기화
+            sequence = SlidingWindow(timestep_num, 6*len(devices), predict_stride_ms // sampling_ms) # 추론시 사용하는 변수 초기화
+            features = RollingFeatures(feature_window_ms // sampling_ms, 6*len(devices),
+                                       max(1, decision_ms // sampling_ms)) if use_features else None
+            ingest = IMUIngest(devices)                 # 센서별 수신 버퍼 새로 할당
 
             # 센싱&추론 수행
             do_predict = True
@@ -482,6 +611,27 @@ async def run():
 
             #따로 데이터 저장은 수행하지 않음
         
+        # 기록된 세션 파일들로 일괄 추론 (BLE 연결 없음)
+        elif command == "score":
+            print("운동자세 입력 ({})".format("/".join(EXERCISES.keys())))
+            position = (await ainput("?>")).strip()
+            if position not in EXERCISES:
+                print("에러!","없는 운동자세")
+                continue
+            print("세션 파일(.csv, .imuset, .imurec) 또는 폴더 입력 (여러 개는 띄어쓰기로 구분)")
+            paths = find_sessions((await ainput("?>")).split())
+            if not paths:
+                print("에러!","세션 파일이 없음")
+                continue
+            print("시간별 결과를 저장할 폴더 입력 (저장하지 않으려면 Enter)")
+            out_dir = (await ainput("?>")).strip() or None
+
+            # 오래 걸릴 수 있으므로 별도 thread에서 (안에서 process pool 사용)
+            start = time.perf_counter()
+            summaries = await asyncio.get_running_loop().run_in_executor(
+                None, partial(score_many, paths, position, out_dir=out_dir))
+            print_summaries(summaries, time.perf_counter() - start)
+
         # deep sleep 모드로 센서 모드 변경
         elif command=="sleep":
             print("모든 Online 센서를 deep sleep 상태로 변경합니다.")
@@ -496,7 +646,7 @@ async def run():
             await asyncio.wait(task)
 
             # 다시 장치 스캔하여 마무리
-            await scan_device()
+            await scan_device(refresh=True)
 
         else:
             # 없는 명령
@@ -505,12 +655,8 @@ async def run():
 
 if __name__ == "__main__":
     # 센서 목록 받아오기
-    with open("gateway/devices.txt",'r') as file:
-        device_list = dict([dev.strip().split() for dev in file])
-        device_name_to_addr = {v:k for k,v in device_list.items()}
-        device_num = len(device_list)
-        device_online = dict.fromkeys(device_list.keys(), False)
-        #print(device_list)
+    load_devices()
+    device_online = dict.fromkeys(device_list.keys(), False)
 
     try:
         loop = asyncio.get_event_loop()
@@ -522,5 +668,4 @@ if __name__ == "__main__":
         emer_save()
     finally:
         print("종료됨")
-        #print(frames)
     
\ No newline at end of file
@@ -0,0 +1,65 @@
+# 추론 결과를 여러 구독자(웹 클라이언트 등)에게 바로 보내는 코드
+# 구독자마다 크기가 정해진 큐를 두고, 느린 구독자 때문에 발행(publish)이 기다리거나
+# 메모리가 계속 늘지 않도록 큐가 가득 차면 가장 오래된 이벤트를 버린다.
+# 모든 함수는 event loop에서 호출해야 한다.
+
+import asyncio
+from collections import deque
+
+QUEUE_SIZE = 256    # 구독자 하나가 쌓아둘 수 있는 이벤트 수
+
+
+# 구독자 하나
+class Subscriber:
+    def __init__(self, queue_size : int = QUEUE_SIZE):
+        self.queue = deque(maxlen=queue_size)
+        self.event = asyncio.Event()    # 큐에 새 이벤트가 들어왔는지
+        self.closed = False
+        self.dropped = 0                # 큐가 가득 차서 버려진 이벤트 수
+
+    def put(self, item):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(item)
+        self.event.set()
+
+    # 다음 이벤트. 발행이 끝났고 남은 이벤트도 없으면 None. timeout초 동안 없으면 asyncio.TimeoutError
+    async def get(self, timeout : float = None):
+        while not self.queue:
+            if self.closed:
+                return None
+            self.event.clear()
+            await asyncio.wait_for(self.event.wait(), timeout)
+        return self.queue.popleft()
+
+
+# 발행자. 구독자 목록을 관리하고 이벤트를 모든 구독자에게 보냄
+class Broadcaster:
+    def __init__(self, queue_size : int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.closed = False
+        self.published = 0
+
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber(self.queue_size)
+        if self.closed:
+            sub.closed = True
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub : Subscriber):
+        self.subscribers.discard(sub)
+
+    # 기다리지 않고 바로 리턴
+    def publish(self, item):
+        self.published += 1
+        for sub in self.subscribers:
+            sub.put(item)
+
+    # 발행 종료. 구독자들은 남은 이벤트를 받은 뒤 None을 받음
+    def close(self):
+        self.closed = True
+        for sub in self.subscribers:
+            sub.closed = True
+            sub.event.set()
@@ -0,0 +1,73 @@
+# import 시간 검사
+# CLI(blemaster)와 API 서버(GUI/main)를 import하는 데 걸리는 시간을 재고,
+# 예산(budget)을 넘거나 무거운 머신러닝 라이브러리가 미리 import되면 실패(exit 1)한다.
+#
+# 실행:
+# python gateway/check_import_time.py          (기본 예산 1초)
+# python gateway/check_import_time.py 0.5      (예산 0.5초)
+
+import os
+import sys
+import time
+import subprocess
+
+BUDGET_S = 1.0
+# 모델을 사용하기 전에는 import되면 안 되는 모듈들
+HEAVY = ["tensorflow", "keras", "sklearn", "h5py"]
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+TARGETS = [
+    ("CLI (gateway/blemaster.py)", os.path.join(ROOT, "gateway"), "blemaster"),
+    ("API (GUI/main.py)",          os.path.join(ROOT, "GUI"),     "main"),
+]
+
+
+# 코드 실행에 걸린 시간 (인터프리터 시작 시간 포함)
+def run_time(cwd : str, code : str, importtime : bool = False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    start = time.perf_counter()
+    res = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if res.returncode != 0:
+        raise Exception(res.stderr.strip().splitlines()[-1])
+    return elapsed, res
+
+
+# -X importtime 출력에서 누적 시간이 큰 모듈들
+def slowest(stderr : str, num : int = 5):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:num]
+
+
+def check(budget : float):
+    ok = True
+    base, _ = run_time(ROOT, "pass")   # 인터프리터 시작 시간은 빼고 계산
+    for title, cwd, module in TARGETS:
+        code = "import sys, {}; print(' '.join(m for m in {} if m in sys.modules))".format(module, HEAVY)
+        try:
+            elapsed, res = run_time(cwd, code, importtime=True)
+        except Exception as e:
+            print("{} : import 실패 ({})".format(title, e))
+            ok = False
+            continue
+        elapsed -= base
+        heavy = res.stdout.split()
+
+        passed = elapsed <= budget and not heavy
+        ok = ok and passed
+        print("{} : {:.3f}s / 예산 {:.3f}s {}".format(title, elapsed, budget, "OK" if passed else "실패"))
+        if heavy:
+            print("\t모델 사용 전에 import된 모듈:", ", ".join(heavy))
+        for us, name in slowest(res.stderr):
+            print("\t{:8.1f}ms  {}".format(us / 1000, name))
+    return ok
+
+
+if __name__ == "__main__":
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_S
+    sys.exit(0 if check(budget) else 1)
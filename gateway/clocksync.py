@@ -0,0 +1,336 @@
+# 센서 시계 보정 + 공통 시간 격자(grid)로 다시 샘플링하는 코드
+# 펌웨어의 timestamp는 vTaskDelay 후 sampling 주기를 더하기만 하므로, 센서마다 시계가 조금씩 빠르거나 느리다.
+# FrameAligner처럼 같은 정수 timestamp끼리만 묶으면, 측정이 길어질수록 센서끼리 timestamp가 어긋나서
+# frame이 완성되지 않는다. 여기서는
+#   1. 센서마다 (센서 timestamp, 게이트웨이 도착 시각)으로 시계의 offset과 drift(속도 차이)를 추정하고
+#      (도착 지연은 항상 양수이므로, 기울기는 최소제곱으로, offset은 가장 빨리 도착한 패킷들의 선(하한)으로)
+#   2. 모든 센서의 값을 게이트웨이 시간축으로 옮긴 뒤, sampling 주기마다의 공통 격자 시각에서 선형 보간해 frame을 만든다.
+#   3. 센서끼리의 시계 차이가 기준(resync_ms)을 넘으면 timestamp를 다시 초기화(명령 1)하도록 알린다.
+#      초기화 후 timestamp가 0부터 다시 시작해도, 게이트웨이 시간축은 이어지므로 frame 시각은 끊기지 않는다.
+#   4. 센서마다 timestamp 간격으로 빠진 패킷(끊김)을 찾는다. 짧은 끊김(max_gap 이하)은 앞뒤 값으로 보간하고,
+#      긴 끊김 안의 격자는 빠진 값(missing)으로 표시한다. (끊기기 전 값을 유지하거나 NaN)
+#      어느 경우든 격자마다 frame이 나오므로 lstm의 sequence는 실제 시간과 같은 길이를 유지한다.
+#   5. 센서마다 sampling 주기가 격자 간격과 달라도 된다(set_period, ratecontrol.py). 느린 센서의 값도 같은 격자에서 보간한다.
+# FrameAligner와 같은 방식(push, expire, flush, 통계)으로 사용할 수 있다.
+
+import time
+import numpy as np
+from imustream import AXIS_NUM
+
+FIT_WINDOW = 256        # drift 추정에 사용할 최근 패킷 수 (센서마다)
+FIT_EVERY = 16          # 몇 패킷마다 다시 추정할지
+MIN_SPAN_MS = 3000      # 센서 시간이 이만큼 모이기 전에는 drift를 추정하지 않음 (속도 1로 가정)
+MAX_DRIFT = 0.1         # 추정한 시계 속도의 허용 범위 (1 ± MAX_DRIFT)
+HISTORY = 64            # 보간용으로 센서마다 보관하는 최근 값 수
+TIMEOUT_MS = 1000       # 이 시간동안 값이 오지 않은 센서는 마지막 값으로 채우거나(emit_partial) 버림
+RESYNC_MIN_S = 30.0     # 재동기화 요청 최소 간격(초)
+MAX_GAP = 5             # 보간으로 채울 최대 끊김 (빠진 sample 수). 더 길면 missing으로 표시
+
+
+# 기록된 frame들(n, 열)의 missing(NaN) 값을 열마다 바로 앞의 값으로 채움 (실시간 추론의 "hold"와 같음)
+# 맨 앞의 NaN은 0으로
+def hold_missing(x):
+    mask = np.isnan(x)
+    if not mask.any():
+        return x
+    idx = np.where(mask, 0, np.arange(len(x))[:, None])
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return np.nan_to_num(x[idx, np.arange(x.shape[1])])
+
+
+# 센서 하나의 시계 모델 : 게이트웨이 시각(ms) = offset + rate * 센서 timestamp
+class ClockEstimator:
+    def __init__(self, window : int = FIT_WINDOW):
+        self.devtimes = np.zeros(window)
+        self.arrivals = np.zeros(window)
+        self.count = 0              # 이번 epoch에서 받은 패킷 수
+        self.rate = 1.0             # 센서 시계 1ms 동안 지나는 게이트웨이 시간(ms)
+        self.offset = None          # 센서 timestamp 0의 게이트웨이 시각(ms). 최소 전송 지연 포함
+        self.fitted = False         # drift를 한 번이라도 추정했는지
+        self.epochs = 0             # timestamp가 초기화된 횟수
+        self.last_devtime = None
+
+    # 패킷 하나 추가. arrival : 기준 시각 이후 게이트웨이 도착 시각(ms). 다시 추정했는지를 리턴
+    def add(self, devtime : int, arrival : float) -> bool:
+        # timestamp가 뒤로 가면 센서가 초기화된 것 (BLE notify는 순서가 바뀌지 않음)
+        # 시계 속도는 센서의 성질이므로 유지하고 offset만 새로 구함
+        if self.last_devtime is not None and devtime < self.last_devtime:
+            self.count = 0
+            self.offset = None
+            self.epochs += 1
+        self.last_devtime = devtime
+
+        i = self.count % len(self.devtimes)
+        self.devtimes[i] = devtime
+        self.arrivals[i] = arrival
+        self.count += 1
+
+        # 추정하기 전까지는 지금의 속도로 하한선만 갱신
+        line = arrival - self.rate * devtime
+        if self.offset is None or line < self.offset:
+            self.offset = line
+        if self.count % FIT_EVERY == 0:
+            return self.fit()
+        return False
+
+    # 최근 패킷들로 rate(기울기)와 offset(하한선) 다시 추정
+    def fit(self) -> bool:
+        n = min(self.count, len(self.devtimes))
+        d = self.devtimes[:n]
+        a = self.arrivals[:n]
+        if d.max() - d.min() < MIN_SPAN_MS:
+            return False
+        dm = d - d.mean()
+        rate = float(dm @ (a - a.mean()) / (dm @ dm))
+        self.rate = min(max(rate, 1 - MAX_DRIFT), 1 + MAX_DRIFT)
+        self.offset = float((a - self.rate * d).min())
+        self.fitted = True
+        return True
+
+    # 센서 timestamp -> 게이트웨이 시각(ms)
+    def to_host(self, devtime):
+        return self.offset + self.rate * devtime
+
+    # 센서 시계가 게이트웨이보다 빠르면 양수 (ppm)
+    @property
+    def drift_ppm(self):
+        return (1 / self.rate - 1) * 1e6
+
+    # 마지막 timestamp까지 누적된 게이트웨이와의 차이(ms)
+    @property
+    def skew_ms(self):
+        return 0.0 if self.last_devtime is None else (1 - self.rate) * self.last_devtime
+
+
+class GridAligner:
+    # sensor_num : 센서 수, sampling_ms : 격자 간격(센서 sampling 주기)
+    # emit_partial : 값이 오지 않는 센서가 있을 때 마지막 값으로 채워서 내보낼지(True), 버릴지(False)
+    # resync_ms : 센서끼리 누적된 시계 차이가 이보다 크면 on_resync()를 부름 (기본 : sampling 주기)
+    # max_gap : 보간할 최대 끊김(빠진 sample 수), missing : 긴 끊김 안의 값 ("hold" : 끊기기 전 값, "nan" : NaN)
+    def __init__(self, sensor_num : int, sampling_ms : int, timeout_ms : int = TIMEOUT_MS,
+                 emit_partial : bool = False, history : int = HISTORY,
+                 resync_ms : float = None, on_resync=None, max_gap : int = MAX_GAP, missing : str = "hold"):
+        self.sensor_num = sensor_num
+        self.sampling_ms = sampling_ms
+        self.periods = [sampling_ms] * sensor_num   # 센서별 지금의 sampling 주기 (끊김 판단용)
+        self.timeout = timeout_ms / 1000
+        self.emit_partial = emit_partial
+        self.history = history
+        self.resync_ms = resync_ms if resync_ms is not None else sampling_ms
+        self.on_resync = on_resync
+        self.max_gap = max_gap
+        self.missing_value = missing
+
+        self.clocks = [ClockEstimator() for _ in range(sensor_num)]
+        # 센서별 (게이트웨이 시각, 값). 2*history 크기에 이어 쓰다가 끝에 닿으면 최근 history개를 앞으로 옮김
+        self.times = np.zeros((sensor_num, 2 * history))
+        self.values = np.zeros((sensor_num, 2 * history, AXIS_NUM), dtype=np.float32)
+        self.filled = [0] * sensor_num      # 센서별 보관 중인 끝 위치
+        self.arrival = np.zeros(sensor_num) # 센서별 마지막 도착 시각 (monotonic. 아직 없으면 origin)
+
+        self.origin = None          # 게이트웨이 시간축의 0 (monotonic). 보통 timestamp 초기화 직전
+        self.next_grid = 0          # 다음에 내보낼 격자 시각(ms)
+        self.next_check = 0.0       # 다음 timeout 검사 시각
+        self.last_resync = None
+
+        # 통계 (FrameAligner와 같음)
+        self.completed = 0  # 모든 센서 값으로 보간한 frame 수
+        self.evicted = 0    # 값이 오지 않는 센서가 있어 버린 격자 수
+        self.partial = 0    # 값이 오지 않는 센서를 마지막 값으로 채운 frame 수
+        self.late = 0       # 이미 내보낸 격자보다 앞선 시각의 값 수
+        self.fits = 0       # 시계 추정 횟수
+        self.resyncs = 0    # 재동기화 요청 횟수
+
+        # 센서별 끊김 통계
+        self.received = [0] * sensor_num        # 받은 패킷 수
+        self.gaps = [0] * sensor_num            # 끊긴 횟수
+        self.lost = [0] * sensor_num            # 빠진 패킷 수 (timestamp 간격으로 추정)
+        self.interpolated = [0] * sensor_num    # 짧은 끊김이라 보간한 sample 수
+        self.missing = [0] * sensor_num         # 긴 끊김이라 missing으로 표시한 sample 수
+        self.gap_events = 0                     # 끊김 통계가 바뀐 횟수 (계측 반영용)
+        self.holes = [[] for _ in range(sensor_num)]    # 센서별 긴 끊김 구간 [(시작, 끝)] (게이트웨이 시각)
+
+    # 게이트웨이 시간축의 0 설정 (timestamp 초기화 명령 직전에 부름)
+    # 그 전에 받은 값과 시계 추정은 버리고, 센서별 시계 속도만 유지
+    def set_origin(self, now : float = None):
+        self.origin = time.monotonic() if now is None else now
+        for c, clock in enumerate(self.clocks):
+            self.clocks[c] = ClockEstimator(len(clock.devtimes))
+            self.clocks[c].rate = clock.rate
+        self.filled = [0] * self.sensor_num
+        self.holes = [[] for _ in range(self.sensor_num)]
+        self.arrival[:] = self.origin
+        self.next_grid = 0
+
+    # 센서 col의 sampling 주기가 바뀜. 격자 간격은 그대로이고, 끊김 판단에만 사용
+    def set_period(self, col : int, period_ms : int):
+        self.periods[col] = period_ms
+
+    # 센서 값 하나 추가. 이번에 끝난 frame들의 [(격자 시각, 값)] 리스트를 리턴
+    def push(self, col : int, devtime : int, values, now : float = None):
+        if now is None:
+            now = time.monotonic()
+        if self.origin is None:
+            self.origin = now
+            self.arrival[:] = now
+        out = []
+
+        clock = self.clocks[col]
+        prev = clock.last_devtime
+        if clock.add(devtime, (now - self.origin) * 1000):
+            self.fits += 1
+            self._check_resync(now)
+        t = clock.to_host(devtime)
+        self.received[col] += 1
+
+        end = self.filled[col]
+        if t < self.next_grid - self.sampling_ms or (end and t <= self.times[col, end - 1]):
+            self.late += 1
+        else:
+            # 같은 epoch에서 timestamp가 sampling 주기보다 크게 건너뜀 -> 그 사이 패킷이 빠짐
+            period = self.periods[col]
+            if end and prev is not None and devtime - prev > period * 1.5:
+                self._gap(col, round((devtime - prev) / period) - 1, self.times[col, end - 1], t)
+            if end == 2 * self.history:     # 최근 history개만 앞으로 옮김
+                self.times[col, :self.history] = self.times[col, self.history:]
+                self.values[col, :self.history] = self.values[col, self.history:]
+                end = self.history
+            self.times[col, end] = t
+            self.values[col, end] = values
+            self.filled[col] = end + 1
+            self.arrival[col] = now
+
+            # 모든 센서의 값이 지나간 격자까지 내보냄
+            if all(self.filled):
+                self._emit(min(self.times[c, self.filled[c] - 1] for c in range(self.sensor_num)), out)
+
+        # 오래 기다린 센서 정리 (너무 자주 검사하지 않도록 timeout의 절반마다)
+        if now >= self.next_check:
+            self.next_check = now + self.timeout / 2
+            self.expire(now, out)
+        return out
+
+    # timeout동안 값이 오지 않은 센서가 있으면, 나머지 센서의 값이 지나간 격자까지 내보냄
+    def expire(self, now : float = None, out : list = None):
+        if now is None:
+            now = time.monotonic()
+        if out is None:
+            out = []
+        stalled = [c for c in range(self.sensor_num) if now - self.arrival[c] > self.timeout]
+        alive = [c for c in range(self.sensor_num) if c not in stalled and self.filled[c]]
+        if stalled and alive:
+            self._emit(min(self.times[c, self.filled[c] - 1] for c in alive), out, stalled)
+        return out
+
+    # 측정 종료 시 받은 값이 지나간 격자까지 모두 내보냄
+    def flush(self):
+        out = []
+        last = [self.times[c, self.filled[c] - 1] if self.filled[c] else -np.inf for c in range(self.sensor_num)]
+        until = max(last)
+        if until > -np.inf:
+            self._emit(until, out, [c for c in range(self.sensor_num) if last[c] < until])
+        return out
+
+    # 통계 문자열
+    def summary(self):
+        drift = " ".join("{:+.0f}".format(clock.drift_ppm) for clock in self.clocks)
+        lost = " ".join(str(n) for n in self.lost)
+        return "frame 완성:{} 채움:{} 버림:{} 늦은 값:{} drift(ppm):{} 재동기화:{} 빠진 패킷:{} (보간 {}, missing {})".format(
+            self.completed, self.partial, self.evicted, self.late, drift, self.resyncs,
+            lost, sum(self.interpolated), sum(self.missing))
+
+    # 센서별 끊김 통계. loss_rate : 빠진 패킷 / (받은 패킷 + 빠진 패킷)
+    def loss_report(self):
+        return [{"received" : self.received[c], "gaps" : self.gaps[c], "lost" : self.lost[c],
+                 "loss_rate" : self.lost[c] / max(1, self.received[c] + self.lost[c]),
+                 "interpolated" : self.interpolated[c], "missing" : self.missing[c]} for c in range(self.sensor_num)]
+
+    # 센서별 시계 추정 결과
+    def clock_report(self):
+        return [{"offset_ms" : clock.offset, "drift_ppm" : clock.drift_ppm,
+                 "skew_ms" : clock.skew_ms, "epochs" : clock.epochs} for clock in self.clocks]
+
+    # until(ms)까지의 격자들을 보간해서 out에 추가. stalled : 마지막 값으로 채울(또는 버릴) 센서들
+    def _emit(self, until : float, out : list, stalled : list = ()):
+        if until < self.next_grid:
+            return
+        num = int((until - self.next_grid) // self.sampling_ms) + 1
+        if num > self.history:  # 오래 멈춰 있었던 경우 앞부분은 버림
+            self.evicted += num - self.history
+            self.next_grid += (num - self.history) * self.sampling_ms
+            num = self.history
+        grid = self.next_grid + np.arange(num) * self.sampling_ms
+        self.next_grid += num * self.sampling_ms
+
+        if stalled and not self.emit_partial:
+            # 값이 오지 않는 센서의 마지막 값 이후 격자는 버림
+            last = min(self.times[c, self.filled[c] - 1] if self.filled[c] else -np.inf for c in stalled)
+            keep = grid <= last
+            self.evicted += int((~keep).sum())
+            grid = grid[keep]
+            if not len(grid):
+                return
+
+        rows = np.empty((len(grid), self.sensor_num * AXIS_NUM), dtype=np.float32)
+        held = np.zeros(len(grid), dtype=bool)
+        for c in range(self.sensor_num):
+            end = self.filled[c]
+            if end == 0:    # 한 번도 값이 오지 않은 센서 (flush에서만)
+                rows[:, c * AXIS_NUM:(c + 1) * AXIS_NUM] = 0
+                held[:] = True
+                continue
+            rows[:, c * AXIS_NUM:(c + 1) * AXIS_NUM] = self._interp(c, grid)
+            after = grid > self.times[c, end - 1]   # 마지막 값 이후 (값이 오지 않는 센서)
+            if self.missing_value == "nan":
+                rows[after, c * AXIS_NUM:(c + 1) * AXIS_NUM] = np.nan
+            held |= after
+
+        self.partial += int(held.sum())
+        self.completed += len(grid) - int(held.sum())
+        out.extend(zip(grid.astype(np.int64).tolist(), rows))
+
+    # 끊김 기록. 짧으면 보간하고 길면 구간을 기억해 두었다가 그 안의 격자를 missing으로 표시
+    def _gap(self, col : int, lost : int, start : float, end : float):
+        self.gaps[col] += 1
+        self.lost[col] += lost
+        if lost <= self.max_gap:
+            self.interpolated[col] += lost
+        else:
+            self.missing[col] += lost
+            holes = self.holes[col]
+            while holes and holes[0][1] < self.next_grid:   # 이미 지나간 구간 정리
+                holes.pop(0)
+            holes.append((start, end))
+        self.gap_events += 1
+
+    # 센서 c의 값을 grid 시각들에서 선형 보간 (보관 범위 밖은 처음/마지막 값)
+    # 긴 끊김 구간 안의 격자는 끊기기 전 값 또는 NaN
+    def _interp(self, c : int, grid):
+        end = self.filled[c]
+        start = max(0, end - self.history)
+        ts = self.times[c, start:end]
+        vs = self.values[c, start:end]
+        if len(ts) == 1:
+            return np.repeat(vs, len(grid), axis=0)
+        i = np.clip(np.searchsorted(ts, grid, side="right"), 1, len(ts) - 1)
+        w = np.clip((grid - ts[i - 1]) / (ts[i] - ts[i - 1]), 0, 1)[:, None]
+        rows = vs[i - 1] + (vs[i] - vs[i - 1]) * w
+        for start, end in self.holes[c]:
+            inside = (grid > start) & (grid < end)
+            if inside.any():
+                rows[inside] = np.nan if self.missing_value == "nan" else vs[i - 1][inside]
+        return rows
+
+    # 센서끼리 누적된 시계 차이가 기준을 넘으면 재동기화 요청
+    def _check_resync(self, now : float):
+        if self.on_resync is None or self.sensor_num < 2:
+            return
+        if self.last_resync is not None and now - self.last_resync < RESYNC_MIN_S:
+            return
+        if not all(clock.fitted for clock in self.clocks):
+            return
+        skews = [clock.skew_ms for clock in self.clocks]
+        if max(skews) - min(skews) > self.resync_ms:
+            self.last_resync = now
+            self.resyncs += 1
+            self.on_resync()
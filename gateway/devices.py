@@ -0,0 +1,106 @@
+# 센서 목록(devices.txt) 보관 코드
+# 파일은 처음에 한 번만 읽고 [주소] = 이름, [이름] = 주소 목록을 메모리에 만들어 둔다.
+# 사용할 때마다 파일의 수정 시각(mtime)과 크기만 확인해서, 바뀐 경우에만 다시 읽는다.
+# 내용의 hash로 만든 etag를 두어서, 웹 클라이언트가 /devices를 싸게 재확인(304)할 수 있다.
+#
+# 파일 형식 : 한 줄에 "주소 이름". 빈 줄과 #으로 시작하는 줄은 무시
+#
+# 실행:
+# python gateway/devices.py gateway/devices.txt    (목록 확인)
+
+import os
+import sys
+import hashlib
+
+
+# 파일 내용에서 [주소] = 이름 읽기. 잘못된 줄이 있으면 예외
+def parse_devices(text : str, path : str = ""):
+    addr_to_name = dict()
+    name_to_addr = dict()
+    for num, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split()
+        if len(fields) != 2:
+            raise Exception("센서 목록 형식 오류 ({}:{}) : {}".format(path, num, line))
+        addr, name = fields
+        if addr in addr_to_name or name in name_to_addr:
+            raise Exception("센서 목록에 중복된 센서 ({}:{}) : {}".format(path, num, line))
+        addr_to_name[addr] = name
+        name_to_addr[name] = addr
+    return addr_to_name, name_to_addr
+
+
+class DeviceRegistry:
+    def __init__(self, path : str):
+        self.path = path
+        self.addr_to_name = dict()      # [주소] = 이름 (파일 순서)
+        self.name_to_addr = dict()      # [이름] = 주소
+        self.etag = None                # 내용이 같으면 같은 값
+        self.version = 0                # 다시 읽을 때마다 증가
+        self._stat = None               # 마지막으로 읽은 파일의 (mtime, 크기)
+        self._data = None               # /devices 응답 내용
+        self.refresh()
+
+    # 파일이 바뀌었으면 다시 읽음. 다시 읽었는지를 리턴
+    # 이미 읽은 목록이 있으면, 새 내용이 잘못된 경우 기존 목록을 유지
+    def refresh(self) -> bool:
+        stat = os.stat(self.path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key == self._stat:
+            return False
+        with open(self.path, "rb") as file:
+            raw = file.read()
+        try:
+            addr_to_name, name_to_addr = parse_devices(raw.decode(), self.path)
+        except Exception as e:
+            if self._stat is None:
+                raise e
+            print("센서 목록을 다시 읽지 못함 (기존 목록 사용) :", e)
+            return False
+
+        self._stat = key
+        etag = '"{}"'.format(hashlib.sha1(raw).hexdigest()[:16])
+        if etag == self.etag:   # 저장만 다시 한 경우
+            return False
+        self.addr_to_name = addr_to_name
+        self.name_to_addr = name_to_addr
+        self.etag = etag
+        self.version += 1
+        self._data = None
+        return True
+
+    def __len__(self):
+        return len(self.addr_to_name)
+
+    def __contains__(self, addr):
+        return addr in self.addr_to_name
+
+    # 주소 -> 이름. 없는 센서면 예외
+    def name(self, addr : str) -> str:
+        if addr not in self.addr_to_name:
+            raise Exception("센서 목록에 없는 주소 : " + addr)
+        return self.addr_to_name[addr]
+
+    # 이름 -> 주소. 없는 센서면 예외
+    def addr(self, name : str) -> str:
+        if name not in self.name_to_addr:
+            raise Exception("센서 목록에 없는 이름 : " + name)
+        return self.name_to_addr[name]
+
+    # /devices 응답 내용 (목록이 바뀔 때만 새로 만듬)
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = {"type"      : "data",
+                          "dev_num"   : len(self.addr_to_name),
+                          "dev_names" : list(self.addr_to_name.values()),
+                          "dev_addrs" : list(self.addr_to_name.keys())}
+        return self._data
+
+
+if __name__ == "__main__":
+    devices = DeviceRegistry(sys.argv[1] if len(sys.argv) > 1 else "gateway/devices.txt")
+    for addr, name in devices.addr_to_name.items():
+        print("\tName={}\tAddress={}".format(name, addr))
+    print("센서 {}개, etag={}".format(len(devices), devices.etag))
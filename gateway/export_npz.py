@@ -0,0 +1,132 @@
+# 학습된 모델(.pkl : sklearn SVC/StandardScaler, .h5 : keras Sequential)을
+# npmodels.py에서 사용하는 NumPy 가중치 파일(.npz)로 변환
+# 변환 후 원래 모델과 결과를 비교해 허용 오차 안인지 확인한다.
+# 원래 파일의 해시를 같이 저장하므로, 원래 파일을 다시 학습해서 바꾸면 게이트웨이는 다시 변환할 때까지 원래 파일을 사용한다.
+#
+# 실행:
+# python gateway/export_npz.py GUI/model               (폴더 안의 모든 .pkl, .h5 변환)
+# python gateway/export_npz.py GUI/model/neck_2_m.pkl  (파일 하나만)
+
+import os
+import sys
+import json
+import pickle
+import numpy as np
+import h5py
+from npmodels import load_npz, file_digest
+
+TOLERANCE = 1e-4    # 원래 모델과의 허용 오차
+
+
+# sklearn 객체(.pkl) 변환
+def export_pickle(path : str, out : str):
+    with open(path, 'rb') as file:
+        obj = pickle.load(file)
+    name = type(obj).__name__
+    if name == "StandardScaler":
+        scale = obj.scale_ if obj.with_std else np.ones_like(obj.mean_)
+        mean = obj.mean_ if obj.with_mean else np.zeros_like(obj.mean_)
+        np.savez(out, kind="scaler", mean=mean, scale=scale, source=file_digest(path))
+    elif name == "SVC":
+        np.savez(out, kind="svc", kernel=obj.kernel, gamma=obj._gamma, coef0=obj.coef0, degree=obj.degree,
+                 support_vectors=obj.support_vectors_, dual_coef=obj.dual_coef_, intercept=obj.intercept_,
+                 n_support=obj.n_support_, classes=obj.classes_, source=file_digest(path))
+    else:
+        raise Exception("변환할 수 없는 객체 : " + name)
+    return obj
+
+
+# keras 모델(.h5) 변환. tensorflow 없이 h5py로 가중치를 직접 읽음
+def export_h5(path : str, out : str):
+    with h5py.File(path, 'r') as f:
+        config = json.loads(f.attrs["model_config"])
+        if config["class_name"] != "Sequential":
+            raise Exception("Sequential 모델만 변환 가능")
+        group = f["model_weights"] if "model_weights" in f else f
+        layer_names = [n.decode() if isinstance(n, bytes) else n for n in group.attrs["layer_names"]]
+
+        arrays = {"kind" : "sequential", "source" : file_digest(path)}
+        layers = []
+        input_shape = None
+        confs = [l for l in config["config"]["layers"] if l["class_name"] != "InputLayer"]
+        if config["config"]["layers"][0]["class_name"] == "InputLayer":
+            input_shape = config["config"]["layers"][0]["config"]["batch_shape"][1:]
+
+        for layer, layer_name in zip(confs, layer_names):
+            kind = layer["class_name"]
+            conf = layer["config"]
+            weights = [group[layer_name][w][()] for w in group[layer_name].attrs["weight_names"]]
+            i = len(layers)
+            if kind == "Dropout":       # 추론 시에는 아무것도 하지 않음
+                continue
+            elif kind == "LSTM":
+                if conf.get("go_backwards") or conf.get("stateful"):
+                    raise Exception("지원하지 않는 LSTM 설정")
+                if input_shape is None:
+                    input_shape = conf["batch_input_shape"][1:]
+                layers.append("lstm")
+                arrays["%d_activation" % i] = conf["activation"]
+                arrays["%d_recurrent_activation" % i] = conf["recurrent_activation"]
+                arrays["%d_return_sequences" % i] = conf["return_sequences"]
+                arrays["%d_kernel" % i], arrays["%d_recurrent_kernel" % i], arrays["%d_bias" % i] = weights
+            elif kind == "Dense":
+                layers.append("dense")
+                arrays["%d_activation" % i] = conf["activation"]
+                arrays["%d_kernel" % i], arrays["%d_bias" % i] = weights
+            else:
+                raise Exception("지원하지 않는 층 : " + kind)
+
+        arrays["layers"] = np.array(layers)
+        arrays["input_shape"] = np.array(input_shape)
+        np.savez(out, **arrays)
+
+
+# 원래 모델과 결과 비교. 차이의 최댓값을 리턴(비교할 수 없으면 None)
+def verify(path : str, out : str, original):
+    converted = load_npz(out)
+    rng = np.random.default_rng(0)
+    if path.endswith(".pkl"):
+        x = rng.normal(size=(256, original.n_features_in_))
+        if hasattr(original, "transform"):
+            return np.abs(converted.transform(x) - original.transform(x)).max()
+        # svc : 결과 클래스가 모두 같아야 함
+        diff = np.abs(converted.decision_function(x) - original.decision_function(x)).max()
+        if (converted.predict(x) != original.predict(x)).any():
+            raise Exception("svc 추론 결과가 다름")
+        return diff
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return None
+    model = tf.keras.models.load_model(path, compile=False)
+    x = rng.normal(size=(8,) + converted.input_shape[1:]).astype(np.float32)
+    return np.abs(converted.predict(x) - model.predict(x, verbose=0)).max()
+
+
+# 파일 하나 변환
+def export(path : str):
+    out = os.path.splitext(path)[0] + ".npz"
+    if path.endswith(".pkl"):
+        original = export_pickle(path, out)
+    elif path.endswith(".h5"):
+        original = None
+        export_h5(path, out)
+    else:
+        return
+    diff = verify(path, out, original)
+    if diff is None:
+        print("{} -> {} (tensorflow가 없어 결과 비교 생략)".format(path, out))
+    elif diff > TOLERANCE:
+        os.remove(out)
+        raise Exception("{} : 원래 모델과 결과 차이가 큼 ({:.2e})".format(path, diff))
+    else:
+        print("{} -> {} (최대 오차 {:.2e})".format(path, out, diff))
+
+
+if __name__ == "__main__":
+    for target in sys.argv[1:] or ["GUI/model"]:
+        if os.path.isdir(target):
+            for name in sorted(os.listdir(target)):
+                export(os.path.join(target, name))
+        else:
+            export(target)
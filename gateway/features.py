@@ -0,0 +1,155 @@
+# 윈도우 특징(feature) 추출 코드
+# svm 운동자세는 frame(50ms) 하나마다 추론해서 결과가 자주 바뀌고, 매 frame 추론 비용이 든다.
+# 여기서는 최근 window개 frame에 대한 요약값(평균, 분산, RMS, 최소/최대, 자이로 에너지)을
+# frame마다 O(1)로 갱신해 두고, 정해진 decision 주기마다 그 요약값으로 추론할 수 있게 한다.
+#   - 합, 제곱합 : 들어오는 frame을 더하고 window에서 빠지는 frame을 뺌 (window마다 다시 합해서 오차 누적 방지)
+#   - 최소/최대 : window 크기의 block으로 나눠, 이전 block의 뒤에서부터 누적 최소/최대와
+#                 지금 block의 앞에서부터 누적 최소/최대를 합침 (block마다 한 번 계산, frame당 상수 시간)
+# 실시간(make_frame)과 기록된 데이터(dataset/, offline.py)에서 같은 클래스를 사용하므로
+# 학습과 추론의 특징 값이 같다.
+#
+# 실행:
+# python gateway/features.py neck dataset/jh_head1.csv                     (운동자세 설정의 window, decision 주기)
+# python gateway/features.py neck dataset --window-ms 1000 --decision-ms 250 --out features
+
+import os
+import sys
+import argparse
+import numpy as np
+from imustream import AXES, AXIS_NUM
+
+STATS = ["mean", "var", "rms", "min", "max"]                            # 축마다
+GYRO = [i for i, axis in enumerate(AXES) if axis.startswith("g")]       # 에너지를 구할 자이로 축
+
+
+# 센서 하나의 특징 수
+FEATURES_PER_SENSOR = len(STATS) * AXIS_NUM + len(GYRO)
+
+# 특징 이름. (통계마다 모든 센서의 축, 마지막에 센서별 자이로 에너지) 순서
+def feature_names(names : list):
+    cols = [name + axis for name in sorted(names) for axis in AXES]
+    gyro = [name + AXES[i] for name in sorted(names) for i in GYRO]
+    return [col + "_" + stat for stat in STATS for col in cols] + [col + "_energy" for col in gyro]
+
+
+class RollingFeatures:
+    # size : window의 frame 수, width : frame 하나의 값 개수 (6 * 센서 수)
+    # stride : 몇 frame마다 특징을 꺼내 추론할지 (decision 주기)
+    def __init__(self, size : int, width : int, stride : int = 1):
+        self.size = size
+        self.width = width
+        self.stride = max(1, stride)
+        self.count = 0      # 지금까지 들어온 frame 수
+
+        self.block = np.zeros((size, width))            # 지금 채우는 block
+        self.prev = np.zeros((size, width))             # 이전 block (window에서 빠질 frame들)
+        self.prev_min = np.full((size, width), np.inf)  # 이전 block의 뒤에서부터 누적 최소
+        self.prev_max = np.full((size, width), -np.inf)
+        self.cur_min = np.full(width, np.inf)           # 지금 block의 앞에서부터 누적 최소
+        self.cur_max = np.full(width, -np.inf)
+        self.sum = np.zeros(width)
+        self.sumsq = np.zeros(width)
+        self.gyro = np.array([s * AXIS_NUM + i for s in range(width // AXIS_NUM) for i in GYRO])
+
+    # frame 하나 추가
+    def push(self, frame):
+        j = self.count % self.size
+        if self.count >= self.size:     # window에서 빠지는 frame
+            old = self.prev[j]
+            self.sum -= old
+            self.sumsq -= old * old
+        row = self.block[j]
+        row[:] = frame
+        self.sum += row
+        self.sumsq += row * row
+        np.minimum(self.cur_min, row, out=self.cur_min)
+        np.maximum(self.cur_max, row, out=self.cur_max)
+        self.count += 1
+
+        if j == self.size - 1:  # block 완성 -> window가 이 block과 같음
+            self.prev, self.block = self.block, self.prev
+            self.prev_min = np.minimum.accumulate(self.prev[::-1], axis=0)[::-1]
+            self.prev_max = np.maximum.accumulate(self.prev[::-1], axis=0)[::-1]
+            self.sum = self.prev.sum(axis=0)
+            self.sumsq = (self.prev * self.prev).sum(axis=0)
+            self.cur_min.fill(np.inf)
+            self.cur_max.fill(-np.inf)
+
+    # 이번 frame에서 추론해야 하는지. (window가 가득 찬 뒤 stride마다)
+    def ready(self):
+        return self.count >= self.size and (self.count - self.size) % self.stride == 0
+
+    # 최근 window의 특징 (FEATURES_PER_SENSOR * 센서 수,) float32
+    def vector(self):
+        n = min(self.count, self.size)
+        j = (self.count - 1) % self.size + 1    # 지금 block에 들어 있는 frame 수 (size면 block이 방금 끝남)
+        if j == self.size:
+            low, high = self.prev_min[0], self.prev_max[0]
+        else:
+            low = np.minimum(self.prev_min[j], self.cur_min)
+            high = np.maximum(self.prev_max[j], self.cur_max)
+        mean = self.sum / n
+        power = self.sumsq / n
+        var = np.maximum(power - mean * mean, 0)
+        return np.concatenate([mean, var, np.sqrt(power), low, high, power[self.gyro]]).astype(np.float32)
+
+    # 처음부터 다시 모으기
+    def clear(self):
+        self.__init__(self.size, self.width, self.stride)
+
+
+# 운동자세 설정(window_ms, decision_ms)에 맞는 특징 추출기. 특징을 쓰지 않는 운동자세면 None
+def make_features(spec, sensor_num : int):
+    if not spec.window_ms:
+        return None
+    return RollingFeatures(spec.window_ms // spec.sampling_ms, AXIS_NUM * sensor_num,
+                           max(1, spec.decision_ms // spec.sampling_ms))
+
+
+# 기록된 frame들(n, 6 * 센서 수)에서 decision 주기마다의 특징. (window 마지막 frame 위치 (w,), 특징 (w, 특징 수))
+def extract(x, size : int, stride : int = 1):
+    features = RollingFeatures(size, x.shape[1], stride)
+    idx = []
+    rows = []
+    for i, frame in enumerate(x):
+        features.push(frame)
+        if features.ready():
+            idx.append(i)
+            rows.append(features.vector())
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, FEATURES_PER_SENSOR * (x.shape[1] // AXIS_NUM)), dtype=np.float32)
+    return np.array(idx), np.stack(rows)
+
+
+if __name__ == "__main__":
+    from models import EXERCISES
+    from offline import read_session, resample, find_sessions
+    from clocksync import hold_missing
+
+    parser = argparse.ArgumentParser(description="기록된 세션에서 window 특징 추출 (학습용)")
+    parser.add_argument("position", choices=list(EXERCISES.keys()))
+    parser.add_argument("paths", nargs="+", help="세션 파일(.csv, .imuset, .imurec) 또는 폴더")
+    parser.add_argument("--sensors", nargs="+", help="사용할 센서 이름 (기본: 운동자세별 센서)")
+    parser.add_argument("--window-ms", type=int, default=None, help="window 길이 (기본: 운동자세 설정)")
+    parser.add_argument("--decision-ms", type=int, default=None, help="특징을 꺼내는 주기 (기본: 운동자세 설정)")
+    parser.add_argument("--out", default=".", help="특징 CSV를 저장할 폴더")
+    args = parser.parse_args()
+
+    spec = EXERCISES[args.position]
+    names = sorted(args.sensors or spec.sensors)
+    window_ms = args.window_ms or spec.window_ms
+    decision_ms = args.decision_ms or spec.decision_ms
+    if not window_ms:
+        print("window 길이를 입력(--window-ms)")
+        sys.exit(1)
+
+    os.makedirs(args.out, exist_ok=True)
+    for path in find_sessions(args.paths):
+        ms, x, target = read_session(path, names)
+        ms, x, target = resample(ms, x, target, spec.sampling_ms)
+        idx, feats = extract(hold_missing(x), window_ms // spec.sampling_ms, max(1, decision_ms // spec.sampling_ms))
+        columns = [ms[idx], feats] + ([target[idx]] if target is not None else [])
+        out = os.path.join(args.out, "{}.{}.features.csv".format(os.path.splitext(os.path.basename(path))[0], args.position))
+        np.savetxt(out, np.column_stack(columns), fmt="%.7g", delimiter=",", comments="",
+                   header=",".join(["ms"] + feature_names(names) + (["target"] if target is not None else [])))
+        print("{} -> {} ({}개)".format(path, out, len(idx)))
@@ -0,0 +1,181 @@
+# 측정 데이터셋 파일(.imuset) 코드
+# CSV(ms,Aax,...,target)는 학습/평가할 때마다 텍스트를 다시 파싱해야 해서 느리다.
+# .imuset은 열(column) 단위로 타입이 정해진 바이너리로 저장하고, 읽을 때는 memory-map 해서
+# 복사 없이 NumPy view를 돌려준다. 센서마다 (n, 6) 블록이 따로 저장되어 있어서
+# 일부 센서만 고르면 나머지 센서의 데이터는 디스크에서 읽지 않는다.
+#
+# 파일 구조:
+#   MAGIC(8) + 헤더 길이(uint32) + 헤더(JSON) + padding (ALIGN 바이트 단위)
+#   블록들 : ms(int32, n), target(int32, n, 있는 경우), 센서별 값(float32, n x 6)
+#   헤더 : 센서 이름, sampling 주기, label 값들, 원본 파일, 블록별 (위치, dtype, shape)
+#
+# 실행:
+# python gateway/imuset.py dataset                      (폴더 안의 모든 .csv, .imurec 변환)
+# python gateway/imuset.py dataset/jh_head1.csv         (파일 하나만)
+
+import os
+import sys
+import json
+import struct
+import numpy as np
+from imustream import AXES, AXIS_NUM
+
+MAGIC = b"IMUSET1\n"
+ALIGN = 64      # 블록 시작 위치 정렬 단위(바이트)
+
+
+# -------- 쓰기 ----------#
+
+# 데이터셋 파일 쓰기
+# ms : (n,), sensors : [이름] = (n, 6), target : (n,) 또는 None
+def write_set(path : str, ms, sensors : dict, target=None, sampling_ms : int = None, source : str = None):
+    names = sorted(sensors.keys())
+    ms = np.ascontiguousarray(ms, dtype='<i4')
+    arrays = [("ms", ms)]
+    if target is not None:
+        target = np.ascontiguousarray(target, dtype='<i4')
+        arrays.append(("target", target))
+    for name in names:
+        arrays.append((name, np.ascontiguousarray(sensors[name], dtype='<f4').reshape(len(ms), AXIS_NUM)))
+
+    # 블록 위치는 데이터 시작 위치 기준
+    blocks = dict()
+    offset = 0
+    for key, arr in arrays:
+        blocks[key] = [offset, arr.dtype.str, list(arr.shape)]
+        offset += -(-arr.nbytes // ALIGN) * ALIGN
+
+    if sampling_ms is None and len(ms) > 1:     # 가장 흔한 시간 간격
+        steps, counts = np.unique(np.diff(ms), return_counts=True)
+        sampling_ms = int(steps[counts.argmax()])
+    header = json.dumps({"names"       : names,
+                         "axes"        : AXES,
+                         "rows"        : len(ms),
+                         "sampling_ms" : sampling_ms,
+                         "labels"      : None if target is None else np.unique(target).tolist(),
+                         "source"      : source,
+                         "blocks"      : blocks}).encode()
+
+    with open(path, "wb") as file:
+        head = MAGIC + struct.pack("<I", len(header)) + header
+        file.write(head + b"\0" * (-len(head) % ALIGN))
+        for key, arr in arrays:
+            file.write(arr.tobytes())
+            file.write(b"\0" * (-arr.nbytes % ALIGN))
+    return path
+
+
+# CSV(ms,Aax,...,[target]) 변환
+def convert_csv(csvpath : str, out : str = None, sampling_ms : int = None):
+    with open(csvpath) as file:
+        columns = file.readline().strip().split(",")
+    table = np.loadtxt(csvpath, delimiter=",", skiprows=1, dtype=np.float64, ndmin=2)
+    if columns[0] != "ms":
+        raise Exception("첫 열이 ms가 아님 : " + csvpath)
+
+    sensors = dict()
+    for col in range(1, len(columns), AXIS_NUM):
+        group = columns[col:col + AXIS_NUM]
+        if len(group) < AXIS_NUM or [c[-2:] for c in group] != AXES:
+            break
+        sensors[group[0][:-2]] = table[:, col:col + AXIS_NUM]
+    target = table[:, columns.index("target")] if "target" in columns else None
+
+    out = out or os.path.splitext(csvpath)[0] + ".imuset"
+    return write_set(out, table[:, 0], sensors, target, sampling_ms, os.path.basename(csvpath))
+
+
+# 측정 기록 파일(.imurec, recorder.py) 변환
+def convert_record(recpath : str, out : str = None):
+    from recorder import read_record
+    header, times, data = read_record(recpath)
+    data = data.reshape(len(times), len(header["names"]), AXIS_NUM)
+    sensors = {name : data[:, i] for i, name in enumerate(header["names"])}
+    out = out or os.path.splitext(recpath)[0] + ".imuset"
+    return write_set(out, times, sensors, None, header["sampling_ms"], os.path.basename(recpath))
+
+
+# 확장자로 구분해서 변환
+def convert(path : str, out : str = None):
+    if path.endswith(".csv"):
+        return convert_csv(path, out)
+    if path.endswith(".imurec"):
+        return convert_record(path, out)
+    raise Exception("변환할 수 없는 파일 : " + path)
+
+
+# -------- 읽기 ----------#
+
+# 데이터셋 파일 하나. 모든 배열은 파일을 memory-map 한 view (읽기 전용)
+class IMUSet:
+    def __init__(self, path : str):
+        self.path = path
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise Exception("데이터셋 파일이 아님 : " + path)
+            size, = struct.unpack("<I", file.read(4))
+            self.header = json.loads(file.read(size))
+        start = len(MAGIC) + 4 + size
+        start += -start % ALIGN
+
+        self.names = self.header["names"]
+        self.sampling_ms = self.header["sampling_ms"]
+        self.labels = self.header["labels"]
+        self.rows = self.header["rows"]
+
+        # 파일 전체를 map만 해 두고, 실제로 접근한 블록의 페이지만 디스크에서 읽힘
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        self.blocks = dict()
+        for key, (offset, dtype, shape) in self.header["blocks"].items():
+            dtype = np.dtype(dtype)
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            self.blocks[key] = self._map[start + offset:start + offset + nbytes].view(dtype).reshape(shape)
+
+    def __len__(self):
+        return self.rows
+
+    # 시간 (n,)
+    @property
+    def ms(self):
+        return self.blocks["ms"]
+
+    # label (n,). 없으면 None
+    @property
+    def target(self):
+        return self.blocks.get("target")
+
+    # 센서 하나의 값 (n, 6)
+    def sensor(self, name : str):
+        if name not in self.names:
+            raise Exception("없는 센서 : " + name)
+        return self.blocks[name]
+
+    # CSV의 열 이름(ms, target, Aax, ...)으로 열 하나 (n,)
+    def column(self, col : str):
+        if col in ("ms", "target"):
+            return self.blocks[col]
+        return self.sensor(col[:-2])[:, AXES.index(col[-2:])]
+
+    # 실시간 frame과 같은 순서(센서 이름순, 센서마다 축 순서)의 (n, 센서 수 * 축 수) 행렬
+    # names, axes로 일부만 고를 수 있고, 고르지 않은 센서는 읽지 않음
+    # 센서 하나의 모든 축이면 view, 그 외에는 고른 열만 복사해서 새 배열을 만듬
+    def frames(self, names : list = None, axes : list = None):
+        names = sorted(names) if names is not None else self.names
+        idx = slice(None) if axes is None else [AXES.index(axis) for axis in axes]
+        if len(names) == 1 and axes is None:
+            return self.sensor(names[0])
+        return np.concatenate([self.sensor(name)[:, idx] for name in names], axis=1)
+
+
+def load(path : str) -> IMUSet:
+    return IMUSet(path)
+
+
+if __name__ == "__main__":
+    for target in sys.argv[1:] or ["dataset"]:
+        paths = [os.path.join(target, name) for name in sorted(os.listdir(target))] if os.path.isdir(target) else [target]
+        for path in paths:
+            if not path.endswith((".csv", ".imurec")):
+                continue
+            out = convert(path)
+            print("{} -> {} ({:.1f}MB -> {:.1f}MB)".format(path, out, os.path.getsize(path) / 1e6, os.path.getsize(out) / 1e6))
@@ -0,0 +1,97 @@
+# notify 패킷 수신(ingestion) 관련 코드들
+# 센서마다 미리 할당한 NumPy ring buffer에 패킷을 그대로 복사해 넣고,
+# 이후 단계(frame 생성, 추론)는 이 버퍼의 view를 사용한다.
+
+import struct
+import numpy as np
+
+# -------- 패킷 구조 ----------#
+
+# 센서에서 오는 패킷 구조 (c : char, i : int, 6f : float*6)
+# ESP32의 struct imu_data_line 과 같은 32바이트 (id 1바이트 + padding 3바이트 + timestamp + 데이터)
+PACKET = struct.Struct('ci6f')
+
+# 같은 구조의 NumPy dtype. ESP32와 게이트웨이 모두 little endian
+PACKET_DTYPE = np.dtype({'names'   : ['name', 'time', 'data'],
+                         'formats' : ['S1', '<i4', ('<f4', 6)],
+                         'offsets' : [0, 4, 8],
+                         'itemsize': PACKET.size})
+
+AXES = "ax,ay,az,gx,gy,gz".split(",")  # a : accelerometer, g : gyroscope. x,y,z 세 축
+AXIS_NUM = len(AXES)
+
+RING_CAPACITY = 1024    # 센서당 보관할 패킷 수 (20Hz 기준 약 50초)
+
+
+# -------- 클래스들 ----------#
+
+# 센서 하나의 ring buffer
+class SensorRing:
+    def __init__(self, name : str, capacity : int = RING_CAPACITY):
+        self.name = name
+        self.capacity = capacity
+        self.count = 0                                          # 지금까지 받은 패킷 수
+
+        self.packets = np.zeros(capacity, dtype=PACKET_DTYPE)   # 패킷 그대로 보관
+        self.time = self.packets['time']                        # (capacity,) view
+        self.data = self.packets['data']                        # (capacity, 6) view
+
+        # 패킷을 바이트 단위로 복사해 넣기 위한 memoryview (파싱 없이 memcpy만 수행)
+        self._raw = memoryview(self.packets.view(np.uint8)).cast('B')
+
+    # 패킷 하나 저장. 저장된 위치를 리턴
+    def push(self, data) -> int:
+        pos = self.count % self.capacity
+        start = pos * PACKET.size
+        self._raw[start:start + PACKET.size] = data
+        self.count += 1
+        return pos
+
+    # 최근 n개의 (time, data). 버퍼가 한 바퀴 돌아 끊긴 경우가 아니면 복사 없이 view를 리턴
+    def recent(self, n : int):
+        n = min(n, self.count, self.capacity)
+        end = self.count % self.capacity
+        if n <= end:
+            return self.time[end - n:end], self.data[end - n:end]
+        idx = np.arange(end - n, end) % self.capacity
+        return self.time[idx], self.data[idx]
+
+
+# 여러 센서의 패킷 수신 담당
+class IMUIngest:
+    def __init__(self, names : list, capacity : int = RING_CAPACITY):
+        # 열(column) 순서는 이름순으로 고정. (기존 frame의 정렬 순서와 동일)
+        self.names = sorted(names)
+        # 패킷 첫 바이트(센서 이름) -> 열 번호
+        self.column = {ord(name): col for col, name in enumerate(self.names)}
+        self.rings = [SensorRing(name, capacity) for name in self.names]
+        self.unknown = 0    # 목록에 없는 센서로부터 받은 패킷 수
+
+    # 수신된 패킷을 해당 센서의 ring buffer에 저장
+    # (열 번호, ring buffer 위치)를 리턴. 모르는 센서의 패킷이면 None
+    def push(self, data):
+        col = self.column.get(data[0])
+        if col is None or len(data) != PACKET.size:
+            self.unknown += 1
+            return None
+        return col, self.rings[col].push(data)
+
+    # 센서 수
+    def __len__(self):
+        return len(self.names)
+
+
+# -------- 함수들 ----------#
+
+# 디버깅 출력용. 패킷 하나를 (이름, 시간, 데이터)로 풀어줌
+def decode(data):
+    name, devtime, *devdata = PACKET.unpack(data)
+    return name.decode(), devtime, devdata
+
+# CSV 헤더 ("ms", "Aax", "Aay", ...) 생성
+def make_header(names : list):
+    header = ["ms"]  # timestamp. ms단위.
+    for name in sorted(names):
+        for h in AXES:
+            header.append(name + h)
+    return header
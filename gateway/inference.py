@@ -0,0 +1,181 @@
+# 추론 전용 작업 thread
+# BLE notify callback(event loop)에서 model.predict를 직접 부르면 느린 추론 동안
+# 다른 센서의 notify와 frame 조립이 모두 멈춘다. 그래서 추론은 이 thread에서 수행하고,
+# 결과만 event loop로 돌려준다. 추론이 밀리면 오래된 작업부터 버린다.
+
+import asyncio
+import threading
+import time
+from collections import deque
+from functools import partial
+import numpy as np
+
+QUEUE_SIZE = 4      # 대기할 수 있는 추론 작업 수. 넘치면 가장 오래된 작업을 버림
+MAX_AGE_MS = 1000   # 이보다 오래 기다린 작업은 추론하지 않고 버림
+BATCH_SIZE = 8      # micro-batch 하나에 모을 최대 frame 수
+BATCH_MS = 100      # micro-batch의 첫 frame 이후 최대 대기 시간
+DRAIN_S = 5.0       # 세션이 끝날 때 남은 작업의 결과를 기다리는 최대 시간(초)
+
+
+class InferenceWorker:
+    # meter : 작업 결과와 추론 시간을 기록할 metrics.ModelMeter (없으면 기록하지 않음)
+    def __init__(self, queue_size : int = QUEUE_SIZE, max_age_ms : int = MAX_AGE_MS, meter=None):
+        self.queue = deque(maxlen=queue_size)
+        self.max_age = max_age_ms / 1000
+        self.cond = threading.Condition()
+        self.thread = None
+        self.loop = None
+        self.running = False
+        self.meter = meter
+
+        # 통계
+        self.submitted = 0  # 요청된 작업 수
+        self.done = 0       # 추론 완료된 작업 수
+        self.dropped = 0    # 큐가 가득 차서 버려진 작업 수
+        self.stale = 0      # 너무 오래 기다려 버려진 작업 수
+        self.errors = 0     # 추론 중 예외가 발생한 작업 수
+        self.last_latency = 0.0     # 마지막 작업의 요청~완료 시간(초)
+        self.max_latency = 0.0
+
+    # thread 시작. 결과 callback은 현재 event loop에서 실행됨
+    def start(self, loop=None):
+        if self.running:
+            return
+        self.loop = loop or asyncio.get_running_loop()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="inference", daemon=True)
+        self.thread.start()
+
+    # thread 정지. 남은 작업은 마저 처리(오래된 것은 버림)하고 끝남. 기다리므로 event loop에서는 run_in_executor로
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    # 추론 작업 요청 (event loop에서 호출). func(*args)를 thread에서 실행하고
+    # 결과로 callback(결과)를 event loop에서 실행한다. 기다리지 않고 바로 리턴
+    def submit(self, func, args, callback):
+        with self.cond:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+                if self.meter is not None:
+                    self.meter.job("dropped")
+            self.queue.append((time.monotonic(), func, args, callback))
+            self.submitted += 1
+            self.cond.notify()
+
+    # 현재 대기 중인 작업 수
+    def depth(self):
+        return len(self.queue)
+
+    # 요청됐지만 아직 끝나지 않은(대기 중이거나 추론 중인) 작업 수
+    def pending(self):
+        return self.submitted - self.done - self.stale - self.errors - self.dropped
+
+    # 남은 작업이 모두 끝나고 결과 callback까지 실행될 때까지 기다림 (event loop에서 호출)
+    async def drain(self, timeout : float = DRAIN_S):
+        deadline = time.monotonic() + timeout
+        while self.pending() > 0 and self.thread is not None and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0)  # 마지막 결과 callback 실행
+
+    # 통계 문자열
+    def summary(self):
+        return "추론 요청:{} 완료:{} 대기:{} 버림(가득참):{} 버림(오래됨):{} 오류:{} 최대지연:{:.0f}ms".format(
+            self.submitted, self.done, self.depth(), self.dropped, self.stale, self.errors, self.max_latency * 1000)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.queue:  # 정지 요청 + 남은 작업 없음
+                    return
+                created, func, args, callback = self.queue.popleft()
+
+            # 너무 오래 기다린 작업은 결과가 의미 없으므로 버림
+            start = time.monotonic()
+            if start - created > self.max_age:
+                self.stale += 1
+                if self.meter is not None:
+                    self.meter.job("stale")
+                continue
+
+            try:
+                res = func(*args)
+            except Exception as e:
+                self.errors += 1
+                if self.meter is not None:
+                    self.meter.job("error")
+                print("추론 중 문제 발생:", e)
+                continue
+            if self.meter is not None:
+                self.meter.job("done", time.monotonic() - start)
+
+            self.last_latency = time.monotonic() - created
+            self.max_latency = max(self.max_latency, self.last_latency)
+            try:
+                self.loop.call_soon_threadsafe(callback, res)
+            except RuntimeError:    # event loop가 이미 닫힌 경우
+                return
+            # callback을 예약한 뒤에 셈 (drain이 끝났을 때 결과 callback이 이미 예약되어 있도록)
+            self.done += 1
+
+
+# frame 단위 모델(svm)의 micro-batching
+# frame을 batch_size개 또는 batch_ms동안 모았다가 한 번에 transform+predict 한다.
+# (sklearn은 호출마다 입력 검사 비용이 커서 1행씩 부르면 실제 계산보다 그 비용이 더 큼)
+# callback(timestamp 배열, 결과 배열)은 frame 순서대로 event loop에서 실행됨
+class MicroBatcher:
+    def __init__(self, worker : InferenceWorker, func, args : tuple, callback,
+                 batch_size : int = BATCH_SIZE, batch_ms : int = BATCH_MS):
+        self.worker = worker
+        self.func = func            # func(*args, frame 배열)
+        self.args = args
+        self.callback = callback
+        self.batch_size = max(1, batch_size)
+        self.batch_ms = batch_ms
+        self.times = np.zeros(self.batch_size, dtype=np.int64)
+        self.rows = None            # 첫 frame이 들어올 때 할당
+        self.count = 0
+        self.timer = None
+
+    # frame 하나 추가
+    def add(self, devtime : int, inp):
+        if self.rows is None:
+            self.rows = np.zeros((self.batch_size, len(inp)), dtype=np.float32)
+        if self.count == 0 and self.batch_size > 1:
+            # 첫 frame 이후 batch_ms가 지나면 덜 찼더라도 보냄
+            self.timer = asyncio.get_running_loop().call_later(self.batch_ms / 1000, self.flush)
+        self.times[self.count] = devtime
+        self.rows[self.count] = inp
+        self.count += 1
+        if self.count == self.batch_size:
+            self.flush()
+
+    # 모은 frame을 추론 thread로 보냄
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.count == 0:
+            return
+        rows = self.rows[:self.count].copy()
+        times = self.times[:self.count].copy()
+        self.count = 0
+        self.worker.submit(self.func, self.args + (rows,), partial(self.callback, times))
+
+
+# -------- 추론 thread에서 실행할 함수들 ----------#
+
+# svm : frame 하나(센서값) 또는 여러 개(frame 수 x 센서값)
+def run_svm(model, scaler, inp):
+    return model.predict(scaler.transform(np.atleast_2d(inp)))
+
+# lstm : sequence 하나 (timestep_num x 센서값)
+def run_lstm(model, scaler, seq):
+    std = scaler.transform(seq)
+    return model.predict(std.reshape(1,len(seq),-1), verbose=0)
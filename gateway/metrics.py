@@ -0,0 +1,383 @@
+# 게이트웨이 계측(metrics) 코드
+# 센서별 notify 수신/누락, frame 조립, 추론 지연, event loop 지연을 모아서
+# Prometheus text 형식(/metrics)이나 터미널 출력용 표로 보여준다.
+# 계측값은 카운터와 고정 구간(bucket) histogram에 더하기만 하므로, 운영 중에 켜두어도 부담이 적다.
+# (label별 값은 처음 한 번만 만들고, 수신 경로에서는 미리 찾아둔 값에 바로 더함)
+#
+# 실행:
+# python gateway/metrics.py                             (실행 중인 서버의 /metrics 표로 출력)
+# python gateway/metrics.py http://localhost:8000/metrics --raw
+
+import sys
+import time
+import math
+import asyncio
+import threading
+import re
+from bisect import bisect_left
+
+# 지연 시간(초) 구간
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# notify 수신 간격(초) 구간. sampling 주기(50~200ms) 주변을 촘촘하게
+INTERVAL_BUCKETS = (0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0, 2.5)
+# lock 대기 시간(초) 구간
+WAIT_BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0)
+
+LOOP_INTERVAL_S = 0.5   # event loop 지연 측정 주기
+
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+# -------- 계측값 ----------#
+
+def _label_str(names, values, extra : str = ""):
+    pairs = ['{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"')) for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _num(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# 증가만 하는 값. 같은 모델의 세션들이 각자의 추론 thread에서 함께 더할 수 있으므로 lock 사용
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+# 현재 값
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+# 구간별 개수. 추론 thread에서도 더하므로 lock 사용
+class Histogram:
+    def __init__(self, buckets : tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # 마지막은 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value : float):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    # 구간 안에서 선형 보간한 분위수 (q : 0~1). 값이 없으면 None
+    def quantile(self, q : float):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):  # +Inf 구간은 마지막 경계값으로
+                    return lo
+                return lo + (self.buckets[i] - lo) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+
+# label별 계측값 묶음 하나 (Prometheus의 metric family)
+class Family:
+    def __init__(self, kind : str, name : str, help : str, labelnames : tuple, factory):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children = dict()  # [label 값 tuple] = 계측값
+
+    # label 값에 해당하는 계측값. 수신 경로에서는 미리 받아두고 사용
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self.factory()
+        return child
+
+    # label이 없는 경우
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self, lines : list):
+        lines.append("# HELP {} {}".format(self.name, self.help))
+        lines.append("# TYPE {} {}".format(self.name, self.kind))
+        for values, child in list(self.children.items()):
+            if self.kind != "histogram":
+                lines.append("{}{} {}".format(self.name, _label_str(self.labelnames, values), _num(child.value)))
+                continue
+            with child.lock:
+                counts = list(child.counts)
+                total, sum_ = child.count, child.sum
+            cumulative = 0
+            for bound, c in zip(child.buckets + (math.inf,), counts):
+                cumulative += c
+                lines.append("{}_bucket{} {}".format(self.name, _label_str(self.labelnames, values, 'le="{}"'.format(_num(bound))), cumulative))
+            lines.append("{}_sum{} {}".format(self.name, _label_str(self.labelnames, values), _num(sum_)))
+            lines.append("{}_count{} {}".format(self.name, _label_str(self.labelnames, values), total))
+
+
+class Registry:
+    def __init__(self):
+        self.families = dict()
+        self.collectors = []    # render 직전에 호출되는 함수들 (현재 상태를 gauge에 반영)
+
+    def _add(self, kind, name, help, labelnames, factory):
+        if name in self.families:
+            return self.families[name]
+        family = self.families[name] = Family(kind, name, help, labelnames, factory)
+        return family
+
+    def counter(self, name : str, help : str, labelnames : tuple = ()):
+        return self._add("counter", name, help, labelnames, Counter)
+
+    def gauge(self, name : str, help : str, labelnames : tuple = ()):
+        return self._add("gauge", name, help, labelnames, Gauge)
+
+    def histogram(self, name : str, help : str, labelnames : tuple = (), buckets : tuple = LATENCY_BUCKETS):
+        return self._add("histogram", name, help, labelnames, lambda: Histogram(buckets))
+
+    def collector(self, func):
+        self.collectors.append(func)
+        return func
+
+    def _collect(self):
+        for func in self.collectors:
+            try:
+                func()
+            except Exception as e:
+                print("metrics collector 오류:", e)
+
+    # Prometheus text 형식 (version 0.0.4)
+    def render(self) -> str:
+        self._collect()
+        lines = []
+        for family in self.families.values():
+            family.render(lines)
+        return "\n".join(lines) + "\n"
+
+    # 터미널 출력용 표. histogram은 개수, 평균, p50/p95/p99 (ms)
+    def dump(self) -> str:
+        self._collect()
+        lines = []
+        for family in self.families.values():
+            for values, child in sorted(family.children.items()):
+                label = family.name + _label_str(family.labelnames, values)
+                if family.kind != "histogram":
+                    lines.append("\t{:<60} {}".format(label, _num(child.value)))
+                elif child.count:
+                    lines.append("\t{:<60} n={} 평균={:.1f}ms p50={:.1f}ms p95={:.1f}ms p99={:.1f}ms".format(
+                        label, child.count, child.sum / child.count * 1000,
+                        child.quantile(0.5) * 1000, child.quantile(0.95) * 1000, child.quantile(0.99) * 1000))
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+
+# -------- 게이트웨이 계측값 ----------#
+
+packets = REGISTRY.counter("imu_packets_total", "센서별 수신한 notify 패킷 수", ("sensor",))
+packet_gaps = REGISTRY.counter("imu_packet_gaps_total", "센서 timestamp가 sampling 주기보다 크게 건너뛴 횟수", ("sensor",))
+packets_missed = REGISTRY.counter("imu_packets_missed_total", "건너뛴 timestamp로 추정한 누락 패킷 수", ("sensor",))
+notify_interval = REGISTRY.histogram("imu_notify_interval_seconds", "센서별 notify 수신 간격 (게이트웨이 시각)",
+                                     ("sensor",), INTERVAL_BUCKETS)
+frames = REGISTRY.counter("gateway_frames_total",
+                          "frame 조립 결과 (completed:완성, partial:채워서 내보냄, evicted:버림, late:늦은 값)", ("result",))
+clock_drift = REGISTRY.gauge("imu_clock_drift_ppm", "센서별 추정한 시계 drift (게이트웨이 기준, 빠르면 양수)", ("sensor",))
+clock_skew = REGISTRY.gauge("imu_clock_skew_ms", "센서별 마지막 timestamp 초기화 이후 누적된 시계 차이", ("sensor",))
+samples_filled = REGISTRY.counter("imu_samples_filled_total",
+                                  "센서별 빠진 sample을 채운 수 (interpolated:짧은 끊김 보간, missing:긴 끊김)", ("sensor", "how"))
+clock_resyncs = REGISTRY.counter("gateway_clock_resyncs_total", "시계 차이로 timestamp 재동기화를 요청한 횟수")
+lock_wait = REGISTRY.histogram("gateway_frame_lock_wait_seconds", "make_frame의 lock 대기 시간", (), WAIT_BUCKETS)
+frame_latency = REGISTRY.histogram("gateway_frame_to_predict_seconds", "frame 완성부터 추론 결과까지", ("model",))
+sensor_latency = REGISTRY.histogram("gateway_sensor_to_predict_seconds",
+                                    "센서 timestamp(sync 기준)부터 추론 결과까지", ("model",))
+inference_time = REGISTRY.histogram("gateway_inference_seconds", "추론 thread에서 모델 호출 시간 (작업 하나)", ("model",))
+inference_jobs = REGISTRY.counter("gateway_inference_jobs_total", "추론 작업 결과 (done, dropped, stale, error)",
+                                  ("model", "result"))
+inference_decisions = REGISTRY.counter("gateway_inference_decisions_total",
+                                       "추론 시점마다 실제로 추론(run)했는지, 움직임이 없어 건너뛰었는지(skipped)", ("model", "how"))
+sampling_period = REGISTRY.gauge("imu_sampling_ms", "센서별 지금의 sampling 주기 (sampling rate 조절)", ("sensor",))
+rate_switches = REGISTRY.counter("gateway_rate_switches_total", "sampling rate 변경 명령 결과 (ok, failed)", ("result",))
+loop_lag = REGISTRY.histogram("gateway_event_loop_lag_seconds", "event loop 지연 (예정보다 늦게 깨어난 시간)")
+
+
+# 센서 묶음 하나(세션)의 수신/조립 계측. label별 값을 미리 찾아둠
+# names : 열 순서(이름순)의 센서 이름
+class StreamMeter:
+    def __init__(self, names : list, sampling_ms : int):
+        self.sampling_ms = sampling_ms
+        self.periods = [sampling_ms] * len(names)  # 센서별 지금의 sampling 주기 (ratecontrol.py가 바꿈)
+        self.packets = [packets.labels(name) for name in names]
+        self.gaps = [packet_gaps.labels(name) for name in names]
+        self.missed = [packets_missed.labels(name) for name in names]
+        self.interval = [notify_interval.labels(name) for name in names]
+        self.last_time = [-1] * len(names)      # 센서별 마지막 timestamp
+        self.last_arrival = [0.0] * len(names)  # 센서별 마지막 수신 시각
+        self.results = [frames.labels(result) for result in ("completed", "partial", "evicted", "late")]
+        self.seen = [0, 0, 0, 0]                # aligner 통계 중 이미 더한 값
+        self.drift = [clock_drift.labels(name) for name in names]
+        self.skew = [clock_skew.labels(name) for name in names]
+        self.fits = 0                           # 시계 추정 결과를 마지막으로 반영한 때의 추정 횟수
+        self.resyncs = 0
+        self.interpolated = [samples_filled.labels(name, "interpolated") for name in names]
+        self.missing = [samples_filled.labels(name, "missing") for name in names]
+        self.gap_events = 0
+        self.filled_seen = [(0, 0)] * len(names)
+
+    # 패킷 하나 수신. col : 센서 열 번호, devtime : 센서 timestamp
+    def packet(self, col : int, devtime : int, now : float = None):
+        now = time.monotonic() if now is None else now
+        self.packets[col].inc()
+        last = self.last_time[col]
+        if last >= 0:
+            self.interval[col].observe(now - self.last_arrival[col])
+            step = devtime - last
+            period = self.periods[col]
+            if step > period:     # timestamp가 줄어든 경우(sync 초기화)는 무시
+                self.gaps[col].inc()
+                self.missed[col].inc(step // period - 1)
+        self.last_time[col] = devtime
+        self.last_arrival[col] = now
+
+    def set_period(self, col : int, period_ms : int):
+        self.periods[col] = period_ms
+
+    # aligner 통계에서 늘어난 만큼 frame 계측값에 더함
+    def frames(self, aligner):
+        current = (aligner.completed, aligner.partial, aligner.evicted, aligner.late)
+        if current != tuple(self.seen):
+            for i in range(4):
+                self.results[i].inc(current[i] - self.seen[i])
+            self.seen = list(current)
+
+        # 시계 보정(GridAligner)을 쓰는 경우, 다시 추정했을 때만 반영
+        fits = getattr(aligner, "fits", 0)
+        if fits != self.fits:
+            self.fits = fits
+            for clock, drift, skew in zip(aligner.clocks, self.drift, self.skew):
+                drift.value = clock.drift_ppm
+                skew.value = clock.skew_ms
+            clock_resyncs.inc(aligner.resyncs - self.resyncs)
+            self.resyncs = aligner.resyncs
+
+        # 끊긴 sample 채움 (GridAligner)
+        gap_events = getattr(aligner, "gap_events", 0)
+        if gap_events != self.gap_events:
+            self.gap_events = gap_events
+            for c, (interpolated, missing) in enumerate(self.filled_seen):
+                self.interpolated[c].inc(aligner.interpolated[c] - interpolated)
+                self.missing[c].inc(aligner.missing[c] - missing)
+                self.filled_seen[c] = (aligner.interpolated[c], aligner.missing[c])
+
+
+# 모델 하나의 추론 계측 (InferenceWorker, 추론 결과 callback에서 사용)
+class ModelMeter:
+    def __init__(self, model : str):
+        self.time = inference_time.labels(model)
+        self.frame_latency = frame_latency.labels(model)
+        self.sensor_latency = sensor_latency.labels(model)
+        self.jobs = {result : inference_jobs.labels(model, result) for result in ("done", "dropped", "stale", "error")}
+        self.decisions = {how : inference_decisions.labels(model, how) for how in ("run", "skipped")}
+
+    # 추론 작업 결과. dropped는 event loop에서, 나머지는 추론 thread에서 더함
+    def job(self, result : str, seconds : float = None):
+        self.jobs[result].inc()
+        if seconds is not None:
+            self.time.observe(seconds)
+
+
+# event loop 지연 측정. 일정 주기로 깨어나서 예정보다 늦은 시간을 기록
+class LoopMonitor:
+    def __init__(self, interval : float = LOOP_INTERVAL_S):
+        self.interval = interval
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            loop_lag.observe(max(0.0, time.monotonic() - start - self.interval))
+
+
+# Prometheus text 형식을 다시 Registry로 (다른 process의 /metrics를 dump로 보기 위해)
+def parse(text : str) -> Registry:
+    registry = Registry()
+    kinds = dict()
+    hists = dict()  # [(이름, label tuple)] = [(경계, 누적 개수)], 합
+    for line in text.splitlines():
+        if line.startswith("# TYPE"):
+            _, _, name, kind = line.split()
+            kinds[name] = kind
+            continue
+        if not line or line.startswith("#"):
+            continue
+        sample, value = line.rsplit(" ", 1)
+        name, _, labels = sample.partition("{")
+        labels = {k : v.replace('\\"', '"').replace("\\\\", "\\") for k, v in LABEL.findall(labels)}
+        base = name.rsplit("_", 1)[0]
+        if kinds.get(base) == "histogram":
+            le = labels.pop("le", None)
+            hist = hists.setdefault((base, tuple(labels.items())), [[], 0.0])
+            if name.endswith("_bucket"):
+                hist[0].append((float(le), float(value)))
+            elif name.endswith("_sum"):
+                hist[1] = float(value)
+            continue
+        family = registry._add(kinds.get(name, "gauge"), name, "", tuple(labels.keys()),
+                               Counter if kinds.get(name) == "counter" else Gauge)
+        value = float(value)
+        family.labels(*labels.values()).value = int(value) if value.is_integer() else value
+
+    for (name, labels), (buckets, sum_) in hists.items():
+        bounds = tuple(bound for bound, _ in buckets if bound != math.inf)
+        family = registry.histogram(name, "", tuple(k for k, _ in labels), bounds)
+        child = family.labels(*(v for _, v in labels))
+        cumulative = [int(c) for _, c in buckets]
+        child.counts = [c - p for c, p in zip(cumulative, [0] + cumulative[:-1])]
+        child.count = cumulative[-1] if cumulative else 0
+        child.sum = sum_
+    return registry
+
+
+if __name__ == "__main__":
+    from urllib.request import urlopen
+    args = [arg for arg in sys.argv[1:] if arg != "--raw"]
+    url = args[0] if args else "http://localhost:8000/metrics"
+    text = urlopen(url).read().decode()
+    print(text if "--raw" in sys.argv else parse(text).dump())
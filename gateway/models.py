@@ -0,0 +1,211 @@
+# 머신러닝 모델 관리 코드
+# 운동자세별 모델/scaler를 한 번만 불러와 보관(LRU cache)하고,
+# 불러온 직후 더미 입력으로 한 번 추론해 두어(warm-up) 첫 추론이 느려지지 않게 한다.
+# 모델 파일이 바뀌면(mtime) 다음 요청 때 다시 불러온다.
+# 같은 이름의 .npz 파일(export_npz.py로 변환)이 있으면 sklearn/tensorflow 대신 NumPy로 추론한다.
+# (원래 파일이 .npz를 만든 뒤에 바뀌었으면 .npz를 쓰지 않고 원래 파일 사용)
+# sklearn/tensorflow는 import에만 수 초, 메모리 수백 MB가 들기 때문에
+# 실제로 그 backend의 모델을 불러올 때 처음 import 한다. (sklearn은 pickle.load 시 자동 import)
+
+import os
+import pickle
+import threading
+from collections import OrderedDict
+import numpy as np
+from npmodels import load_npz, npz_current
+
+MAX_BYTES = 256 * 1024 * 1024   # cache에 보관할 모델 크기 합의 상한 (파일 크기 기준 추정치)
+
+
+# 운동자세별 모델 정보
+class ExerciseSpec:
+    def __init__(self, style : str, modelfile : str, scalerfile : str, sampling_ms : int, timestep_num : int,
+                 sensors : list, window_ms : int = 0, decision_ms : int = 0):
+        self.style = style                  # svm / lstm
+        self.modelfile = modelfile
+        self.scalerfile = scalerfile
+        self.sampling_ms = sampling_ms      # 센서 sampling 주기
+        self.timestep_num = timestep_num    # 한 sequence(10초)의 frame 수
+        self.sensors = sensors              # 사용하는 센서 이름 (GUI/script.js와 같음)
+        # svm : window 특징(features.py)으로 학습한 모델이면 window 길이와 추론 주기. 0이면 frame마다 추론
+        self.window_ms = window_ms
+        self.decision_ms = decision_ms or sampling_ms
+        # sequence의 timestep개수와 sampling 주기 안 맞을 경우 Assert
+        assert sampling_ms * timestep_num == 10000
+
+EXERCISES = {
+    "neck"      : ExerciseSpec("svm",  "neck_2_m.pkl",    "neck_2_s.pkl",     50,  200, ["A", "F"]),
+    "shoulder"  : ExerciseSpec("lstm", "shoulder_m.h5",   "shoulder_s.pkl",   100, 100, ["C", "E", "F"]),
+    "hamstring" : ExerciseSpec("lstm", "hamstringl_m.h5", "hamstringl_s.pkl", 100, 100, ["F", "G", "H"]),
+    "bridge"    : ExerciseSpec("svm",  "bridge_m.pkl",    "bridge_s.pkl",     50,  200, ["A", "B", "C", "D", "E"]),
+}
+
+
+# 추론 backend
+# auto : 원래 파일에서 변환한 그대로인 .npz가 있으면 numpy, 없으면 sklearn/tensorflow
+# numpy : 항상 .npz 사용 (없으면 오류)
+# native : 항상 원래 파일(.pkl, .h5) 사용
+BACKEND = "auto"
+
+
+# 불러온 모델 하나
+class ModelEntry:
+    # timestep_num이 없으면 lstm 모델 파일 전체(load_model)를, 있으면 구조를 만들고 가중치만 불러옴
+    def __init__(self, style : str, modelpath : str, scalerpath : str, timestep_num : int = None,
+                 backend : str = BACKEND):
+        self.style = style
+        self.timestep_num = timestep_num
+
+        # numpy backend를 쓸 수 있으면 .npz 파일 경로로 바꿈
+        # 원래 파일도 계속 확인해서, 다시 학습한 파일로 바뀌면 다음 요청 때 원래 파일로 다시 불러옴
+        self.sources = (modelpath, scalerpath)
+        npz = [os.path.splitext(path)[0] + ".npz" for path in (modelpath, scalerpath)]
+        if backend == "numpy" or (backend == "auto" and all(npz_current(path, source)
+                                                            for path, source in zip(npz, self.sources))):
+            self.backend = "numpy"
+            modelpath, scalerpath = npz
+        else:
+            if backend == "auto" and any(os.path.exists(path) for path in npz):
+                print(".npz가 원래 모델 파일과 다름, 원래 파일 사용 (export_npz.py로 다시 변환):", self.sources[0])
+            self.backend = "native"
+        self.modelpath = modelpath
+        self.scalerpath = scalerpath
+        self.mtimes = self._mtimes()
+        self.nbytes = os.path.getsize(modelpath) + os.path.getsize(scalerpath)
+
+        if self.backend == "numpy":
+            self.scaler = load_npz(scalerpath)
+            self.model = load_npz(modelpath)
+            self.feature_num = len(self.scaler.mean_)
+            self.warmup()
+            return
+
+        with open(scalerpath, 'rb') as file:
+            self.scaler = pickle.load(file)
+        self.feature_num = len(self.scaler.mean_)
+
+        if style == "svm":
+            with open(modelpath, 'rb') as file:
+                self.model = pickle.load(file)
+        elif style == "lstm":
+            if timestep_num is None:
+                self.model = import_tf().keras.models.load_model(modelpath)
+            else:
+                self.model = build_lstm(timestep_num, self.feature_num)
+                self.model.load_weights(modelpath)
+        else:
+            raise Exception("model style err")
+
+        self.warmup()
+
+    # 더미 입력으로 한 번 추론. (TF graph tracing 등 첫 추론의 준비 작업을 미리 해둠)
+    def warmup(self):
+        if self.style == "svm":
+            self.model.predict(self.scaler.transform(np.zeros((1, self.feature_num))))
+        else:
+            timestep_num = self.timestep_num or self.model.input_shape[1]
+            self.model.predict(np.zeros((1, timestep_num, self.feature_num)), verbose=0)
+
+    # 파일이 바뀌었는지
+    def changed(self):
+        try:
+            return self._mtimes() != self.mtimes
+        except OSError: # 파일이 지워진 경우, 가지고 있는 것을 그대로 사용
+            return False
+
+    def _mtimes(self):
+        paths = (self.modelpath, self.scalerpath)
+        if self.backend == "numpy":
+            paths += tuple(path for path in self.sources if os.path.exists(path))
+        return tuple(os.path.getmtime(path) for path in paths)
+
+
+# 모델 보관소
+class ModelRegistry:
+    def __init__(self, model_dir : str = "./model", max_bytes : int = MAX_BYTES, backend : str = BACKEND):
+        self.model_dir = model_dir
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.cache = OrderedDict()      # (종류, 모델 경로, scaler 경로) -> ModelEntry. 최근 사용한 것이 뒤로
+        self.lock = threading.Lock()    # cache 접근용. 모델을 불러오는 동안에는 잡지 않음
+        self.loading = dict()           # key -> 불러오는 중인 모델의 lock (같은 모델을 두 번 불러오지 않도록)
+
+    # 운동자세 이름으로 모델 가져오기
+    def get(self, position : str) -> ModelEntry:
+        if position not in EXERCISES:
+            raise Exception("model style err")
+        spec = EXERCISES[position]
+        return self.load(spec.style,
+                         os.path.join(self.model_dir, spec.modelfile),
+                         os.path.join(self.model_dir, spec.scalerfile),
+                         spec.timestep_num)
+
+    # 파일 경로로 모델 가져오기. cache에 없거나 파일이 바뀐 경우에만 새로 불러옴
+    # 불러오는 동안에는 그 모델의 lock만 잡으므로, 다른 모델은 기다리지 않고 cache에서 가져갈 수 있음
+    def load(self, style : str, modelpath : str, scalerpath : str, timestep_num : int = None) -> ModelEntry:
+        key = (style, modelpath, scalerpath)
+        with self.lock:
+            entry = self._cached(key)
+            if entry is not None:
+                return entry
+            loading = self.loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self.lock:     # 기다리는 동안 다른 thread가 불러왔을 수 있음
+                entry = self._cached(key)
+                if entry is not None:
+                    return entry
+                if key in self.cache:
+                    print("모델 파일 변경됨, 다시 불러오기:", modelpath)
+            try:
+                entry = ModelEntry(style, modelpath, scalerpath, timestep_num, self.backend)
+            except Exception:
+                with self.lock:
+                    self.loading.pop(key, None)
+                raise
+            with self.lock:
+                self.cache[key] = entry
+                self.cache.move_to_end(key)
+                self.loading.pop(key, None)
+                self._evict()
+            return entry
+
+    # cache에 있고 파일이 바뀌지 않았으면 최근 사용으로 표시하고 리턴 (self.lock을 잡은 상태에서 호출)
+    def _cached(self, key):
+        entry = self.cache.get(key)
+        if entry is None or entry.changed():
+            return None
+        self.cache.move_to_end(key)
+        return entry
+
+    # 모든 운동자세의 모델을 미리 불러옴
+    def preload(self, positions=None):
+        for position in positions or EXERCISES.keys():
+            try:
+                self.get(position)
+            except Exception as e:
+                print("모델 미리 불러오기 실패:", position, e)
+
+    # 크기 상한을 넘으면 오래 사용하지 않은 모델부터 내보냄 (방금 쓴 것은 남김)
+    def _evict(self):
+        total = sum(entry.nbytes for entry in self.cache.values())
+        while total > self.max_bytes and len(self.cache) > 1:
+            _, entry = self.cache.popitem(last=False)
+            total -= entry.nbytes
+
+
+# tensorflow import (처음 한 번만 실제로 불러옴)
+def import_tf():
+    import tensorflow as tf
+    return tf
+
+# lstm 모델 구조 (학습 때 사용한 것과 동일)
+def build_lstm(timestep_num : int, feature_num : int):
+    tf = import_tf()
+    return tf.keras.Sequential([
+        tf.keras.layers.LSTM(units = 50, return_sequences = True, input_shape = (timestep_num, feature_num)),
+        tf.keras.layers.LSTM(units = 50),
+        tf.keras.layers.Dropout(0.1),
+        tf.keras.layers.Dense(50, activation = 'relu'),
+        tf.keras.layers.Dense(2, activation = 'softmax')
+    ])
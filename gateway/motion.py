@@ -0,0 +1,137 @@
+# 움직임 감지로 추론 건너뛰기 (motion gating)
+# 운동 중 자세를 유지하고 있는 시간이 길지만, 그동안에도 매 frame/window마다 모델을 호출하고 있었다.
+# frame에 이미 들어 있는 자이로 값으로 최근 window의 회전 에너지(RMS, deg/s)를 구해서,
+# 일정 시간 이상 움직임이 없으면 추론하지 않고 마지막 추론 결과를 그대로 사용한다.
+#   - 움직임이 다시 생기면 바로 추론 (한 frame이라도 기준을 넘으면 정지 시간을 다시 셈)
+#   - 정지 중이라도 max_skip_ms마다 한 번은 실제로 추론 (결과가 오래 고정되지 않도록)
+#   - 이전에 요청한 추론 결과가 아직 안 왔으면 건너뛰지 않음 (결과 순서 유지)
+#
+# 실행:
+# python gateway/motion.py neck dataset          (기록된 세션으로 절약 비율과 결과 일치율 확인)
+
+import argparse
+import numpy as np
+from imustream import AXES, AXIS_NUM
+
+MOTION_DPS = 3.0        # 이보다 회전 RMS(deg/s)가 작으면 정지로 봄 (센서 잡음 약 1deg/s)
+WINDOW_MS = 500         # 회전 에너지를 평균할 window
+REST_MS = 500           # 이만큼 계속 정지해 있어야 추론을 건너뜀
+MAX_SKIP_MS = 5000      # 정지 중이라도 이 시간마다 한 번은 추론
+
+GYRO = [i for i, axis in enumerate(AXES) if axis.startswith("g")]
+
+
+class MotionGate:
+    # width : frame 하나의 값 개수 (6 * 센서 수)
+    # meter : 추론/건너뜀 횟수를 기록할 metrics.ModelMeter (없으면 기록하지 않음)
+    def __init__(self, width : int, sampling_ms : int, threshold : float = MOTION_DPS, window_ms : int = WINDOW_MS,
+                 rest_ms : int = REST_MS, max_skip_ms : int = MAX_SKIP_MS, meter=None):
+        self.gyro = np.array([s * AXIS_NUM + i for s in range(width // AXIS_NUM) for i in GYRO])
+        self.threshold = threshold
+        self.limit = threshold * threshold          # 평균 제곱과 비교
+        self.size = max(1, window_ms // sampling_ms)
+        self.rest_frames = max(1, rest_ms // sampling_ms)
+        self.max_skip_frames = max(1, max_skip_ms // sampling_ms)
+        self.meter = meter
+
+        self.energy = np.zeros(self.size)   # frame별 자이로 평균 제곱 (원형 버퍼)
+        self.sum = 0.0
+        self.frame = 0          # 들어온 frame 수
+        self.still = 0          # 연속으로 정지해 있던 frame 수
+        self.last = None        # 마지막 실제 추론 결과
+        self.last_run = 0       # 마지막으로 실제 추론을 요청한 frame 번호
+        self.waiting = None     # 결과를 기다리는 추론의 frame 시간
+
+        # 통계
+        self.decisions = 0      # 추론 시점 수
+        self.skipped = 0        # 건너뛰고 마지막 결과를 사용한 수
+
+    # frame 하나 추가 (frame마다 호출)
+    def push(self, frame):
+        g = frame[self.gyro]
+        e = float(np.dot(g, g)) / len(g)
+        if e != e:      # NaN (끊긴 센서)은 움직임으로 봄
+            e = self.limit * self.size
+        pos = self.frame % self.size
+        self.sum += e - self.energy[pos]
+        self.energy[pos] = e
+        self.frame += 1
+        if pos == self.size - 1:    # 오차 누적 방지
+            self.sum = float(self.energy.sum())
+        self.still = self.still + 1 if self.sum / min(self.frame, self.size) < self.limit else 0
+
+    # 최근 window의 회전 RMS (deg/s)
+    def rms(self):
+        return (self.sum / max(1, min(self.frame, self.size))) ** 0.5
+
+    def moving(self):
+        return self.still < self.rest_frames
+
+    # 추론 시점마다 호출. 실제로 추론해야 하면 True, 건너뛰고 self.last를 쓰면 False
+    def allow(self, devtime) -> bool:
+        self.decisions += 1
+        if (not self.moving() and self.last is not None and self.waiting is None
+                and self.frame - self.last_run < self.max_skip_frames):
+            self.skipped += 1
+            if self.meter is not None:
+                self.meter.decisions["skipped"].inc()
+            return False
+        self.waiting = devtime
+        self.last_run = self.frame
+        if self.meter is not None:
+            self.meter.decisions["run"].inc()
+        return True
+
+    # 실제 추론 결과 기록. (추론 작업이 버려져도 다음 요청이 waiting을 바꾸므로 멈추지 않음)
+    def result(self, devtime, res):
+        self.last = res
+        if self.waiting is not None and devtime >= self.waiting:
+            self.waiting = None
+
+    # 건너뛴 비율
+    def saved(self):
+        return self.skipped / self.decisions if self.decisions else 0.0
+
+    def summary(self):
+        return {"decisions" : self.decisions, "skipped" : self.skipped, "saved" : round(self.saved(), 4),
+                "threshold_dps" : self.threshold}
+
+
+# 기록된 frame들(n, 6 * 센서 수)에서 추론 시점(idx)마다 실제로 추론할지. 결과는 바로 나온다고 봄
+# (실제로 추론할 위치 (w,) bool, 각 시점에 쓰일 결과의 추론 위치 (w,))
+def gate_offline(x, idx, sampling_ms : int, **kwargs):
+    gate = MotionGate(x.shape[1], sampling_ms, **kwargs)
+    run = np.zeros(len(idx), dtype=bool)
+    source = np.zeros(len(idx), dtype=np.int64)
+    k = 0
+    for i, frame in enumerate(x):
+        gate.push(frame)
+        while k < len(idx) and idx[k] == i:
+            run[k] = gate.allow(i)
+            if run[k]:
+                gate.result(i, k)
+            source[k] = gate.last
+            k += 1
+    return run, source
+
+
+if __name__ == "__main__":
+    from models import EXERCISES
+    from offline import score_session, find_sessions
+
+    parser = argparse.ArgumentParser(description="기록된 세션으로 motion gating 효과 확인")
+    parser.add_argument("position", choices=list(EXERCISES.keys()))
+    parser.add_argument("paths", nargs="+", help="세션 파일(.csv, .imuset, .imurec) 또는 폴더")
+    parser.add_argument("--threshold", type=float, default=MOTION_DPS, help="정지로 볼 회전 RMS(deg/s)")
+    args = parser.parse_args()
+
+    for path in find_sessions(args.paths):
+        full = score_session(path, args.position)
+        gated = score_session(path, args.position, gate={"threshold" : args.threshold})
+        if full["error"] or gated["error"]:
+            print(path, full["error"] or gated["error"])
+            continue
+        accuracy = "" if full["accuracy"] is None else ", 정확도 {:.1%} -> {:.1%}".format(full["accuracy"], gated["accuracy"])
+        print("{} : 추론 {}/{} ({:.1%} 절약), 결과 일치 {:.1%}{}".format(
+            path, gated["inferences"], gated["predictions"], 1 - gated["inferences"] / max(1, gated["predictions"]),
+            gated["agreement"] or 0.0, accuracy))
@@ -0,0 +1,190 @@
+# NumPy만으로 동작하는 추론 코드
+# export_npz.py로 만든 .npz 파일(StandardScaler, SVC, keras Sequential(LSTM/Dense))을 불러와
+# sklearn/tensorflow 없이 같은 결과를 계산한다.
+# sklearn/keras와 같은 이름의 함수(transform, predict)를 제공하므로 기존 코드에서 그대로 바꿔 쓸 수 있다.
+# .npz에는 변환한 원래 파일의 해시(source)를 같이 저장해서, 원래 파일이 바뀌었는지 확인할 수 있게 한다.
+
+import os
+import hashlib
+import numpy as np
+
+
+# StandardScaler
+class NumpyScaler:
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.n_features_in_ = len(mean)
+
+    def transform(self, x):
+        return (np.asarray(x, dtype=np.float64) - self.mean_) / self.scale_
+
+
+# SVC (one-vs-one, libsvm과 같은 방식)
+class NumpySVC:
+    def __init__(self, kernel, gamma, coef0, degree, support_vectors, dual_coef, intercept, n_support, classes):
+        self.kernel = kernel
+        self.gamma = gamma
+        self.coef0 = coef0
+        self.degree = degree
+        self.support_vectors_ = support_vectors
+        self.dual_coef_ = dual_coef
+        self.intercept_ = intercept
+        self.n_support_ = n_support
+        self.classes_ = classes
+        self.n_features_in_ = support_vectors.shape[1]
+        self.sv_sq = np.einsum('ij,ij->i', support_vectors, support_vectors)    # rbf 계산용 |sv|^2
+
+    # 입력(n x 특징) 과 support vector 사이의 kernel 값 (n x support vector 수)
+    def _kernel(self, x):
+        dot = x @ self.support_vectors_.T
+        if self.kernel == "linear":
+            return dot
+        if self.kernel == "rbf":
+            sq = np.einsum('ij,ij->i', x, x)[:, None] + self.sv_sq[None, :] - 2 * dot
+            return np.exp(-self.gamma * np.maximum(sq, 0))
+        if self.kernel == "poly":
+            return (self.gamma * dot + self.coef0) ** self.degree
+        if self.kernel == "sigmoid":
+            return np.tanh(self.gamma * dot + self.coef0)
+        raise Exception("지원하지 않는 kernel : " + self.kernel)
+
+    # 클래스 쌍 (0,1), (0,2), ... 마다의 decision 값 (n x 쌍 수)
+    def _pairwise(self, x):
+        k = self._kernel(np.asarray(x, dtype=np.float64))
+        n_class = len(self.classes_)
+        start = np.concatenate([[0], np.cumsum(self.n_support_)])
+        dec = np.empty((len(k), n_class * (n_class - 1) // 2))
+        p = 0
+        for i in range(n_class):
+            for j in range(i + 1, n_class):
+                si = slice(start[i], start[i + 1])
+                sj = slice(start[j], start[j + 1])
+                dec[:, p] = (k[:, si] @ self.dual_coef_[j - 1, si]
+                             + k[:, sj] @ self.dual_coef_[i, sj] + self.intercept_[p])
+                p += 1
+        return dec
+
+    # 2개 클래스인 경우 sklearn의 decision_function과 같은 값 (양수 : classes_[1])
+    def decision_function(self, x):
+        dec = self._pairwise(x)
+        return dec[:, 0] if len(self.classes_) == 2 else dec
+
+    def predict(self, x):
+        dec = self._pairwise(x)
+        n_class = len(self.classes_)
+        if n_class == 2:
+            # sklearn 공개 계수의 부호 기준 : 양수이면 두 번째 클래스
+            return self.classes_[(dec[:, 0] > 0).astype(int)]
+        # 다중 클래스 : 쌍마다 투표 (계수 부호가 libsvm 그대로이므로 양수이면 앞쪽 클래스)
+        votes = np.zeros((len(dec), n_class), dtype=np.int32)
+        p = 0
+        for i in range(n_class):
+            for j in range(i + 1, n_class):
+                win = np.where(dec[:, p] > 0, i, j)
+                votes[np.arange(len(dec)), win] += 1
+                p += 1
+        return self.classes_[votes.argmax(axis=1)]
+
+
+# 활성화 함수들
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+ACTIVATIONS = {
+    "linear"  : lambda x: x,
+    "relu"    : lambda x: np.maximum(x, 0),
+    "tanh"    : np.tanh,
+    "sigmoid" : sigmoid,
+    "softmax" : softmax,
+}
+
+
+# keras Sequential (LSTM, Dense 층만 지원. Dropout은 추론 시 아무것도 하지 않으므로 제외됨)
+class NumpySequential:
+    # layers : [(종류, 설정 dict, 가중치 list)]
+    def __init__(self, layers, input_shape):
+        self.layers = layers
+        self.input_shape = input_shape     # (None, timestep 수, 특징 수)
+
+    # keras model.predict와 같은 모양의 결과(n x 클래스 수, 확률). verbose는 호환용
+    def predict(self, x, verbose=0):
+        h = np.asarray(x, dtype=np.float32)
+        for kind, conf, weights in self.layers:
+            if kind == "lstm":
+                h = self._lstm(h, conf, *weights)
+            elif kind == "dense":
+                h = ACTIVATIONS[conf["activation"]](h @ weights[0] + weights[1])
+        return h
+
+    # LSTM 한 층. 게이트 순서는 keras와 같은 i, f, c, o
+    def _lstm(self, x, conf, kernel, recurrent, bias):
+        n, steps, _ = x.shape
+        units = recurrent.shape[0]
+        act = ACTIVATIONS[conf["activation"]]
+        rec_act = ACTIVATIONS[conf["recurrent_activation"]]
+
+        # 입력 쪽 계산은 모든 timestep을 한 번에 행렬곱
+        xw = x @ kernel + bias
+        h = np.zeros((n, units), dtype=np.float32)
+        c = np.zeros((n, units), dtype=np.float32)
+        outs = np.empty((n, steps, units), dtype=np.float32) if conf["return_sequences"] else None
+        for t in range(steps):
+            z = xw[:, t] + h @ recurrent
+            i = rec_act(z[:, :units])
+            f = rec_act(z[:, units:2 * units])
+            g = act(z[:, 2 * units:3 * units])
+            o = rec_act(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * act(c)
+            if outs is not None:
+                outs[:, t] = h
+        return outs if outs is not None else h
+
+
+# 파일 내용의 해시 (.npz를 만든 원래 파일인지 확인용)
+def file_digest(path : str):
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+# .npz를 만든 원래 파일의 해시. (해시 없이 만든 파일이면 None)
+def npz_source(path : str):
+    with np.load(path, allow_pickle=False) as f:
+        return str(f["source"]) if "source" in f.files else None
+
+# .npz가 원래 파일(source)에서 변환한 그대로인지. 원래 파일이 없으면 .npz를 그대로 사용
+def npz_current(path : str, source : str):
+    if not os.path.exists(path):
+        return False
+    if not os.path.exists(source):
+        return True
+    return npz_source(path) == file_digest(source)
+
+# .npz 파일 불러오기. 저장된 종류에 맞는 객체를 리턴
+def load_npz(path : str):
+    with np.load(path, allow_pickle=False) as f:
+        kind = str(f["kind"])
+        if kind == "scaler":
+            return NumpyScaler(f["mean"], f["scale"])
+        if kind == "svc":
+            return NumpySVC(str(f["kernel"]), float(f["gamma"]), float(f["coef0"]), int(f["degree"]),
+                            f["support_vectors"], f["dual_coef"], f["intercept"], f["n_support"], f["classes"])
+        if kind == "sequential":
+            layers = []
+            for i, layer in enumerate(f["layers"]):
+                layer = str(layer)
+                if layer == "lstm":
+                    conf = {"activation"          : str(f["%d_activation" % i]),
+                            "recurrent_activation": str(f["%d_recurrent_activation" % i]),
+                            "return_sequences"    : bool(f["%d_return_sequences" % i])}
+                    weights = [f["%d_kernel" % i], f["%d_recurrent_kernel" % i], f["%d_bias" % i]]
+                else:
+                    conf = {"activation" : str(f["%d_activation" % i])}
+                    weights = [f["%d_kernel" % i], f["%d_bias" % i]]
+                layers.append((layer, conf, weights))
+            return NumpySequential(layers, (None,) + tuple(int(v) for v in f["input_shape"]))
+        raise Exception("알 수 없는 모델 종류 : " + kind)
@@ -0,0 +1,218 @@
+# 기록된 측정 데이터로 모델 일괄 추론(offline scoring)
+# 실시간처럼 frame마다 추론하지 않고, 세션 전체를 한 번에 표준화한 뒤 큰 묶음(batch)으로 추론한다.
+# lstm의 sequence들은 stride trick(sliding_window_view)으로 복사 없이 만든다.
+# 세션이 많으면 process pool로 나눠서 처리하고, 각 process는 모델을 한 번만 불러온다.
+#
+# 실행:
+# python gateway/offline.py neck dataset                          (폴더 안의 모든 세션)
+# python gateway/offline.py bridge dataset/jh_bridge.csv --out result
+# python gateway/offline.py shoulder rec/ --sensors C E F --workers 8
+
+import os
+import sys
+import time
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from imustream import AXES
+from models import ModelRegistry, EXERCISES
+from clocksync import hold_missing
+from features import extract
+from motion import gate_offline
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GUI", "model")
+SESSION_EXTS = (".imuset", ".imurec", ".csv")   # 같은 이름이 여럿이면 앞의 것을 사용
+
+SVM_BATCH = 4096        # svm : 한 번에 추론할 frame 수
+LSTM_BATCH = 64         # lstm : 한 번에 추론할 sequence 수
+STRIDE_MS = 1000        # lstm 추론 주기 (실시간 predict_stride_ms와 같음)
+
+registry = None         # process마다 하나씩
+
+
+# -------- 세션 읽기 ----------#
+
+# 세션 파일에서 고른 센서의 값만 읽음. (시간 (n,), frame (n, 6*센서 수), label (n,) 또는 None)
+def read_session(path : str, names : list):
+    names = sorted(names)
+    cols = [name + axis for name in names for axis in AXES]
+
+    if path.endswith(".imuset"):
+        from imuset import load
+        dataset = load(path)
+        return dataset.ms, dataset.frames(names), dataset.target
+
+    if path.endswith(".imurec"):
+        from recorder import read_record
+        header, times, data = read_record(path)
+        header_cols = [name + axis for name in header["names"] for axis in AXES]
+        return times, data[:, [header_cols.index(col) for col in cols]], None
+
+    with open(path) as file:
+        header_cols = file.readline().strip().split(",")
+    missing = [col for col in cols if col not in header_cols]
+    if missing:
+        raise Exception("세션에 없는 열 : " + " ".join(missing))
+    usecols = [0] + [header_cols.index(col) for col in cols]
+    if "target" in header_cols:
+        usecols.append(header_cols.index("target"))
+    table = np.loadtxt(path, delimiter=",", skiprows=1, usecols=usecols, ndmin=2)
+    target = table[:, -1].astype(np.int32) if "target" in header_cols else None
+    return table[:, 0].astype(np.int32), table[:, 1:1 + len(cols)].astype(np.float32), target
+
+
+# 모델의 sampling 주기에 맞게 frame을 솎아냄 (예: 50ms로 기록한 세션을 100ms 모델에 사용)
+def resample(ms, x, target, sampling_ms : int):
+    if len(ms) < 2:
+        return ms, x, target
+    steps, counts = np.unique(np.diff(ms), return_counts=True)
+    step = int(steps[counts.argmax()])
+    if step == sampling_ms:
+        return ms, x, target
+    if sampling_ms % step:
+        raise Exception("세션 주기({}ms)로 모델 주기({}ms)를 만들 수 없음".format(step, sampling_ms))
+    keep = (ms - ms[0]) % sampling_ms == 0
+    return ms[keep], x[keep], None if target is None else target[keep]
+
+
+# -------- 추론 ----------#
+
+# svm : frame마다 추론. 결과 (n,)
+def score_svm(entry, x):
+    return np.concatenate([entry.model.predict(entry.scaler.transform(x[i:i + SVM_BATCH]))
+                           for i in range(0, len(x), SVM_BATCH)] or [np.zeros(0)])
+
+# lstm : stride frame마다 최근 timestep_num frame으로 추론. (결과 (w,), 각 sequence 마지막 frame의 위치 (w,))
+def score_lstm(entry, x, timestep_num : int, stride : int):
+    if len(x) < timestep_num:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    std = entry.scaler.transform(x).astype(np.float32)
+    # (w, 센서값, timestep) view -> (w, timestep, 센서값) view
+    windows = sliding_window_view(std, timestep_num, axis=0)[::stride].transpose(0, 2, 1)
+    preds = [entry.model.predict(np.ascontiguousarray(windows[i:i + LSTM_BATCH]), verbose=0).argmax(axis=1)
+             for i in range(0, len(windows), LSTM_BATCH)]
+    return np.concatenate(preds), np.arange(len(windows)) * stride + timestep_num - 1
+
+
+def get_entry(position : str, model_dir : str):
+    global registry
+    if registry is None or registry.model_dir != model_dir:
+        registry = ModelRegistry(model_dir)
+    return registry.get(position)
+
+
+# 세션 하나 추론. 결과 요약(dict)을 리턴하고, out_dir이 있으면 시간별 결과를 CSV(ms,predict[,target])로 저장
+# gate : motion gating(motion.MotionGate의 설정 dict)을 적용했을 때의 결과로 바꿈. 정지 구간은 마지막 결과를 사용
+#        (효과 확인용이므로 추론은 모두 한 뒤 건너뛸 결과를 바꿈. inferences : 실시간이었다면 실제로 추론했을 수)
+def score_session(path : str, position : str, model_dir : str = MODEL_DIR, names : list = None, out_dir : str = None,
+                  gate : dict = None):
+    summary = {"path" : path, "frames" : 0, "predictions" : 0, "inferences" : 0, "seconds" : 0.0, "accuracy" : None,
+               "agreement" : None, "error" : None}
+    try:
+        spec = EXERCISES[position]
+        entry = get_entry(position, model_dir)
+        start = time.perf_counter()
+
+        ms, x, target = read_session(path, names or spec.sensors)
+        ms, x, target = resample(ms, x, target, spec.sampling_ms)
+        x = hold_missing(x)     # 기록 중 오래 끊긴 값(NaN)은 실시간 추론처럼 끊기기 전 값으로
+        if entry.style == "svm" and spec.window_ms:     # window 특징 (실시간과 같은 RollingFeatures)
+            idx, feats = extract(x, spec.window_ms // spec.sampling_ms, max(1, spec.decision_ms // spec.sampling_ms))
+            preds = score_svm(entry, feats)
+        elif entry.style == "svm":
+            preds = score_svm(entry, x)
+            idx = np.arange(len(preds))
+        else:
+            preds, idx = score_lstm(entry, x, spec.timestep_num, max(1, STRIDE_MS // spec.sampling_ms))
+        preds = preds.astype(np.int32)
+        summary["inferences"] = len(preds)
+        if gate is not None:
+            run, source = gate_offline(x, idx, spec.sampling_ms, **gate)
+            gated = preds[source]
+            summary["inferences"] = int(run.sum())
+            summary["agreement"] = float((gated == preds).mean()) if len(preds) else None
+            preds = gated
+
+        summary["seconds"] = time.perf_counter() - start
+        summary["frames"] = len(x)
+        summary["predictions"] = len(preds)
+        if target is not None and len(preds):
+            summary["accuracy"] = float((preds == target[idx]).mean())
+
+        if out_dir is not None:
+            os.makedirs(out_dir, exist_ok=True)
+            out = os.path.join(out_dir, "{}.{}.csv".format(os.path.splitext(os.path.basename(path))[0], position))
+            columns = [ms[idx], preds] + ([target[idx]] if target is not None else [])
+            np.savetxt(out, np.column_stack(columns), fmt="%d", delimiter=",", comments="",
+                       header="ms,predict" + (",target" if target is not None else ""))
+            summary["out"] = out
+
+    except Exception as e:
+        summary["error"] = "{}: {}".format(type(e).__name__, e)
+    return summary
+
+
+# 여러 세션 추론. workers가 1이거나 세션이 하나면 현재 process에서, 아니면 process pool에서 수행
+def score_many(paths : list, position : str, workers : int = None, model_dir : str = MODEL_DIR,
+               names : list = None, out_dir : str = None):
+    func = partial(score_session, position=position, model_dir=model_dir, names=names, out_dir=out_dir)
+    workers = workers or os.cpu_count()
+    if not paths:
+        return []
+    if workers == 1 or len(paths) == 1:
+        return [func(path) for path in paths]
+    with ProcessPoolExecutor(min(workers, len(paths))) as pool:
+        return list(pool.map(func, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+
+# 폴더는 안의 세션 파일들로 펼침. 같은 이름의 파일이 여러 형식으로 있으면 하나만 사용
+def find_sessions(targets : list):
+    paths = []
+    for target in targets:
+        if not os.path.isdir(target):
+            paths.append(target)
+            continue
+        found = dict()
+        for name in sorted(os.listdir(target)):
+            stem, ext = os.path.splitext(name)
+            if ext in SESSION_EXTS and (stem not in found or SESSION_EXTS.index(ext) < SESSION_EXTS.index(found[stem][0])):
+                found[stem] = (ext, os.path.join(target, name))
+        paths += [path for _, path in sorted(found.values(), key=lambda v: v[1])]
+    return paths
+
+
+# 결과 요약 출력
+def print_summaries(summaries : list, elapsed : float):
+    for s in summaries:
+        if s["error"]:
+            print("\t{} : 실패 ({})".format(s["path"], s["error"]))
+            continue
+        print("\t{} : {} frame, 추론 {}회, {:.3f}s{}".format(
+            s["path"], s["frames"], s["predictions"], s["seconds"],
+            "" if s["accuracy"] is None else ", 정확도 {:.3f}".format(s["accuracy"])))
+    frames = sum(s["frames"] for s in summaries)
+    predictions = sum(s["predictions"] for s in summaries)
+    print("세션 {}개, {} frame, 추론 {}회, {:.2f}s ({:.0f} frame/s, {:.0f} 추론/s)".format(
+        len(summaries), frames, predictions, elapsed, frames / max(elapsed, 1e-9), predictions / max(elapsed, 1e-9)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="기록된 세션 일괄 추론")
+    parser.add_argument("position", choices=list(EXERCISES.keys()))
+    parser.add_argument("paths", nargs="+", help="세션 파일(.csv, .imuset, .imurec) 또는 폴더")
+    parser.add_argument("--sensors", nargs="+", help="사용할 센서 이름 (기본: 운동자세별 센서)")
+    parser.add_argument("--workers", type=int, default=None, help="process 수 (기본: CPU 수)")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--out", default=None, help="시간별 결과 CSV를 저장할 폴더")
+    args = parser.parse_args()
+
+    paths = find_sessions(args.paths)
+    if not paths:
+        print("세션 파일이 없음")
+        sys.exit(1)
+    start = time.perf_counter()
+    summaries = score_many(paths, args.position, args.workers, args.model_dir, args.sensors, args.out)
+    print_summaries(summaries, time.perf_counter() - start)
+    sys.exit(1 if any(s["error"] for s in summaries) else 0)
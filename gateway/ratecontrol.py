@@ -0,0 +1,156 @@
+# 센서별 sampling rate 조절 (명령 2)
+# 지금까지는 세션을 시작할 때 운동자세의 sampling 주기(50ms, 100ms)로 한 번 정하고 끝까지 그대로였다.
+# 센서가 많으면 움직이지 않는 센서도 계속 같은 주기로 보내서 BLE 대역과 게이트웨이 CPU를 쓴다.
+# 여기서는 센서마다 자이로 회전 RMS(motion.py의 MotionGate)를 보고
+#   - 움직이는 센서는 바로 모델의 주기(fast_ms)로 올리고
+#   - slow_after_ms 이상 움직이지 않은 센서는 느린 주기(slow_ms)로 내린다. (내리는 것은 hold_s마다 한 번까지)
+# 주기를 바꾼 뒤에는 모든 센서의 timestamp를 함께 초기화(명령 1)해서 센서들이 같은 시각에 측정하게 한다.
+# frame은 GridAligner(clocksync.py)가 계속 모델의 주기 격자에서 보간해서 만들므로, 추론 입력의 주기는 바뀌지 않는다.
+# (같은 timestamp끼리 묶는 FrameAligner에서는 사용할 수 없음)
+#
+# 사용:
+#   controller = RateController(names, sampling_ms, aligner=aligner, meter=meter)
+#   controller.start(clients)     # 센서 연결, timestamp 초기화 후
+#   controller.push(frame)        # frame마다 (event loop에서)
+#   controller.summary()
+
+import time
+import asyncio
+from bleconn import send_all, command
+from imustream import AXIS_NUM
+from motion import MotionGate, MOTION_DPS
+from metrics import sampling_period, rate_switches
+
+SLOW_MS = 200           # 움직이지 않는 센서의 sampling 주기
+SLOW_AFTER_MS = 2000    # 이만큼 계속 움직이지 않으면 주기를 내림
+HOLD_S = 3.0            # 주기를 내리는 변경 사이의 최소 간격 (올리는 것은 바로). 명령이 실패했을 때의 재시도 간격
+
+
+class RateController:
+    # names : 센서 이름 (frame의 열 순서), fast_ms : 모델의 sampling 주기 (frame 격자 간격)
+    # aligner, meter : 센서별 주기를 알려줄 GridAligner, StreamMeter (없으면 생략)
+    def __init__(self, names : list, fast_ms : int, slow_ms : int = SLOW_MS, threshold : float = MOTION_DPS,
+                 slow_after_ms : int = SLOW_AFTER_MS, hold_s : float = HOLD_S, aligner=None, meter=None):
+        self.names = names
+        self.fast_ms = fast_ms
+        self.slow_ms = max(slow_ms, fast_ms)
+        self.hold = hold_s
+        self.aligner = aligner
+        self.meter = meter
+        # 센서별 움직임 (frame의 해당 센서 6개 값만)
+        self.gates = [MotionGate(AXIS_NUM, fast_ms, threshold, rest_ms=slow_after_ms) for _ in names]
+        self.rates = [fast_ms] * len(names)     # 센서별 지금의 주기
+        self.gauges = [sampling_period.labels(name) for name in names]
+        for gauge in self.gauges:
+            gauge.set(fast_ms)
+
+        self.clients = []           # 연결된 센서 (names와 같은 순서). 비어 있으면 조절하지 않음
+        self.task = None            # 진행 중인 변경
+        self.last_switch = 0.0      # 마지막 변경 시각 (monotonic)
+        self.retry_at = 0.0         # 명령 실패 후 다시 시도할 시각
+
+        # 통계
+        self.switches = 0           # 성공한 변경 수
+        self.failures = 0           # 실패한 변경 수
+        self.started = None
+        self.stopped = None
+        self.since = [0.0] * len(names)         # 센서별 지금 주기가 시작된 시각
+        self.slow_time = [0.0] * len(names)     # 센서별 느린 주기로 보낸 시간(초)
+        self.packets = [0.0] * len(names)       # 센서별 보냈을 패킷 수 (추정)
+
+    # 조절 시작. clients : names와 같은 순서의 BleakClient 리스트 (모두 fast_ms로 설정된 상태)
+    def start(self, clients : list, now : float = None):
+        now = time.monotonic() if now is None else now
+        self.clients = clients
+        self.started = now
+        self.last_switch = now
+        self.since = [now] * len(self.names)
+
+    # 조절 종료. 진행 중인 변경은 취소
+    def stop(self):
+        if self.started is not None and self.stopped is None:
+            self.stopped = time.monotonic()
+        self.clients = []
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    # frame 하나 추가. 센서별 움직임이 지금 주기와 맞지 않으면 변경을 시작 (기다리지 않음)
+    def push(self, frame, now : float = None):
+        for c, gate in enumerate(self.gates):
+            gate.push(frame[c * AXIS_NUM:(c + 1) * AXIS_NUM])
+        if not self.clients or (self.task is not None and not self.task.done()):
+            return
+        now = time.monotonic() if now is None else now
+        if now < self.retry_at:
+            return
+        want = [self.fast_ms if gate.moving() else self.slow_ms for gate in self.gates]
+        if want == self.rates:
+            return
+        faster = any(w < r for w, r in zip(want, self.rates))
+        if not faster and now - self.last_switch < self.hold:
+            return
+        self.task = asyncio.get_running_loop().create_task(self.apply(want))
+
+    # 센서별 주기 변경 + 모든 센서 timestamp 초기화
+    async def apply(self, want : list):
+        changed = [c for c in range(len(self.names)) if want[c] != self.rates[c]]
+        # 바뀌는 동안은 두 주기 중 긴 쪽으로 끊김을 판단 (이전 주기의 패킷이 아직 올 수 있음)
+        for c in changed:
+            self._set_period(c, max(want[c], self.rates[c]))
+
+        groups = dict()     # [새 주기] = 센서 열 번호들
+        for c in changed:
+            groups.setdefault(want[c], []).append(c)
+        results = await asyncio.gather(*(send_all([self.clients[c] for c in cols], command(2, rate))
+                                         for rate, cols in groups.items()))
+        errors = [error for result in results for _, error in result if error is not None]
+        if not errors:
+            errors = [error for _, error in await send_all(self.clients, command(1)) if error is not None]
+
+        now = time.monotonic()
+        self.last_switch = now
+        if errors:  # 센서의 주기를 알 수 없으므로 긴 쪽으로 두고 나중에 다시 시도
+            self.failures += 1
+            self.retry_at = now + self.hold
+            rate_switches.labels("failed").inc()
+            print("sampling rate 변경 실패 :", errors[0])
+            return
+
+        for c in changed:
+            self._account(c, now)
+            self.rates[c] = want[c]
+            self._set_period(c, want[c])
+        self.switches += 1
+        rate_switches.labels("ok").inc()
+
+    def _set_period(self, c : int, period_ms : int):
+        if self.aligner is not None and hasattr(self.aligner, "set_period"):
+            self.aligner.set_period(c, period_ms)
+        if self.meter is not None:
+            self.meter.set_period(c, period_ms)
+        self.gauges[c].set(period_ms)
+
+    # 센서 c가 지금 주기로 보낸 시간을 통계에 더함
+    def _account(self, c : int, now : float):
+        elapsed = now - self.since[c]
+        if self.rates[c] != self.fast_ms:
+            self.slow_time[c] += elapsed
+        self.packets[c] += elapsed * 1000 / self.rates[c]
+        self.since[c] = now
+
+    # 통계. packets_saved : 모든 센서를 fast_ms로 보냈을 때보다 줄어든 패킷 비율 (추정)
+    def summary(self, now : float = None):
+        now = self.stopped or (time.monotonic() if now is None else now)
+        if self.started is None:
+            return {"switches" : 0, "failures" : 0, "rates_ms" : dict(zip(self.names, self.rates)),
+                    "slow_fraction" : None, "packets_saved" : 0.0}
+        for c in range(len(self.names)):
+            self._account(c, now)
+        total = max(1e-9, now - self.started)
+        full = total * 1000 / self.fast_ms * len(self.names)
+        return {"switches"      : self.switches,
+                "failures"      : self.failures,
+                "rates_ms"      : dict(zip(self.names, self.rates)),
+                "slow_fraction" : {name : round(t / total, 3) for name, t in zip(self.names, self.slow_time)},
+                "packets_saved" : round(max(0.0, 1 - sum(self.packets) / full), 4)}
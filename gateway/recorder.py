@@ -0,0 +1,169 @@
+# 측정 기록 저장 코드
+# frame이 만들어질 때마다 메모리에 모아두지 않고, 일정 개수(chunk)씩 바로 파일 끝에 이어 쓴다(append only).
+# 주기적으로 fsync 해서 전원이 갑자기 꺼져도 마지막 몇 초를 제외한 기록은 남는다.
+# 파일이 중간에 끊긴 경우에는 마지막으로 온전한 chunk까지만 남기고 잘라내서(recover) 다시 읽을 수 있다.
+# 측정이 끝나면 기존과 같은 CSV(ms,Aax,...) 형식으로 내보낸다.
+#
+# 파일 구조:
+#   MAGIC(8) + 헤더 길이(uint32) + 헤더(JSON: 센서 이름, sampling 주기 등)
+#   chunk 반복 : CHUNK_MAGIC(4) + frame 수(uint32) + crc32(uint32) + frame들
+#   frame : devtime(int32) + 센서값(float32 * 6 * 센서 수)
+#
+# 실행:
+# python gateway/recorder.py export 20230101_120000sensor.imurec   (CSV로 내보내기)
+# python gateway/recorder.py recover 20230101_120000sensor.imurec  (끊긴 파일 복구)
+
+import os
+import sys
+import csv
+import json
+import time
+import struct
+import zlib
+import threading
+import numpy as np
+from imustream import AXIS_NUM, make_header
+
+MAGIC = b"IMUREC1\n"
+CHUNK_MAGIC = b"CHNK"
+CHUNK_HEAD = struct.Struct("<4sII")     # CHUNK_MAGIC, frame 수, crc32
+
+CHUNK_FRAMES = 256      # 한 번에 쓰는 최대 frame 수 (메모리에 들고 있는 최대 frame 수)
+FLUSH_S = 1.0           # chunk가 다 차지 않아도 이 시간(초)이 지나면 파일에 씀
+FSYNC_S = 5.0           # fsync 주기(초)
+
+
+# frame 하나의 dtype
+def frame_dtype(sensor_num : int):
+    return np.dtype([('time', '<i4'), ('data', '<f4', (sensor_num * AXIS_NUM,))])
+
+
+# 측정 기록 파일 쓰기
+class Recorder:
+    def __init__(self, path : str, names : list, sampling_ms : int,
+                 chunk_frames : int = CHUNK_FRAMES, flush_s : float = FLUSH_S, fsync_s : float = FSYNC_S):
+        self.path = path
+        self.names = sorted(names)      # frame의 열 순서와 같은 이름순
+        self.flush_s = flush_s
+        self.fsync_s = fsync_s
+        self.count = 0                  # 지금까지 받은 frame 수
+
+        self.buffer = np.zeros(chunk_frames, dtype=frame_dtype(len(self.names)))
+        self.filled = 0                 # buffer에 쓰여지길 기다리는 frame 수
+        self.last_flush = time.monotonic()
+        self.last_fsync = time.monotonic()
+        self.syncing = None             # 진행 중인 fsync thread
+
+        header = json.dumps({"names"       : self.names,
+                             "sampling_ms" : sampling_ms,
+                             "axis_num"    : AXIS_NUM,
+                             "created"     : time.time()}).encode()
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    # frame 하나 추가
+    def append(self, devtime : int, row):
+        self.buffer[self.filled] = (devtime, row)
+        self.filled += 1
+        self.count += 1
+        if self.filled == len(self.buffer) or time.monotonic() - self.last_flush >= self.flush_s:
+            self.flush()
+
+    # 모아둔 frame을 chunk 하나로 파일에 씀. fsync 주기가 되었으면 fsync (force면 바로, 끝날 때까지 기다림)
+    def flush(self, force : bool = False):
+        if self.filled:
+            body = self.buffer[:self.filled].tobytes()
+            self.file.write(CHUNK_HEAD.pack(CHUNK_MAGIC, self.filled, zlib.crc32(body)) + body)
+            self.file.flush()
+            self.filled = 0
+        self.last_flush = time.monotonic()
+
+        if force:
+            if self.syncing is not None:
+                self.syncing.join()
+            os.fsync(self.file.fileno())
+            self.last_fsync = time.monotonic()
+        elif time.monotonic() - self.last_fsync >= self.fsync_s:
+            # SD카드 등에서는 fsync가 오래 걸릴 수 있어서 별도 thread에서 수행 (이전 것이 진행 중이면 다음에)
+            if self.syncing is None or not self.syncing.is_alive():
+                self.syncing = threading.Thread(target=os.fsync, args=(self.file.fileno(),), daemon=True)
+                self.syncing.start()
+                self.last_fsync = time.monotonic()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush(force=True)
+        self.file.close()
+
+
+# 파일 헤더 읽기. (헤더, 첫 chunk 시작 위치)를 리턴
+def read_header(file):
+    if file.read(len(MAGIC)) != MAGIC:
+        raise Exception("측정 기록 파일이 아님")
+    size, = struct.unpack("<I", file.read(4))
+    header = json.loads(file.read(size))
+    return header, len(MAGIC) + 4 + size
+
+
+# 온전한 chunk들을 순서대로 읽음. (헤더, chunk 배열 리스트, 온전한 부분의 끝 위치)를 리턴
+def read_chunks(path : str):
+    with open(path, "rb") as file:
+        header, end = read_header(file)
+        dtype = frame_dtype(len(header["names"]))
+        chunks = []
+        while True:
+            head = file.read(CHUNK_HEAD.size)
+            if len(head) < CHUNK_HEAD.size:
+                break
+            magic, num, crc = CHUNK_HEAD.unpack(head)
+            body = file.read(num * dtype.itemsize)
+            # 쓰다가 끊긴 chunk (길이 부족, 0으로 채워진 부분, 내용 손상)
+            if magic != CHUNK_MAGIC or len(body) < num * dtype.itemsize or zlib.crc32(body) != crc:
+                break
+            chunks.append(np.frombuffer(body, dtype=dtype))
+            end = file.tell()
+    return header, chunks, end
+
+
+# 측정 기록 읽기. (헤더, 시간 (n,), 센서값 (n, 6*센서 수))를 리턴
+def read_record(path : str):
+    header, chunks, _ = read_chunks(path)
+    frames = np.concatenate(chunks) if chunks else np.zeros(0, dtype=frame_dtype(len(header["names"])))
+    return header, frames['time'], frames['data']
+
+
+# 중간에 끊긴 파일을 마지막으로 온전한 chunk까지만 남기고 잘라냄. 남은 frame 수를 리턴
+def recover(path : str):
+    _, chunks, end = read_chunks(path)
+    if os.path.getsize(path) > end:
+        print("끊긴 부분 잘라냄 : {} ({} bytes)".format(path, os.path.getsize(path) - end))
+        with open(path, "r+b") as file:
+            file.truncate(end)
+            os.fsync(file.fileno())
+    return sum(len(chunk) for chunk in chunks)
+
+
+# 기존 CSV 형식(ms,Aax,...)으로 내보내기
+def export_csv(path : str, csvpath : str = None):
+    csvpath = csvpath or os.path.splitext(path)[0] + ".csv"
+    header, chunks, _ = read_chunks(path)
+    with open(csvpath, "w", newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(make_header(header["names"]))
+        for chunk in chunks:
+            for devtime, row in zip(chunk['time'].tolist(), chunk['data'].tolist()):
+                writer.writerow([devtime] + row)
+    return csvpath
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("export", "recover"):
+        print("사용법: python gateway/recorder.py export|recover 파일.imurec [저장할.csv]")
+        sys.exit(1)
+    if sys.argv[1] == "recover":
+        print("{} frame 복구됨".format(recover(sys.argv[2])))
+    else:
+        print("저장됨 :", export_csv(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None))
@@ -0,0 +1,81 @@
+# 백그라운드 BLE 센서 검색 코드
+# BleakScanner 하나를 계속 켜두고, 광고(advertisement)를 받을 때마다
+# 센서별 마지막으로 보인 시각과 RSSI를 기록해 둔다(presence cache).
+# 목록 확인은 기록만 보고 바로 답하고, 직접 검색할 때는 찾는 센서가 모두 보이면 바로 끝낸다.
+
+import asyncio
+import time
+from bleak import BleakScanner
+
+PRESENCE_TTL = 5.0      # 이 시간(초) 안에 광고가 보였으면 online으로 판단
+SCAN_MAX_WAIT = 2.0     # 직접 검색할 때 최대 대기 시간(초)
+
+
+class PresenceScanner:
+    def __init__(self, ttl : float = PRESENCE_TTL):
+        self.ttl = ttl
+        self.scanner = None
+        self.running = False
+        self.presence = dict()      # [주소] = (마지막으로 보인 시각, RSSI)
+        self.waiters = []           # 직접 검색 중인 요청들 (찾는 주소 set, event)
+
+    # 광고를 받을 때마다 호출됨
+    def _detected(self, device, adv):
+        self.presence[device.address] = (time.monotonic(), adv.rssi)
+        for addrs, event in self.waiters:
+            if device.address in addrs:
+                event.set()
+
+    # since 이후에 광고가 보였는지 (리스트, addrs와 같은 순서)
+    def _seen(self, addrs, since):
+        return [addr in self.presence and self.presence[addr][0] >= since for addr in addrs]
+
+    # 백그라운드 검색 시작
+    async def start(self):
+        if self.running:
+            return
+        self.scanner = BleakScanner(detection_callback=self._detected)
+        await self.scanner.start()
+        self.running = True
+
+    # 백그라운드 검색 정지 (센서와 연결하는 동안에는 검색을 멈추는 것이 안정적)
+    async def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        await self.scanner.stop()
+
+    # 기록만 보고 센서들의 online 여부를 바로 리턴 (ttl초 안에 보였는지)
+    def online(self, addrs : list, ttl : float = None):
+        return self._seen(addrs, time.monotonic() - (self.ttl if ttl is None else ttl))
+
+    # 센서의 마지막 RSSI (본 적 없으면 None)
+    def rssi(self, addr : str):
+        return self.presence[addr][1] if addr in self.presence else None
+
+    # 직접 검색. addrs가 모두 보이면 바로, 아니면 최대 max_wait초 후 online 여부를 리턴
+    # fresh가 True면 검색을 시작한 뒤 받은 광고만 인정, False면 ttl 안의 기록도 인정
+    async def scan(self, addrs : list, max_wait : float = SCAN_MAX_WAIT, fresh : bool = True):
+        start = time.monotonic()
+        since = start if fresh else start - self.ttl
+
+        was_running = self.running
+        await self.start()
+        event = asyncio.Event()
+        waiter = (set(addrs), event)
+        self.waiters.append(waiter)
+        try:
+            while not all(self._seen(addrs, since)):
+                remain = start + max_wait - time.monotonic()
+                if remain <= 0:
+                    break
+                event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), remain)
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            self.waiters.remove(waiter)
+            if not was_running:    # 백그라운드 검색 중이 아니었다면 원래대로 정지
+                await self.stop()
+        return self._seen(addrs, since)
@@ -0,0 +1,295 @@
+# 센서 조합(subset) 탐색
+# 운동자세마다 필요한 센서(모듈) 수를 줄이기 위해, 센서 조합마다 svm 모델을 학습/교차검증해서
+# 센서 수별 정확도와 추론 비용을 비교한다. (dataset/의 CSV에는 A~J 10개 센서가 모두 기록되어 있음)
+#   - fold는 세션 단위로 나눔 (세션이 하나면 시간 구간 단위). 인접 frame이 학습과 검증에 같이 들어가지 않도록
+#   - 센서별 전처리 결과(frame 값 또는 window 특징)는 process마다 한 번만 만들고, 조합의 행렬은 이를 이어 붙여 cache
+#   - 조합 수가 많으므로 greedy(최고 조합에 한 개씩 추가) 또는 beam(상위 beam개 조합만 확장)으로 줄이고,
+#     같은 크기의 조합들은 process pool에서 나눠 평가
+#   - 결과 : 센서 수별 최고 조합의 정확도와 추론 비용(support vector 수, frame당 추론 시간)
+#            --out이면 평가한 모든 조합을 CSV로, --cache면 평가 결과를 저장해 두고 다음 실행에서 다시 사용
+# 모델은 GUI/model의 svm과 같은 구성(StandardScaler + SVC(C=10, rbf))으로 학습한다.
+#
+# 실행:
+# python gateway/subsets.py neck dataset/jh_head1.csv dataset/jh_head2.csv
+# python gateway/subsets.py bridge dataset/jh_bridge.csv dataset/hgs_bridge_2.csv dataset/hgs_bridge_3.csv --search beam --beam 3
+# python gateway/subsets.py bridge dataset/*bridge* --window-ms 1000 --decision-ms 250 --out bridge_subsets.csv
+
+import os
+import sys
+import time
+import json
+import argparse
+from itertools import combinations
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from imustream import AXES, AXIS_NUM
+from models import EXERCISES
+from offline import read_session, resample, find_sessions
+from clocksync import hold_missing
+from features import extract, STATS
+
+SVM_PARAMS = {"C" : 10, "kernel" : "rbf", "gamma" : "scale", "random_state" : 42}
+FOLDS = 3               # 세션이 하나일 때 시간 구간 fold 수
+MAX_TRAIN = 3000        # fold 하나의 학습에 사용할 최대 행 수 (넘으면 일정 간격으로 솎아냄)
+CACHE_SUBSETS = 32      # process마다 보관할 조합 행렬 수
+TIMING_ROWS = 256       # 추론 시간 측정에 사용할 행 수
+
+data = None             # process마다 하나씩 (init_worker)
+
+
+# -------- 데이터 ----------#
+
+# 세션 파일에 기록된 센서 이름들
+def session_sensors(path : str):
+    if path.endswith(".imuset"):
+        from imuset import load
+        return sorted(load(path).names)
+    if path.endswith(".imurec"):
+        from recorder import read_record
+        return sorted(read_record(path)[0]["names"])
+    with open(path) as file:
+        cols = file.readline().strip().split(",")
+    return sorted(col[:-len(AXES[0])] for col in cols if col.endswith(AXES[0]))
+
+
+# 세션들을 센서별로 전처리해 두고, 조합의 행렬을 만들어 줌
+class SubsetData:
+    # window_ms가 0이면 frame 값, 아니면 features.py의 window 특징 (decision_ms마다)
+    def __init__(self, paths : list, position : str, candidates : list, window_ms : int = 0, decision_ms : int = 0,
+                 folds : int = FOLDS):
+        spec = EXERCISES[position]
+        self.window_ms = window_ms
+        blocks = {name : [] for name in candidates}
+        targets = []
+        for path in paths:
+            ms, x, target = read_session(path, candidates)
+            ms, x, target = resample(ms, x, target, spec.sampling_ms)
+            if target is None:
+                raise Exception("label(target)이 없는 세션 : " + path)
+            x = hold_missing(x)
+            idx = np.arange(len(x))
+            for i, name in enumerate(sorted(candidates)):
+                cols = x[:, i * AXIS_NUM:(i + 1) * AXIS_NUM]
+                if window_ms:   # 특징은 센서마다 독립이므로 센서별로 구해도 전체와 같음
+                    idx, cols = extract(cols, window_ms // spec.sampling_ms,
+                                        max(1, (decision_ms or spec.sampling_ms) // spec.sampling_ms))
+                blocks[name].append(cols.astype(np.float32))
+            targets.append(target[idx])
+
+        # fold 번호 : 세션이 여럿이면 세션, 하나면 시간 구간
+        if len(paths) > 1:
+            self.groups = np.concatenate([np.full(len(t), i) for i, t in enumerate(targets)])
+        else:
+            self.groups = np.arange(len(targets[0])) * folds // max(1, len(targets[0]))
+        self.blocks = {name : np.concatenate(parts) for name, parts in blocks.items()}
+        self.target = np.concatenate(targets)
+        self.cache = OrderedDict()      # [조합] = 행렬
+
+        # 센서 하나의 열 구분. 조합의 열 순서를 features.feature_names / 실시간 frame과 같게 맞추기 위함
+        if window_ms:
+            self.parts = [slice(i * AXIS_NUM, (i + 1) * AXIS_NUM) for i in range(len(STATS))]
+            self.parts.append(slice(len(STATS) * AXIS_NUM, None))
+        else:
+            self.parts = [slice(None)]
+
+    # 조합의 행렬 (행, 열). 센서 이름순
+    def matrix(self, subset : tuple):
+        if subset in self.cache:
+            self.cache.move_to_end(subset)
+            return self.cache[subset]
+        x = np.hstack([self.blocks[name][:, part] for part in self.parts for name in sorted(subset)])
+        self.cache[subset] = x
+        if len(self.cache) > CACHE_SUBSETS:
+            self.cache.popitem(last=False)
+        return x
+
+
+# -------- 평가 ----------#
+
+def init_worker(*args):
+    global data
+    data = SubsetData(*args)
+
+
+# 조합 하나 교차검증. 결과 dict
+def evaluate(subset : tuple, max_train : int = MAX_TRAIN):
+    from sklearn.svm import SVC
+    from sklearn.preprocessing import StandardScaler
+
+    x = data.matrix(subset)
+    y = data.target
+    correct = 0
+    tested = 0
+    scores = []
+    support = []
+    predict_us = []
+    start = time.perf_counter()
+    for fold in np.unique(data.groups):
+        test = data.groups == fold
+        train = np.flatnonzero(~test)
+        train = train[::max(1, len(train) // max_train)]
+        if len(np.unique(y[train])) < 2:    # 한 label만 있는 fold는 학습할 수 없음
+            continue
+        scaler = StandardScaler().fit(x[train])
+        model = SVC(**SVM_PARAMS).fit(scaler.transform(x[train]), y[train])
+        preds = model.predict(scaler.transform(x[test]))
+        correct += int((preds == y[test]).sum())
+        tested += len(preds)
+        scores.append(float((preds == y[test]).mean()))
+        support.append(int(model.n_support_.sum()))
+
+        # 실시간과 같이 scaler + predict. micro-batch 하나 크기로 여러 번 재서 가장 빠른 값
+        rows = x[test][:TIMING_ROWS]
+        best = np.inf
+        for _ in range(3):
+            t = time.perf_counter()
+            model.predict(scaler.transform(rows))
+            best = min(best, time.perf_counter() - t)
+        predict_us.append(best / len(rows) * 1e6)
+
+    return {"sensors"         : "".join(sorted(subset)),
+            "n"               : len(subset),
+            "accuracy"        : correct / tested if tested else None,
+            "std"             : float(np.std(scores)) if scores else None,
+            "folds"           : len(scores),
+            "features"        : x.shape[1],
+            "support_vectors" : float(np.mean(support)) if support else None,
+            "predict_us"      : float(np.mean(predict_us)) if predict_us else None,
+            "seconds"         : time.perf_counter() - start}
+
+
+# 평가 결과 보관. 같은 설정이면 파일에 저장해 두고 다음 실행에서 다시 사용
+class ResultCache:
+    def __init__(self, path : str, key : str):
+        self.path = path
+        self.key = key
+        self.results = dict()   # [센서 문자열] = 결과
+        if path and os.path.exists(path):
+            with open(path) as file:
+                saved = json.load(file)
+            self.results = saved.get(key, dict())
+
+    def save(self):
+        if not self.path:
+            return
+        saved = dict()
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                saved = json.load(file)
+        saved[self.key] = self.results
+        with open(self.path, "w") as file:
+            json.dump(saved, file)
+
+
+# 조합 탐색. 평가한 모든 조합의 결과를 리턴
+# strategy : greedy(beam=1) / beam / exhaustive(크기 max_sensors까지 모든 조합)
+def search(pool, candidates : list, strategy : str, beam : int, max_sensors : int, cache : ResultCache,
+           extra : list = ()):
+    def run(subsets):
+        todo = [s for s in subsets if "".join(s) not in cache.results]
+        if todo:
+            for res in pool.map(evaluate, todo):
+                cache.results[res["sensors"]] = res
+                print("\t{:<10} 정확도 {} ({:.1f}s)".format(
+                    res["sensors"], "-" if res["accuracy"] is None else "{:.3f}".format(res["accuracy"]), res["seconds"]))
+            cache.save()
+        return [cache.results["".join(s)] for s in subsets]
+
+    def rank(res):  # 정확도 높은 순, 같으면 추론 비용이 작은 순
+        return (-(res["accuracy"] or 0), res["support_vectors"] or 0)
+
+    evaluated = dict()
+    frontier = [()]
+    for size in range(1, max_sensors + 1):
+        if strategy == "exhaustive":
+            subsets = list(combinations(candidates, size))
+        else:
+            subsets = sorted({tuple(sorted(s + (c,))) for s in frontier for c in candidates if c not in s})
+        if not subsets:
+            break
+        print("센서 {}개 : 조합 {}개".format(size, len(subsets)))
+        level = run(subsets)
+        evaluated.update((res["sensors"], res) for res in level)
+        width = 1 if strategy == "greedy" else beam
+        frontier = [tuple(res["sensors"]) for res in sorted(level, key=rank)[:width]]
+
+    extra = [tuple(sorted(s)) for s in extra if "".join(sorted(s)) not in evaluated]
+    if extra:
+        print("비교용 조합 : " + " ".join("".join(s) for s in extra))
+        evaluated.update((res["sensors"], res) for res in run(extra))
+    return list(evaluated.values())
+
+
+# 한 process에서 실행할 때 pool 대신 사용
+class LocalPool:
+    def map(self, func, items):
+        return map(func, items)
+
+
+# 센서 수별 최고 조합 (정확도, 추론 비용) 출력
+def print_curve(results : list, current : str = None):
+    print("센서 수 | 최고 조합  | 정확도 (fold 표준편차) | support vector | 추론(us/frame)")
+    for n in sorted(set(r["n"] for r in results)):
+        level = [r for r in results if r["n"] == n and r["accuracy"] is not None]
+        if not level:
+            continue
+        best = max(level, key=lambda r: (r["accuracy"], -(r["support_vectors"] or 0)))
+        print("{:>7} | {:<10} | {:.3f} (±{:.3f})        | {:>14.0f} | {:>14.1f}".format(
+            n, best["sensors"], best["accuracy"], best["std"], best["support_vectors"], best["predict_us"]))
+    if current:
+        for r in results:
+            if r["sensors"] == current and r["accuracy"] is not None:
+                print("지금 설정 {} : 정확도 {:.3f}, support vector {:.0f}, 추론 {:.1f}us/frame".format(
+                    current, r["accuracy"], r["support_vectors"], r["predict_us"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="센서 조합별 모델 교차검증 (필요한 센서 수 줄이기)")
+    parser.add_argument("position", choices=list(EXERCISES.keys()))
+    parser.add_argument("paths", nargs="+", help="label이 있는 세션 파일(.csv, .imuset) 또는 폴더")
+    parser.add_argument("--sensors", nargs="+", help="후보 센서 이름 (기본: 세션에 기록된 모든 센서)")
+    parser.add_argument("--search", choices=["greedy", "beam", "exhaustive"], default="greedy")
+    parser.add_argument("--beam", type=int, default=3, help="beam 탐색에서 크기마다 확장할 조합 수")
+    parser.add_argument("--max-sensors", type=int, default=None, help="최대 센서 수 (기본: 후보 전체)")
+    parser.add_argument("--window-ms", type=int, default=0, help="window 특징으로 학습 (0이면 frame 값)")
+    parser.add_argument("--decision-ms", type=int, default=0, help="window 특징의 추론 주기")
+    parser.add_argument("--folds", type=int, default=FOLDS, help="세션이 하나일 때 시간 구간 fold 수")
+    parser.add_argument("--workers", type=int, default=None, help="process 수 (기본: CPU 수)")
+    parser.add_argument("--out", default=None, help="평가한 모든 조합의 결과 CSV")
+    parser.add_argument("--cache", default=None, help="평가 결과를 저장/재사용할 JSON 파일")
+    args = parser.parse_args()
+
+    spec = EXERCISES[args.position]
+    paths = find_sessions(args.paths)
+    if not paths:
+        print("세션 파일이 없음")
+        sys.exit(1)
+    candidates = sorted(args.sensors or session_sensors(paths[0]))
+    max_sensors = min(args.max_sensors or len(candidates), len(candidates))
+    current = "".join(sorted(spec.sensors)) if set(spec.sensors) <= set(candidates) else None
+    initargs = (paths, args.position, candidates, args.window_ms, args.decision_ms, args.folds)
+    key = json.dumps({"position" : args.position, "paths" : [os.path.abspath(p) for p in paths],
+                      "candidates" : candidates, "window_ms" : args.window_ms, "decision_ms" : args.decision_ms,
+                      "folds" : args.folds, "svm" : SVM_PARAMS, "max_train" : MAX_TRAIN}, sort_keys=True)
+    cache = ResultCache(args.cache, key)
+    print("세션 {}개, 후보 센서 {}, 탐색 {}".format(len(paths), "".join(candidates), args.search))
+
+    start = time.perf_counter()
+    workers = args.workers or os.cpu_count()
+    if workers == 1:
+        init_worker(*initargs)
+        results = search(LocalPool(), candidates, args.search, args.beam, max_sensors, cache, [spec.sensors] if current else [])
+    else:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=initargs) as pool:
+            results = search(pool, candidates, args.search, args.beam, max_sensors, cache, [spec.sensors] if current else [])
+    print("조합 {}개 평가, {:.1f}s".format(len(results), time.perf_counter() - start))
+    print_curve(results, current)
+
+    if args.out:
+        columns = ["sensors", "n", "accuracy", "std", "folds", "features", "support_vectors", "predict_us", "seconds"]
+        with open(args.out, "w") as file:
+            file.write(",".join(columns) + "\n")
+            for r in sorted(results, key=lambda r: (r["n"], -(r["accuracy"] or 0))):
+                file.write(",".join("" if r[c] is None else str(r[c]) for c in columns) + "\n")
+        print("저장됨 :", args.out)
@@ -0,0 +1,35 @@
+# FrameAligner 테스트
+# 실행:
+# python -m pytest gateway/test_aligner.py
+
+import numpy as np
+from aligner import FrameAligner
+
+
+def values(v):
+    return np.full(6, v, dtype=np.float32)
+
+
+# 한 센서가 늦게 도착해도 frame은 timestamp 순서대로 나와야 함
+def test_late_sensor_keeps_time_order():
+    for emit_partial in (True, False):
+        aligner = FrameAligner(2, 50, emit_partial=emit_partial)
+        out = []
+        for col, devtime in [(0, 0), (0, 50), (1, 50), (1, 0), (0, 100), (1, 100)]:
+            out += aligner.push(col, devtime, values(devtime), now=0.0)
+        out += aligner.flush()
+        times = [t for t, _ in out]
+        assert times == sorted(times)
+        assert times == ([0, 50, 100] if emit_partial else [50, 100])
+        assert aligner.late == 1    # 0의 센서 1 값은 50이 나간 뒤에 도착
+
+
+# timeout으로 나가는 frame도 시간순 (더 오래된 진행 중인 frame을 먼저 내보냄)
+def test_expire_keeps_time_order():
+    aligner = FrameAligner(2, 50, emit_partial=True)
+    aligner.push(0, 50, values(1), now=0.0)     # 50이 먼저 도착
+    aligner.push(0, 0, values(2), now=0.8)      # 0은 나중에 도착
+    out = aligner.expire(now=1.2)               # 50만 timeout
+    assert [t for t, _ in out] == [0, 50]
+    assert aligner.push(1, 0, values(3), now=1.3) == []
+    assert aligner.late == 1
@@ -0,0 +1,36 @@
+# LSTM 추론용 sequence(window) 버퍼
+# 크기가 고정된 원형 버퍼에 frame을 두 번씩 기록해서(i, i+size 위치),
+# 항상 최근 size개의 frame을 복사 없이 연속된 view로 꺼낼 수 있다.
+
+import numpy as np
+
+
+class SlidingWindow:
+    # size : 한 sequence의 frame 수(timestep_num), width : frame 하나의 값 개수
+    # stride : 몇 frame마다 추론할지. size와 같으면 기존처럼 겹치지 않는 sequence마다 추론
+    def __init__(self, size : int, width : int, stride : int = 1, dtype=np.float32):
+        self.size = size
+        self.width = width
+        self.stride = max(1, stride)
+        self.buf = np.zeros((2 * size, width), dtype=dtype)
+        self.count = 0      # 지금까지 들어온 frame 수
+
+    # frame 하나 추가
+    def push(self, frame):
+        i = self.count % self.size
+        self.buf[i] = frame
+        self.buf[i + self.size] = frame
+        self.count += 1
+
+    # 이번 frame에서 추론해야 하는지. (sequence가 가득 찬 뒤 stride마다)
+    def ready(self):
+        return self.count >= self.size and (self.count - self.size) % self.stride == 0
+
+    # 최근 size개 frame (size, width) view. 시간순
+    def view(self):
+        start = self.count % self.size
+        return self.buf[start:start + self.size]
+
+    # 처음부터 다시 모으기
+    def clear(self):
+        self.count = 0